@@ -1,18 +1,27 @@
 import os
-import json
+import asyncio
+import heapq
+import multiprocessing as mp
+import queue
 import threading
 import time
 import logging
 from datetime import datetime, date, timezone, timedelta
 from typing import Dict, Tuple, Optional, List, Any
+from collections import OrderedDict
 from pathlib import Path
 import sqlite3
 from dataclasses import dataclass, asdict
+from functools import lru_cache
+from itertools import islice
 
+import numpy as np
+import orjson
 from confluent_kafka import Consumer
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 
 """
 Realtime Darwin (JSON topic) -> train position estimator + HTTP API
@@ -22,7 +31,7 @@ Realtime Darwin (JSON topic) -> train position estimator + HTTP API
 - Exposes /positions & debug endpoints for quick inspection
 
 Run:
-  pip install confluent_kafka fastapi uvicorn pydantic
+  pip install confluent_kafka fastapi uvicorn pydantic orjson
   export KAFKA_USERNAME=...
   export KAFKA_PASSWORD=...
   export KAFKA_GROUP=SC-062cd84d-9e2f-41ae-a702-d3f9c1a72cc3
@@ -43,10 +52,14 @@ class Config:
     # 更新配置
     update_interval: int = int(os.getenv("UPDATE_INTERVAL", "300"))  # 5分钟默认
     max_age_hours: int = int(os.getenv("MAX_AGE_HOURS", "24"))  # 24小时后清理旧数据
+    max_memory_positions: int = int(os.getenv("MAX_MEMORY_POSITIONS", "20000"))  # 内存中最多保留的列车数
     
     # 数据库配置
     db_path: str = os.getenv("DB_PATH", "data/database/train_positions.db")
     
+    # 多worker部署：auto=通过文件锁选出一个worker运行消费者，on/off=强制开启/关闭
+    consumer_mode: str = os.getenv("CONSUMER_MODE", "auto")
+    
     # 日志配置
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
 
@@ -59,16 +72,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def epoch_us() -> int:
+    """当前Unix时间（微秒）"""
+    return time.time_ns() // 1000
+
 # ===== 数据库管理 ===== #
+def read_tiploc_coords(conn: sqlite3.Connection) -> Dict[str, Tuple[float, float]]:
+    """读取全部有坐标的TIPLOC: tiploc -> (lat, lon)"""
+    rows = conn.execute(
+        "SELECT tiploc, lat, lon FROM tiploc_coords WHERE lat IS NOT NULL AND lon IS NOT NULL"
+    ).fetchall()
+    return {tiploc: (lat, lon) for tiploc, lat, lon in rows}
+
 class DatabaseManager:
+    INSERT_TIPLOC_SQL = """
+        INSERT OR IGNORE INTO tiploc_coords 
+        (tiploc, lat, lon, name, source, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    # 冲突时原地更新而非删除重插，保留rowid，tiploc_rtree由UPDATE触发器同步
+    UPSERT_TIPLOC_SQL = """
+        INSERT INTO tiploc_coords 
+        (tiploc, lat, lon, name, source, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(tiploc) DO UPDATE SET
+            lat = excluded.lat, lon = excluded.lon, name = excluded.name,
+            source = excluded.source, updated_at = excluded.updated_at
+    """
+    # raw_data列仅为兼容旧库保留，不再写入：各字段已有独立列
+    INSERT_POSITION_SQL = """
+        INSERT OR REPLACE INTO train_positions 
+        (rid, uid, ts, from_tpl, to_tpl, lat, lon, ratio, state, platform, updated_at, updated_at_epoch)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    WRITE_QUEUE_SIZE = 10000
+    WRITE_BATCH_SIZE = 500
+    
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # 单一长连接，由锁保护，避免每次调用重新打开数据库
+        self._lock = threading.Lock()
+        self._conn = self._connect()
         self.init_db()
+        
+        # TIPLOC坐标基本静态，启动时整表载入内存: tiploc -> (lat, lon)
+        self._tpl_cache: Dict[str, Tuple[float, float]] = {}
+        self.load_tiploc_cache()
+        
+        # 位置写入队列，由后台线程批量落盘
+        self._queue: queue.Queue = queue.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开共享连接并设置PRAGMA"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
     
     def init_db(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
+        with self._lock, self._conn:
+            self._conn.execute("""
                 CREATE TABLE IF NOT EXISTS train_positions (
                     rid TEXT PRIMARY KEY,
                     uid TEXT,
@@ -81,11 +148,31 @@ class DatabaseManager:
                     state TEXT,
                     platform TEXT,
                     updated_at TEXT,
+                    updated_at_epoch INTEGER,
                     raw_data TEXT
                 )
             """)
             
-            conn.execute("""
+            # 旧库迁移：补充整数时间戳列（Unix微秒），按数值比较无需解析字符串
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(train_positions)")}
+            if "updated_at_epoch" not in columns:
+                self._conn.execute("ALTER TABLE train_positions ADD COLUMN updated_at_epoch INTEGER")
+                self._conn.execute("""
+                    UPDATE train_positions
+                    SET updated_at_epoch = CAST((julianday(updated_at, 'utc') - 2440587.5) * 86400000000 AS INTEGER)
+                    WHERE updated_at IS NOT NULL
+                """)
+            
+            # 按更新时间查询和清理走索引范围扫描；索引同时覆盖实时推送服务读取的列，
+            # 那边的查询只读索引、不回表
+            self._conn.execute("DROP INDEX IF EXISTS idx_pos_updated")
+            self._conn.execute("DROP INDEX IF EXISTS idx_pos_updated_epoch")
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pos_updated_epoch_cover ON train_positions
+                (updated_at_epoch DESC, rid, lat, lon, state, ts, from_tpl, to_tpl, platform)
+            """)
+            
+            self._conn.execute("""
                 CREATE TABLE IF NOT EXISTS tiploc_coords (
                     tiploc TEXT PRIMARY KEY,
                     lat REAL,
@@ -95,9 +182,9 @@ class DatabaseManager:
                     updated_at TEXT
                 )
             """)
-            
-            # 插入一些基础TIPLOC坐标
-            self.load_default_tiplocs()
+        
+        # 插入一些基础TIPLOC坐标
+        self.load_default_tiplocs()
     
     def load_default_tiplocs(self):
         """加载默认的TIPLOC坐标"""
@@ -112,80 +199,152 @@ class DatabaseManager:
             ("EDINBGH", 55.9533, -3.1883, "Edinburgh", "manual"),
         ]
         
-        with sqlite3.connect(self.db_path) as conn:
-            for tiploc, lat, lon, name, source in default_tiplocs:
-                conn.execute("""
-                    INSERT OR IGNORE INTO tiploc_coords 
-                    (tiploc, lat, lon, name, source, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (tiploc, lat, lon, name, source, datetime.now().isoformat()))
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                self.INSERT_TIPLOC_SQL,
+                [(tiploc, lat, lon, name, source, now)
+                 for tiploc, lat, lon, name, source in default_tiplocs]
+            )
+    
+    def load_tiploc_cache(self) -> int:
+        """从数据库重新载入TIPLOC坐标缓存，返回缓存数量"""
+        with self._lock:
+            self._tpl_cache = read_tiploc_coords(self._conn)
+        logger.info(f"已缓存 {len(self._tpl_cache)} 个TIPLOC坐标")
+        return len(self._tpl_cache)
     
     def get_tiploc_coords(self, tiploc: str) -> Optional[Tuple[float, float]]:
-        """获取TIPLOC坐标"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT lat, lon FROM tiploc_coords WHERE tiploc = ?", 
-                (tiploc,)
+        """获取TIPLOC坐标（内存缓存）"""
+        return self._tpl_cache.get(tiploc)
+    
+    def save_tiploc(self, tiploc: str, lat: float, lon: float, name: str = "", source: str = "manual"):
+        """添加或更新TIPLOC坐标，并同步缓存"""
+        self.save_tiplocs([(tiploc, lat, lon, name, source)])
+    
+    def save_tiplocs(self, tiplocs: List[Tuple[str, float, float, str, str]]) -> int:
+        """在一个事务中批量添加或更新TIPLOC坐标，并同步缓存"""
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                self.UPSERT_TIPLOC_SQL,
+                [(tiploc, lat, lon, name, source, now) for tiploc, lat, lon, name, source in tiplocs]
             )
-            result = cursor.fetchone()
-            return (result[0], result[1]) if result else None
+        for tiploc, lat, lon, _, _ in tiplocs:
+            self._tpl_cache[tiploc] = (lat, lon)
+        return len(tiplocs)
+    
+    def get_tiplocs(self) -> Tuple[List[str], List[tuple]]:
+        """获取全部TIPLOC坐标，返回(列名, 行元组)"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM tiploc_coords ORDER BY tiploc")
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
+        return columns, rows
     
     def save_position(self, position_data: dict):
-        """保存位置数据到数据库"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO train_positions 
-                (rid, uid, ts, from_tpl, to_tpl, lat, lon, ratio, state, platform, updated_at, raw_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                position_data.get("rid"),
-                position_data.get("uid"),
-                position_data.get("ts"),
-                position_data.get("from_tpl"),
-                position_data.get("to_tpl"),
-                position_data.get("lat"),
-                position_data.get("lon"),
-                position_data.get("ratio"),
-                position_data.get("state"),
-                position_data.get("platform"),
-                datetime.now().isoformat(),
-                json.dumps(position_data)
-            ))
+        """将位置数据放入写入队列（由后台线程批量保存）"""
+        # 队列满时阻塞，对消费者形成背压
+        self._queue.put((
+            position_data.get("rid"),
+            position_data.get("uid"),
+            position_data.get("ts"),
+            position_data.get("from_tpl"),
+            position_data.get("to_tpl"),
+            position_data.get("lat"),
+            position_data.get("lon"),
+            position_data.get("ratio"),
+            position_data.get("state"),
+            position_data.get("platform"),
+            position_data.get("updated_at") or datetime.now().isoformat(),
+            position_data.get("updated_at_epoch") or epoch_us(),
+        ))
+    
+    def _writer_loop(self):
+        """后台写入循环：批量取出队列中的位置并一次性提交"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            stop = None in batch
+            # 同一批次内每个rid只保留最新的一行
+            rows = {row[0]: row for row in batch if row is not None}
+            try:
+                if rows:
+                    with self._lock, self._conn:
+                        self._conn.executemany(self.INSERT_POSITION_SQL, rows.values())
+            except Exception as e:
+                logger.error(f"批量保存位置数据失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            
+            if stop:
+                return
+    
+    def flush(self):
+        """等待写入队列中的数据全部落盘"""
+        self._queue.join()
     
     def get_all_positions(self, max_age_hours: int = 24) -> List[dict]:
         """获取所有位置数据"""
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
+        cutoff = epoch_us() - max_age_hours * 3600 * 1_000_000
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT rid, uid, ts, from_tpl, to_tpl, lat, lon, ratio, state, platform, updated_at
+        with self._lock:
+            cursor = self._conn.execute("""
+                SELECT rid, uid, ts, from_tpl, to_tpl, lat, lon, ratio, state, platform, updated_at, updated_at_epoch
                 FROM train_positions 
-                WHERE updated_at > ?
-                ORDER BY updated_at DESC
-            """, (cutoff_time.isoformat(),))
+                WHERE updated_at_epoch > ?
+                ORDER BY updated_at_epoch DESC
+            """, (cutoff,))
             
             columns = [desc[0] for desc in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            rows = cursor.fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def get_position(self, rid: str) -> Optional[dict]:
+        """按rid（主键）获取单条位置数据"""
+        with self._lock:
+            cursor = self._conn.execute("""
+                SELECT rid, uid, ts, from_tpl, to_tpl, lat, lon, ratio, state, platform, updated_at, updated_at_epoch
+                FROM train_positions 
+                WHERE rid = ?
+            """, (rid,))
+            row = cursor.fetchone()
+            columns = [desc[0] for desc in cursor.description]
+        return dict(zip(columns, row)) if row else None
     
     def cleanup_old_data(self, max_age_hours: int = 24):
         """清理旧数据"""
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
+        cutoff = epoch_us() - max_age_hours * 3600 * 1_000_000
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "DELETE FROM train_positions WHERE updated_at < ?",
-                (cutoff_time.isoformat(),)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM train_positions WHERE updated_at_epoch < ?",
+                (cutoff,)
             )
             deleted_count = cursor.rowcount
-            logger.info(f"清理了 {deleted_count} 条旧的位置记录")
-
-# 初始化数据库管理器
-db_manager = DatabaseManager(config.db_path)
+        logger.info(f"清理了 {deleted_count} 条旧的位置记录")
+    
+    def close(self):
+        """写完队列中的数据后关闭数据库连接"""
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
 
 # ===== 状态管理 ===== #
 class StateManager:
     def __init__(self):
-        self.latest: Dict[str, dict] = {}  # rid -> latest position snapshot
+        # rid -> latest position snapshot，按更新顺序排列（最旧的在前），超过上限时按LRU淘汰
+        self.latest: "OrderedDict[str, dict]" = OrderedDict()
+        self._ttl_heap: List[Tuple[int, str]] = []  # (updated_at_epoch, rid)，供过期清理使用
+        self._max_positions: int = config.max_memory_positions
+        self.evicted_count: int = 0
         self.last_wrapper: Optional[dict] = None
         self.last_payload: Optional[dict] = None
         self.last_error: Optional[str] = None
@@ -193,22 +352,55 @@ class StateManager:
         self.error_count: int = 0
         self.last_update: Optional[datetime] = None
         self.consumer_active: bool = False
+        self.started_at: datetime = datetime.now()
+        # 是否由本进程写入位置数据；多worker部署时其余worker只从数据库读取
+        self.is_writer: bool = True
+        # latest和_ttl_heap由消费线程写入、API线程读取，结构性操作需持锁
+        self._lock = threading.Lock()
         
-    def update_position(self, rid: str, position_data: dict):
-        """更新位置数据"""
-        self.latest[rid] = position_data
-        self.last_update = datetime.now()
+    def update_position(self, rid: str, position_data: dict,
+                        now: Optional[datetime] = None, now_iso: Optional[str] = None):
+        """更新位置数据；批量更新时由调用方传入同一个now/now_iso，避免逐条取时间"""
+        if now is None:
+            now = datetime.now()
+        position_data["updated_at"] = now_iso or now.isoformat()
+        epoch = position_data["updated_at_epoch"] = int(now.timestamp() * 1_000_000)
+        with self._lock:
+            latest = self.latest
+            if rid in latest:
+                latest.move_to_end(rid)
+            latest[rid] = position_data
+            heapq.heappush(self._ttl_heap, (epoch, rid))
+            if len(latest) > self._max_positions:
+                latest.popitem(last=False)
+                self.evicted_count += 1
+            # 堆中同一rid的旧条目会累积，过多时按当前内容重建
+            if len(self._ttl_heap) > 4 * len(latest) + 1024:
+                self._ttl_heap = [(pos["updated_at_epoch"], r) for r, pos in latest.items()]
+                heapq.heapify(self._ttl_heap)
+        self.last_update = now
         
-        # 保存到数据库
+        # 保存到数据库（写入队列满时会阻塞，不能持锁）
         try:
             db_manager.save_position(position_data)
         except Exception as e:
             logger.error(f"保存位置数据到数据库失败: {e}")
     
-    def get_all_positions(self) -> List[dict]:
+    def get_all_positions(self, max_age_minutes: Optional[int] = None) -> List[dict]:
         """获取所有位置数据（内存+数据库）"""
+        # 运行时间已覆盖查询窗口时，窗口内的更新都在内存中，无需再查数据库
+        window_minutes = config.max_age_hours * 60
+        if max_age_minutes is not None:
+            window_minutes = min(window_minutes, max_age_minutes)
+        if not self.is_writer:
+            # 只读worker的内存中没有数据，SQLite(WAL)是各worker共享的状态
+            return db_manager.get_all_positions(config.max_age_hours)
+        memory_positions = self.snapshot_positions()
+        # 发生过LRU淘汰时内存不再完整，仍需合并数据库
+        if not self.evicted_count and datetime.now() - self.started_at >= timedelta(minutes=window_minutes):
+            return memory_positions
+        
         # 合并内存中的数据和数据库中的数据
-        memory_positions = list(self.latest.values())
         db_positions = db_manager.get_all_positions(config.max_age_hours)
         
         # 使用rid去重，优先使用内存中的数据
@@ -224,47 +416,84 @@ class StateManager:
         
         return list(positions_dict.values())
     
+    def snapshot_positions(self, limit: Optional[int] = None) -> List[dict]:
+        """内存中位置数据的快照（最旧的在前），limit为None时返回全部"""
+        with self._lock:
+            return list(islice(self.latest.values(), limit))
+    
     def cleanup_old_positions(self):
         """清理旧的位置数据"""
-        cutoff_time = datetime.now() - timedelta(hours=config.max_age_hours)
+        cutoff_epoch = epoch_us() - config.max_age_hours * 3600 * 1_000_000
         
-        # 清理内存中的旧数据
-        old_rids = []
-        for rid, pos in self.latest.items():
-            try:
-                pos_time = datetime.fromisoformat(pos.get('ts', ''))
-                if pos_time < cutoff_time:
-                    old_rids.append(rid)
-            except:
-                # 如果时间解析失败，也清理掉
-                old_rids.append(rid)
-        
-        for rid in old_rids:
-            del self.latest[rid]
+        # 清理内存中的旧数据：只弹出堆顶已过期的条目，无需遍历全部列车
+        removed = 0
+        with self._lock:
+            heap = self._ttl_heap
+            while heap and heap[0][0] < cutoff_epoch:
+                epoch, rid = heapq.heappop(heap)
+                pos = self.latest.get(rid)
+                # 该rid之后又有更新时，堆中这条只是旧条目
+                if pos is not None and pos.get("updated_at_epoch") == epoch:
+                    del self.latest[rid]
+                    removed += 1
         
-        if old_rids:
-            logger.info(f"从内存中清理了 {len(old_rids)} 条旧的位置记录")
+        if removed:
+            logger.info(f"从内存中清理了 {removed} 条旧的位置记录")
         
         # 清理数据库中的旧数据
         db_manager.cleanup_old_data(config.max_age_hours)
 
-state_manager = StateManager()
+# 数据库与状态管理器在API进程的startup事件中创建（init_managers）；
+# spawn出的消费子进程导入本模块时不建库、不启动写入线程，只载入TIPLOC坐标
+db_manager: Optional[DatabaseManager] = None
+state_manager: Optional[StateManager] = None
+# 消费子进程中的TIPLOC坐标（只读快照），API进程使用db_manager的缓存
+_worker_tpl_coords: Dict[str, Tuple[float, float]] = {}
+
+
+def load_worker_tiplocs() -> int:
+    """消费子进程中从数据库重新读取TIPLOC坐标快照，返回坐标数量"""
+    global _worker_tpl_coords
+    conn = sqlite3.connect(config.db_path)
+    try:
+        _worker_tpl_coords = read_tiploc_coords(conn)
+    finally:
+        conn.close()
+    return len(_worker_tpl_coords)
+
+
+def init_managers():
+    """创建数据库管理器和状态管理器（重复调用时保持已有实例）"""
+    global db_manager, state_manager
+    if db_manager is None:
+        db_manager = DatabaseManager(config.db_path)
+    if state_manager is None:
+        state_manager = StateManager()
 
 # ===== Helpers ===== #
 
 def coord_of(tpl: str) -> Optional[Tuple[float, float]]:
     """获取TIPLOC坐标"""
+    if db_manager is None:
+        return _worker_tpl_coords.get(tpl)
     return db_manager.get_tiploc_coords(tpl)
 
 
+@lru_cache(maxsize=8192)
+def _parse_time_cached(s: str, ssd: str, tzinfo: Optional[timezone]) -> datetime:
+    """Cached worker for parse_time_hms_local; slices the fields instead of strptime."""
+    hour, minute = int(s[0:2]), int(s[3:5])
+    second = int(s[6:8]) if len(s) > 5 else 0
+    base = datetime.fromisoformat(ssd).date()
+    return datetime(base.year, base.month, base.day, hour, minute, second, tzinfo=tzinfo)
+
+
 def parse_time_hms_local(s: str, ssd: str, tzinfo: Optional[timezone]) -> datetime:
     """Convert "HH:MM" or "HH:MM:SS" + service date (ssd) -> timezone-aware datetime."""
     if not s:
         raise ValueError("empty time string")
-    fmt = "%H:%M" if len(s) == 5 else "%H:%M:%S"
-    t = datetime.strptime(s, fmt).time()
-    base = datetime.fromisoformat(ssd).date() if ssd else date.today()
-    return datetime.combine(base, t, tzinfo=tzinfo)
+    # Resolve the default date here so cached entries never go stale at midnight
+    return _parse_time_cached(s, ssd or date.today().isoformat(), tzinfo)
 
 
 def pick_time(loc: dict, key: str, ssd: str, tzinfo: Optional[timezone]) -> Optional[datetime]:
@@ -285,25 +514,39 @@ def pick_time(loc: dict, key: str, ssd: str, tzinfo: Optional[timezone]) -> Opti
 
 def find_prev_next(locations: List[dict], ssd: str, now: datetime) -> Optional[Tuple[dict, dict, datetime, datetime]]:
     """Find last departed (prev) and next arriving/passing (next), with their times (tz‑aware)."""
+    tz = now.tzinfo
     prev = None
-    for i, loc in enumerate(locations):
-        dep = pick_time(loc, "dep", ssd, now.tzinfo)
-        arr = pick_time(loc, "arr", ssd, now.tzinfo)
-        pas = loc.get("pass") if isinstance(loc.get("pass"), dict) else None
-        pas_t = None
-        if pas:
+    for loc in locations:
+        pas = loc.get("pass")
+        if not isinstance(pas, dict):
+            pas = None
+        arr = pick_time(loc, "arr", ssd, tz)
+        left_time = pick_time(loc, "dep", ssd, tz)
+        if left_time is None and pas:
             x = pas.get("at") or pas.get("et")
             if x:
-                pas_t = parse_time_hms_local(x, ssd, now.tzinfo)
-        left_time = dep or pas_t or arr
+                left_time = parse_time_hms_local(x, ssd, tz)
+        if left_time is None:
+            left_time = arr
         if left_time and left_time <= now:
-            prev = (i, loc, left_time)
-        if prev and i > prev[0]:
-            next_time = pick_time(loc, "arr", ssd, now.tzinfo)
+            prev = (loc, left_time)
+            continue
+        # Stations are in route order, so anything after prev is a candidate next
+        if prev is not None:
+            next_time = arr
             if not next_time and pas and pas.get("et"):
-                next_time = parse_time_hms_local(pas["et"], ssd, now.tzinfo)
+                next_time = parse_time_hms_local(pas["et"], ssd, tz)
             if next_time and next_time >= now:
-                return prev[1], loc, prev[2], next_time
+                return prev[0], loc, prev[1], next_time
+    return None
+
+
+def _extract_platform(field: Any) -> Optional[str]:
+    """Darwin `plat` is either a bare string or an object carrying the number under "" (or "plat")."""
+    if isinstance(field, str):
+        return field
+    if isinstance(field, dict):
+        return field.get("") or field.get("plat")
     return None
 
 
@@ -332,10 +575,22 @@ def estimate_position(prev_loc: dict, next_loc: dict, t0: datetime, t1: datetime
 
 # ===== Kafka消费者管理 ===== #
 class KafkaConsumerManager:
+    BATCH_SIZE = 500  # 每次consume拉取的最大消息数
+    OUT_QUEUE_SIZE = 64  # 子进程回传队列的最大批次数，满时反压Kafka消费
+    # 子进程定期重读TIPLOC坐标（秒），覆盖其他worker或外部脚本写入的坐标
+    TIPLOC_REFRESH_INTERVAL = 60
+    
     def __init__(self):
         self.consumer = None
         self.running = False
         self.thread = None
+        self.process = None
+        self._out_queue = None
+        self._stop_event = None
+        self._tiploc_event = None  # API进程修改TIPLOC坐标后置位，子进程据此重读
+        self._drain_task = None
+        self._outbox: Optional[List[dict]] = None  # 仅在消费子进程中使用
+        self._last_cleanup = datetime.now()
         
     def create_consumer(self):
         """创建Kafka消费者"""
@@ -357,149 +612,261 @@ class KafkaConsumerManager:
             "socket.keepalive.enable": True,
             "session.timeout.ms": 30000,
             "heartbeat.interval.ms": 10000,
+            # 吞吐配置：批量拉取，减少请求往返
+            "fetch.min.bytes": 65536,
+            "fetch.wait.max.ms": 200,
+            "queued.min.messages": 100000,
+            "queued.max.messages.kbytes": 65536,
+            # 加大socket缓冲区，让TCP窗口可以增长，避免内核对broker形成反压；
+            # broker下发的lz4/zstd压缩批次由librdkafka在C层解压
+            "socket.receive.buffer.bytes": 1048576,
+            "socket.send.buffer.bytes": 1048576,
+            "fetch.error.backoff.ms": 500,
+            # 每批处理完成后手动异步提交offset
+            "enable.auto.commit": False,
         })
     
     def start(self):
-        """启动消费者"""
+        """启动消费者（需在事件循环中调用）"""
         if self.running:
             return
             
-        self.consumer = self.create_consumer()
-        if self.consumer:
-            self.consumer.subscribe([config.topic])
+        if config.username and config.password:
+            # Kafka消费与消息解析放到独立进程，不与API请求争抢GIL
+            ctx = mp.get_context("spawn")
+            self._out_queue = ctx.Queue(maxsize=self.OUT_QUEUE_SIZE)
+            self._stop_event = ctx.Event()
+            self._tiploc_event = ctx.Event()
+            self.process = ctx.Process(
+                target=consumer_worker,
+                args=(self._out_queue, self._stop_event, self._tiploc_event),
+                name="darwin-consumer",
+                daemon=True,
+            )
+            self.process.start()
             self.running = True
-            self.thread = threading.Thread(target=self.consume_loop, daemon=True)
-            self.thread.start()
-            logger.info("Kafka消费者已启动")
+            state_manager.consumer_active = True
+            self._drain_task = asyncio.create_task(self.drain())
+            logger.info(f"Kafka消费者进程已启动 (pid={self.process.pid})")
         else:
+            logger.warning("Kafka用户名或密码未设置，将使用模拟数据")
             # 启动模拟数据生成器
             self.running = True
             self.thread = threading.Thread(target=self.mock_data_loop, daemon=True)
             self.thread.start()
             logger.info("模拟数据生成器已启动")
     
-    def stop(self):
+    async def stop(self):
         """停止消费者"""
         self.running = False
-        if self.consumer:
-            self.consumer.close()
+        if self.process:
+            self._stop_event.set()
+            await asyncio.to_thread(self.process.join, 10)
+            if self.process.is_alive():
+                logger.warning("Kafka消费者进程未按时退出，强制终止")
+                self.process.terminate()
+        if self._drain_task:
+            await self._drain_task
+        state_manager.consumer_active = False
         logger.info("Kafka消费者已停止")
     
-    def consume_loop(self):
-        """消费循环"""
-        state_manager.consumer_active = True
-        last_cleanup = datetime.now()
-        
+    def notify_tiploc_change(self) -> bool:
+        """通知消费子进程重读TIPLOC坐标，返回是否有子进程需要通知"""
+        if self._tiploc_event is None:
+            return False
+        self._tiploc_event.set()
+        return True
+    
+    async def drain(self):
+        """API进程侧：接收子进程回传的位置批次并更新状态"""
+        loop = asyncio.get_running_loop()
         while self.running:
             try:
-                msg = self.consumer.poll(1.0)
-                if msg is None:
+                await loop.run_in_executor(None, self._apply_next_batch)
+            except Exception as e:
+                logger.error(f"处理消费者回传数据时出错: {e}")
+                await asyncio.sleep(1)
+    
+    def _apply_next_batch(self):
+        """阻塞等待一个批次（最多1秒），写入内存和数据库"""
+        try:
+            raw = self._out_queue.get(timeout=1.0)
+        except queue.Empty:
+            state_manager.consumer_active = self.process.is_alive()
+            return
+        
+        batch = orjson.loads(raw)
+        now = datetime.now()
+        now_iso = now.isoformat()
+        for position_data in batch["positions"]:
+            state_manager.update_position(position_data["rid"], position_data, now, now_iso)
+        
+        # 计数与调试信息由子进程维护，这里直接同步
+        state_manager.message_count = batch["message_count"]
+        state_manager.error_count = batch["error_count"]
+        state_manager.last_error = batch["last_error"]
+        if batch["last_wrapper"] is not None:
+            state_manager.last_wrapper = batch["last_wrapper"]
+        if batch["last_payload"] is not None:
+            state_manager.last_payload = batch["last_payload"]
+        
+        # 定期清理旧数据
+        if datetime.now() - self._last_cleanup > timedelta(hours=1):
+            state_manager.cleanup_old_positions()
+            self._last_cleanup = datetime.now()
+    
+    def consume_loop(self, out_queue, stop_event, tiploc_event=None):
+        """消费循环（在子进程中运行），每批处理完后把位置更新回传给API进程"""
+        self._outbox = []
+        next_tiploc_refresh = time.monotonic() + self.TIPLOC_REFRESH_INTERVAL
+        
+        while not stop_event.is_set():
+            try:
+                # API进程通知或到达刷新时间时重读TIPLOC坐标快照
+                if (tiploc_event is not None and tiploc_event.is_set()) or time.monotonic() >= next_tiploc_refresh:
+                    if tiploc_event is not None:
+                        tiploc_event.clear()
+                    next_tiploc_refresh = time.monotonic() + self.TIPLOC_REFRESH_INTERVAL
+                    load_worker_tiplocs()
+                
+                msgs = self.consumer.consume(num_messages=self.BATCH_SIZE, timeout=1.0)
+                if not msgs:
                     continue
+                
+                # 消息自身没有ts时，同一批次共用一个接收时间
+                batch_now = datetime.now(timezone.utc)
+                for msg in msgs:
+                    if msg.error():
+                        state_manager.last_error = str(msg.error())
+                        state_manager.error_count += 1
+                        logger.error(f"Kafka错误: {msg.error()}")
+                        continue
                     
-                if msg.error():
-                    state_manager.last_error = str(msg.error())
-                    state_manager.error_count += 1
-                    logger.error(f"Kafka错误: {msg.error()}")
-                    continue
+                    self.process_message(msg, batch_now)
                 
-                self.process_message(msg)
+                out_queue.put(orjson.dumps({
+                    "positions": self._outbox,
+                    "message_count": state_manager.message_count,
+                    "error_count": state_manager.error_count,
+                    "last_error": state_manager.last_error,
+                    "last_wrapper": state_manager.last_wrapper,
+                    "last_payload": state_manager.last_payload,
+                }))
+                self._outbox = []
                 
-                # 定期清理旧数据
-                if datetime.now() - last_cleanup > timedelta(hours=1):
-                    state_manager.cleanup_old_positions()
-                    last_cleanup = datetime.now()
+                self.consumer.commit(asynchronous=True)
                     
             except Exception as e:
                 state_manager.last_error = str(e)
                 state_manager.error_count += 1
                 logger.error(f"消费消息时出错: {e}")
                 time.sleep(5)  # 出错时等待5秒再重试
-        
-        state_manager.consumer_active = False
+    
+    def _publish(self, rid: str, position_data: dict):
+        """子进程中暂存到待回传批次，否则直接更新状态"""
+        if self._outbox is not None:
+            self._outbox.append(position_data)
+        else:
+            state_manager.update_position(rid, position_data)
     
     def mock_data_loop(self):
         """模拟数据生成循环"""
         state_manager.consumer_active = True
         
-        # 扩展的模拟火车数据，覆盖更多路线
+        # 扩展的模拟火车数据，覆盖更多路线: (rid, uid, from_tpl, to_tpl, speed)
         mock_trains = [
-            {"rid": "MOCK001", "uid": "L12345", "route": [("LONDON", "BRMNGM")], "speed": 0.001},
-            {"rid": "MOCK002", "uid": "L67890", "route": [("MNCHSTR", "LONDON")], "speed": 0.0008},
-            {"rid": "MOCK003", "uid": "L11111", "route": [("EDINBGH", "LONDON")], "speed": 0.0012},
-            {"rid": "MOCK004", "uid": "L22222", "route": [("LONDON", "EDINBGH")], "speed": 0.0009},
-            {"rid": "MOCK005", "uid": "L33333", "route": [("BRMNGM", "MNCHSTR")], "speed": 0.0007},
-            {"rid": "MOCK006", "uid": "L44444", "route": [("LONDON", "MNCHSTR")], "speed": 0.0011},
-            {"rid": "MOCK007", "uid": "L55555", "route": [("EDINBGH", "BRMNGM")], "speed": 0.0006},
-            {"rid": "MOCK008", "uid": "L66666", "route": [("MNCHSTR", "EDINBGH")], "speed": 0.0010},
-            {"rid": "MOCK009", "uid": "L77777", "route": [("BRMNGM", "LONDON")], "speed": 0.0013},
-            {"rid": "MOCK010", "uid": "L88888", "route": [("LONDON", "CRLN")], "speed": 0.0015},
-            {"rid": "MOCK011", "uid": "L99999", "route": [("CRLN", "WOLWCHA")], "speed": 0.0008},
-            {"rid": "MOCK012", "uid": "L00000", "route": [("WOLWCHA", "LONDON")], "speed": 0.0012},
+            ("MOCK001", "L12345", "LONDON", "BRMNGM", 0.001),
+            ("MOCK002", "L67890", "MNCHSTR", "LONDON", 0.0008),
+            ("MOCK003", "L11111", "EDINBGH", "LONDON", 0.0012),
+            ("MOCK004", "L22222", "LONDON", "EDINBGH", 0.0009),
+            ("MOCK005", "L33333", "BRMNGM", "MNCHSTR", 0.0007),
+            ("MOCK006", "L44444", "LONDON", "MNCHSTR", 0.0011),
+            ("MOCK007", "L55555", "EDINBGH", "BRMNGM", 0.0006),
+            ("MOCK008", "L66666", "MNCHSTR", "EDINBGH", 0.0010),
+            ("MOCK009", "L77777", "BRMNGM", "LONDON", 0.0013),
+            ("MOCK010", "L88888", "LONDON", "CRLN", 0.0015),
+            ("MOCK011", "L99999", "CRLN", "WOLWCHA", 0.0008),
+            ("MOCK012", "L00000", "WOLWCHA", "LONDON", 0.0012),
         ]
         
-        # 为每个火车初始化进度
-        for train in mock_trains:
-            train["progress"] = 0.0  # 初始进度
-            train["direction"] = 1   # 1为正向，-1为反向
+        # 按列存放火车状态（SoA），每个tick对所有火车做向量运算；
+        # 起止站坐标只在加入时查一次，tick内不再调用coord_of
+        rids: List[str] = []
+        uids: List[str] = []
+        from_tpls: List[str] = []
+        to_tpls: List[str] = []
+        speed = from_lat = from_lon = to_lat = to_lon = np.empty(0)
+        progress = np.empty(0)     # 初始进度为0
+        direction = np.empty(0)    # 1为正向，-1为反向
+        
+        rng = np.random.default_rng()
+        platforms = [None, "1", "2", "3", "4", "5"]
+        # 起止站还没有坐标的火车，等坐标通过 /tiplocs 补充后再加入
+        pending = mock_trains
         
         while self.running:
             try:
-                import random
+                if pending:
+                    ready, still_pending = [], []
+                    for train in pending:
+                        from_coords, to_coords = coord_of(train[2]), coord_of(train[3])
+                        if from_coords and to_coords:
+                            ready.append((*train, from_coords, to_coords))
+                        else:
+                            still_pending.append(train)
+                    pending = still_pending
+                    if ready:
+                        rids += [t[0] for t in ready]
+                        uids += [t[1] for t in ready]
+                        from_tpls += [t[2] for t in ready]
+                        to_tpls += [t[3] for t in ready]
+                        speed = np.concatenate([speed, [t[4] for t in ready]])
+                        from_lat = np.concatenate([from_lat, [t[5][0] for t in ready]])
+                        from_lon = np.concatenate([from_lon, [t[5][1] for t in ready]])
+                        to_lat = np.concatenate([to_lat, [t[6][0] for t in ready]])
+                        to_lon = np.concatenate([to_lon, [t[6][1] for t in ready]])
+                        progress = np.concatenate([progress, np.zeros(len(ready))])
+                        direction = np.concatenate([direction, np.ones(len(ready))])
                 
-                for train in mock_trains:
-                    # 生成模拟位置数据
-                    from_tpl, to_tpl = train["route"][0]
-                    from_coords = coord_of(from_tpl)
-                    to_coords = coord_of(to_tpl)
+                # 每个tick取一次时间，所有火车共用
+                now = datetime.now()
+                now_iso = now.isoformat()
+                forward = (direction == 1).tolist()
+                
+                # 更新进度（模拟真实移动），到达终点时反向
+                progress += speed * direction
+                direction[progress >= 1.0] = -1
+                direction[progress <= 0.0] = 1
+                np.clip(progress, 0.0, 1.0, out=progress)
+                
+                # 计算当前位置
+                lat = from_lat + (to_lat - from_lat) * progress
+                lon = from_lon + (to_lon - from_lon) * progress
+                
+                # 确定状态：两端视为在车站停靠，另随机10%概率停车
+                dwell = (progress <= 0.05) | (progress >= 0.95)
+                state = np.where(rng.random(len(rids)) < 0.1, "stopped",
+                                 np.where(dwell, "dwell", "enroute"))
+                platform_idx = rng.integers(0, len(platforms), len(rids))
+                
+                for i, (lat_i, lon_i, ratio, state_i, plat_i) in enumerate(zip(
+                        lat.tolist(), lon.tolist(), progress.tolist(),
+                        state.tolist(), platform_idx.tolist())):
+                    position_data = {
+                        "rid": rids[i],
+                        "uid": uids[i],
+                        "ts": now_iso,
+                        "from_tpl": from_tpls[i] if forward[i] else to_tpls[i],
+                        "to_tpl": to_tpls[i] if forward[i] else from_tpls[i],
+                        "lat": lat_i,
+                        "lon": lon_i,
+                        "ratio": ratio,
+                        "state": state_i,
+                        "platform": platforms[plat_i] if state_i == "dwell" else None,
+                    }
                     
-                    if from_coords and to_coords:
-                        # 更新火车进度（模拟真实移动）
-                        speed = train.get("speed", 0.001)
-                        direction = train.get("direction", 1)
-                        
-                        # 更新进度
-                        train["progress"] += speed * direction
-                        
-                        # 到达终点时反向
-                        if train["progress"] >= 1.0:
-                            train["progress"] = 1.0
-                            train["direction"] = -1
-                        elif train["progress"] <= 0.0:
-                            train["progress"] = 0.0
-                            train["direction"] = 1
-                        
-                        # 计算当前位置
-                        ratio = train["progress"]
-                        lat = from_coords[0] + (to_coords[0] - from_coords[0]) * ratio
-                        lon = from_coords[1] + (to_coords[1] - from_coords[1]) * ratio
-                        
-                        # 确定状态
-                        if ratio <= 0.05 or ratio >= 0.95:
-                            state = "dwell"  # 在车站停靠
-                        elif train["direction"] == 1:
-                            state = "enroute"
-                        else:
-                            state = "enroute"
-                        
-                        # 随机添加一些停靠状态
-                        if random.random() < 0.1:  # 10%概率停靠
-                            state = "stopped"
-                        
-                        position_data = {
-                            "rid": train["rid"],
-                            "uid": train["uid"],
-                            "ts": datetime.now().isoformat(),
-                            "from_tpl": from_tpl if direction == 1 else to_tpl,
-                            "to_tpl": to_tpl if direction == 1 else from_tpl,
-                            "lat": lat,
-                            "lon": lon,
-                            "ratio": ratio,
-                            "state": state,
-                            "platform": random.choice([None, "1", "2", "3", "4", "5"]) if state == "dwell" else None,
-                        }
-                        
-                        state_manager.update_position(train["rid"], position_data)
-                        state_manager.message_count += 1
+                    state_manager.update_position(rids[i], position_data, now, now_iso)
+                    state_manager.message_count += 1
                 
                 # 使用较短的更新间隔进行演示（10秒）
                 demo_interval = min(10, config.update_interval)
@@ -511,26 +878,35 @@ class KafkaConsumerManager:
         
         state_manager.consumer_active = False
     
-    def process_message(self, msg):
+    def process_message(self, msg, received_at: Optional[datetime] = None):
         """处理Kafka消息"""
         try:
-            wrapper = json.loads(msg.value().decode("utf-8"))
+            wrapper = orjson.loads(msg.value())
             state_manager.last_wrapper = wrapper
             state_manager.message_count += 1
             
-            raw = wrapper.get("bytes")
-            data = json.loads(raw) if raw else wrapper
+            # 未包装的载荷直接使用，避免二次解析
+            if isinstance(wrapper, dict) and "uR" in wrapper:
+                data = wrapper
+            else:
+                raw = wrapper.get("bytes")
+                data = orjson.loads(raw) if raw else wrapper
             state_manager.last_payload = data
 
             # 使用消息时间戳作为时间基准
             ts_iso = data.get("ts")
+            fallback_now = received_at or datetime.now(timezone.utc)
             try:
-                now = datetime.fromisoformat(ts_iso) if ts_iso else datetime.utcnow().replace(tzinfo=timezone.utc)
+                now = datetime.fromisoformat(ts_iso) if ts_iso else fallback_now
             except Exception:
-                now = datetime.utcnow().replace(tzinfo=timezone.utc)
+                now = fallback_now
 
-            uR = data.get("uR", {})
-            TS = uR.get("TS") or {}
+            try:
+                TS = data["uR"]["TS"]
+            except (KeyError, TypeError):
+                return
+            if not isinstance(TS, dict):
+                return
             rid = TS.get("rid")
             uid = TS.get("uid")
             ssd = TS.get("ssd") or now.date().isoformat()
@@ -541,6 +917,7 @@ class KafkaConsumerManager:
                 locs = [locs]
             if not rid or not locs:
                 return
+            ts_out = ts_iso or now.isoformat()
 
             res = find_prev_next(locs, ssd, now)
             if not res:
@@ -550,21 +927,19 @@ class KafkaConsumerManager:
                     tpl = only.get("tpl")
                     coords = coord_of(tpl)
                     if coords:
-                        plat = only.get("plat")
-                        platform = plat if isinstance(plat, str) else (plat.get("") if isinstance(plat, dict) else None)
                         position_data = {
                             "rid": rid,
                             "uid": uid,
-                            "ts": ts_iso or now.isoformat(),
+                            "ts": ts_out,
                             "from_tpl": tpl,
                             "to_tpl": tpl,
                             "lat": coords[0],
                             "lon": coords[1],
                             "ratio": 0.0,
                             "state": "dwell",
-                            "platform": platform,
+                            "platform": _extract_platform(only.get("plat")),
                         }
-                        state_manager.update_position(rid, position_data)
+                        self._publish(rid, position_data)
                     # 不再记录警告，静默跳过没有坐标的站点
                 return
 
@@ -581,36 +956,47 @@ class KafkaConsumerManager:
                     # 静默跳过没有坐标数据的火车，不记录警告
                     return
 
-            # 平台信息处理
-            plat = None
-            pfield = prev_loc.get("plat")
-            if isinstance(pfield, str):
-                plat = pfield
-            elif isinstance(pfield, dict):
-                plat = pfield.get("") or pfield.get("plat")
-
             position_data = {
                 "rid": rid,
                 "uid": uid,
-                "ts": ts_iso or now.isoformat(),
+                "ts": ts_out,
                 "from_tpl": prev_loc.get("tpl"),
                 "to_tpl": next_loc.get("tpl"),
                 "lat": pos["lat"],
                 "lon": pos["lon"],
                 "ratio": pos["ratio"],
                 "state": pos["state"],
-                "platform": plat,
+                "platform": _extract_platform(prev_loc.get("plat")),
             }
             
-            state_manager.update_position(rid, position_data)
+            self._publish(rid, position_data)
             
         except Exception as e:
             state_manager.last_error = str(e)
             state_manager.error_count += 1
             logger.error(f"处理消息时出错: {e}")
 
+def consumer_worker(out_queue, stop_event, tiploc_event=None):
+    """消费子进程入口：拉取并解析Kafka消息，位置更新经out_queue回传"""
+    global state_manager
+    # 子进程只需要计数/调试状态和只读的TIPLOC坐标，写库由API进程负责
+    state_manager = StateManager()
+    load_worker_tiplocs()
+    
+    manager = KafkaConsumerManager()
+    manager.consumer = manager.create_consumer()
+    if not manager.consumer:
+        return
+    manager.consumer.subscribe([config.topic])
+    try:
+        manager.consume_loop(out_queue, stop_event, tiploc_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.consumer.close()
+
 # ===== FastAPI for Google Maps polling ===== #
-app = FastAPI(title="Darwin Train Realtime Locator")
+app = FastAPI(title="Darwin Train Realtime Locator", default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -624,6 +1010,7 @@ app.add_middleware(
 async def startup_event():
     """应用启动时的初始化"""
     logger.info("🚂 Darwin实时火车位置服务启动")
+    init_managers()
     logger.info(f"配置: 更新间隔={config.update_interval}秒, 最大数据年龄={config.max_age_hours}小时")
     
     # 清理启动时的旧数据
@@ -632,21 +1019,55 @@ async def startup_event():
         logger.info("启动时数据清理完成")
     except Exception as e:
         logger.error(f"启动时数据清理失败: {e}")
+    
+    if acquire_consumer_role():
+        kafka_manager.start()
+    else:
+        state_manager.is_writer = False
+        logger.info("其他worker已在运行消费者，本worker只提供API读取")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时的清理"""
     logger.info("正在关闭Darwin实时火车位置服务...")
-    kafka_manager.stop()
+    await kafka_manager.stop()
+    if db_manager:
+        db_manager.close()
     logger.info("服务已关闭")
 
-# 创建并启动Kafka消费者管理器
+_consumer_lock_file = None
+
+
+def acquire_consumer_role() -> bool:
+    """多worker部署时只允许一个进程运行消费者：持有数据库旁的文件锁者胜出"""
+    global _consumer_lock_file
+    mode = config.consumer_mode.lower()
+    if mode in ("on", "off"):
+        return mode == "on"
+    
+    try:
+        import fcntl
+    except ImportError:
+        # Windows没有fcntl，也不支持多worker的fork部署，按单worker处理
+        return True
+    
+    lock_path = f"{config.db_path}.consumer.lock"
+    try:
+        _consumer_lock_file = open(lock_path, "w")
+        fcntl.flock(_consumer_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        if _consumer_lock_file:
+            _consumer_lock_file.close()
+            _consumer_lock_file = None
+        return False
+
+# 创建Kafka消费者管理器（在startup事件中启动；spawn子进程导入本模块时不会再次启动）
 kafka_manager = KafkaConsumerManager()
-kafka_manager.start()
 
 # ===== 根端点 ===== #
 @app.get("/")
-def root():
+async def root():
     """根端点，提供API信息"""
     return {
         "service": "Darwin实时火车位置服务",
@@ -670,6 +1091,9 @@ def root():
 
 
 class Position(BaseModel):
+    # 仅用于OpenAPI文档：数据来自本服务自己写入的内存/数据库，响应按字段直接序列化、不经校验
+    model_config = ConfigDict(extra="ignore")
+    
     rid: str
     uid: Optional[str] = None
     ts: str
@@ -682,75 +1106,47 @@ class Position(BaseModel):
     platform: Optional[str] = None
 
 
+# /positions/{rid}响应包含的字段，多余字段（updated_at等）不输出
+POSITION_FIELDS = tuple(Position.model_fields)
+
+
 @app.get("/positions")
-def get_positions(
-    limit: int = Query(default=1000, description="最大返回数量"),
+async def get_positions(
+    limit: int = Query(default=1000, ge=1, description="最大返回数量"),
     state: Optional[str] = Query(default=None, description="按状态过滤 (enroute, dwell, stopped)"),
     max_age_minutes: int = Query(default=1440, description="最大数据年龄（分钟）")
 ):
     """获取所有火车位置"""
     try:
-        positions = state_manager.get_all_positions()
+        positions = await asyncio.to_thread(state_manager.get_all_positions, max_age_minutes)
         
-        # 按时间过滤
-        cutoff_time = datetime.now() - timedelta(minutes=max_age_minutes)
-        filtered_positions = []
-        
-        for pos in positions:
-            try:
-                # 尝试解析时间戳，优先使用updated_at（更可靠）
-                pos_time_str = pos.get('updated_at') or pos.get('ts', '')
-                if not pos_time_str:
-                    continue
-                
-                # 处理不同的时间戳格式
-                if '+' in pos_time_str and 'T' in pos_time_str:
-                    # 处理带时区的ISO格式: 2025-09-05T13:33:01.3680409+01:00
-                    pos_time = datetime.fromisoformat(pos_time_str.replace('+01:00', '+00:00'))
-                else:
-                    # 处理标准ISO格式: 2025-09-06T00:40:25.841988
-                    pos_time = datetime.fromisoformat(pos_time_str)
-                
-                # 如果没有时区信息，假设为UTC
-                if pos_time.tzinfo is None:
-                    pos_time = pos_time.replace(tzinfo=timezone.utc)
-                
-                # 转换为当前时区进行比较
-                now_utc = datetime.now(timezone.utc)
-                cutoff_utc = now_utc - timedelta(minutes=max_age_minutes)
-                
-                if pos_time >= cutoff_utc:
-                    # 按状态过滤
-                    if state is None or pos.get('state') == state:
-                        filtered_positions.append(pos)
-            except Exception as e:
-                # 如果时间解析失败，记录错误但继续处理
-                logger.debug(f"时间解析失败 {pos.get('rid', 'unknown')}: {e}")
-                continue
+        # 按更新时间（Unix微秒）过滤，整数比较无需解析时间字符串
+        cutoff = epoch_us() - max_age_minutes * 60 * 1_000_000
+        filtered_positions = [
+            pos for pos in positions
+            if (pos.get('updated_at_epoch') or 0) >= cutoff
+            and (state is None or pos.get('state') == state)
+        ]
         
-        # 按时间排序并限制数量
-        filtered_positions.sort(key=lambda x: x.get('ts', ''), reverse=True)
-        return filtered_positions[:limit]
+        # 按时间取最新的limit条；直接返回响应对象，跳过FastAPI的jsonable_encoder
+        return ORJSONResponse(heapq.nlargest(limit, filtered_positions, key=lambda x: x.get('ts', '')))
         
     except Exception as e:
         logger.error(f"获取位置数据时出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/positions/{rid}", response_model=Position)
-def get_position(rid: str):
+@app.get("/positions/{rid}", response_model=None, responses={200: {"model": Position}})
+async def get_position(rid: str):
     """获取特定火车的位置"""
     try:
-        # 先从内存中查找
+        # 先从内存中查找，没有再查数据库
         position = state_manager.latest.get(rid)
+        if not position:
+            position = await asyncio.to_thread(db_manager.get_position, rid)
         if position:
-            return position
-        
-        # 如果内存中没有，从数据库查找
-        positions = db_manager.get_all_positions(config.max_age_hours)
-        for pos in positions:
-            if pos['rid'] == rid:
-                return pos
+            # 直接返回响应对象，跳过response_model的序列化和二次校验
+            return ORJSONResponse({field: position.get(field) for field in POSITION_FIELDS})
         
         raise HTTPException(status_code=404, detail=f"火车 {rid} 未找到")
         
@@ -796,10 +1192,11 @@ def update_interval(seconds: int):
     return {"message": f"更新间隔已设置为 {seconds} 秒", "update_interval": seconds}
 
 @app.get("/debug/stats")
-def debug_stats():
+async def debug_stats():
     """获取系统统计信息"""
     return {
         "trains_in_memory": len(state_manager.latest),
+        "trains_evicted": state_manager.evicted_count,
         "total_messages": state_manager.message_count,
         "error_count": state_manager.error_count,
         "consumer_active": state_manager.consumer_active,
@@ -813,12 +1210,13 @@ def debug_stats():
 @app.get("/debug/last-wrapper")
 def debug_last_wrapper():
     """获取最后的Kafka包装器数据"""
-    return state_manager.last_wrapper or {}
+    # 原始载荷可能很大，直接交给orjson，跳过jsonable_encoder的逐层遍历
+    return ORJSONResponse(state_manager.last_wrapper or {})
 
 @app.get("/debug/last-payload")
 def debug_last_payload():
     """获取最后的Darwin载荷数据"""
-    return state_manager.last_payload or {}
+    return ORJSONResponse(state_manager.last_payload or {})
 
 @app.get("/debug/last-error")
 def debug_last_error():
@@ -837,10 +1235,10 @@ def debug_raw_positions():
             "total_in_db": len(positions),
             "memory_count": len(state_manager.latest),
             "sample_positions": positions[:5] if positions else [],
-            "sample_memory": list(state_manager.latest.values())[:5] if state_manager.latest else []
+            "sample_memory": state_manager.snapshot_positions(5)
         }
         
-        return debug_data
+        return ORJSONResponse(debug_data)
         
     except Exception as e:
         logger.error(f"获取调试位置数据失败: {e}")
@@ -857,27 +1255,70 @@ def debug_cleanup():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/tiplocs")
-def get_tiplocs():
+def get_tiplocs(
+    columnar: bool = Query(default=False, description="按列返回 {columns, rows}，不为每行重复键名")
+):
     """获取所有TIPLOC坐标"""
     try:
-        with sqlite3.connect(config.db_path) as conn:
-            cursor = conn.execute("SELECT * FROM tiploc_coords ORDER BY tiploc")
-            columns = [desc[0] for desc in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        columns, rows = db_manager.get_tiplocs()
+        if columnar:
+            # 行元组直接交给orjson，不构造逐行dict
+            return ORJSONResponse({"columns": columns, "rows": rows})
+        return ORJSONResponse([dict(zip(columns, row)) for row in rows])
     except Exception as e:
         logger.error(f"获取TIPLOC数据时出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class TiplocIn(BaseModel):
+    tiploc: str
+    lat: float
+    lon: float
+    name: str = ""
+    source: str = "manual"
+
+
+@app.post("/tiplocs/bulk")
+def add_tiplocs_bulk(tiplocs: List[TiplocIn]):
+    """批量添加或更新TIPLOC坐标（单个事务）"""
+    try:
+        count = db_manager.save_tiplocs([
+            (t.tiploc.upper(), t.lat, t.lon, t.name, t.source) for t in tiplocs
+        ])
+        kafka_manager.notify_tiploc_change()
+        logger.info(f"已批量添加/更新 {count} 个TIPLOC")
+        return {"message": f"已添加/更新 {count} 个TIPLOC", "count": count}
+        
+    except Exception as e:
+        logger.error(f"批量添加TIPLOC时出错: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/tiplocs/reload")
+def reload_tiplocs():
+    """从数据库重新载入TIPLOC坐标缓存（外部脚本更新坐标表后调用）
+    
+    只重新载入处理本请求的进程及其消费子进程；多worker部署时其他worker的缓存
+    不受影响（只读worker不计算位置），各消费子进程也会定期自行重读
+    """
+    try:
+        count = db_manager.load_tiploc_cache()
+        consumer_notified = kafka_manager.notify_tiploc_change()
+        return {
+            "message": "TIPLOC缓存已在本进程重新载入",
+            "count": count,
+            "pid": os.getpid(),
+            "consumer_notified": consumer_notified,
+        }
+        
+    except Exception as e:
+        logger.error(f"重新载入TIPLOC缓存时出错: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/tiplocs/{tiploc}")
 def add_tiploc(tiploc: str, lat: float, lon: float, name: str = "", source: str = "manual"):
     """添加或更新TIPLOC坐标"""
     try:
-        with sqlite3.connect(config.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO tiploc_coords 
-                (tiploc, lat, lon, name, source, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (tiploc.upper(), lat, lon, name, source, datetime.now().isoformat()))
+        db_manager.save_tiploc(tiploc.upper(), lat, lon, name, source)
+        kafka_manager.notify_tiploc_change()
         
         logger.info(f"已添加/更新TIPLOC: {tiploc} -> ({lat}, {lon})")
         return {"message": f"TIPLOC {tiploc} 已添加/更新", "tiploc": tiploc, "lat": lat, "lon": lon}
@@ -5,24 +5,50 @@
 """
 
 import asyncio
-import json
 import logging
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Set, List, Optional
+from typing import Dict, Set, List, Optional, Iterable, Tuple
 import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 import sqlite3
-from dataclasses import dataclass, asdict
-import hashlib
-import gzip
-import base64
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import orjson
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+DB_PATH = 'data/database/train_positions.db'  # Darwin服务写入的数据库
+WINDOW_HOURS = 6  # 只推送最近6小时内更新过的火车
+
+# 两个查询都只读取idx_pos_updated_epoch_cover覆盖的列（索引由Darwin服务创建）。
+# 列顺序与TrainPosition字段一致、默认值在SQL中补齐，行可直接 TrainPosition(*row)
+POSITION_COLUMNS = """
+    rid, lat, lon,
+    COALESCE(state, 'unknown'),
+    COALESCE(ts, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')),
+    0.0, 0.0,
+    COALESCE(from_tpl, ''), COALESCE(to_tpl, ''), COALESCE(platform, '')
+"""
+CURRENT_POSITIONS_SQL = f"""
+    SELECT {POSITION_COLUMNS}
+    FROM train_positions 
+    WHERE updated_at_epoch > ? AND lat IS NOT NULL AND lon IS NOT NULL
+    ORDER BY updated_at_epoch DESC
+    LIMIT 2000
+"""
+POLL_CHANGES_SQL = f"""
+    SELECT {POSITION_COLUMNS}, updated_at_epoch
+    FROM train_positions 
+    WHERE updated_at_epoch > ? AND lat IS NOT NULL AND lon IS NOT NULL
+    ORDER BY updated_at_epoch
+"""
+
+@dataclass(slots=True)
 class TrainPosition:
-    """优化的火车位置数据结构"""
+    """优化的火车位置数据结构（__slots__，无实例dict；orjson原生序列化）"""
     rid: str
     lat: float
     lon: float
@@ -34,175 +60,343 @@ class TrainPosition:
     to_tpl: str = ""
     platform: str = ""
 
+# delta消息的固定外壳，只填入逐行片段和计数，不构造嵌套dict
+DELTA_TEMPLATE = (
+    b'{"type":"delta","changes":{"added":[%b],"updated":[%b],"removed":%b,"timestamp":%d},'
+    b'"stats":{"added":%d,"updated":%d,"removed":%d}}'
+)
+
+INITIAL_TEMPLATE = b'{"type":"initial","data":[%b],"count":%d,"timestamp":"%b"}'
+
+class PositionStore:
+    """按列（SoA）存放每列火车最近一次推送的位置指纹"""
+    
+    def __init__(self, capacity: int = 4096):
+        self.index: Dict[str, int] = {}  # rid -> 行号
+        self.free: List[int] = []        # 已移除火车空出的行号
+        self.size = 0
+        # 坐标量化到1e-4度（约10米），小于该精度的变化视为未移动
+        self.lat = np.zeros(capacity, np.int32)
+        self.lon = np.zeros(capacity, np.int32)
+        self.code = np.zeros(capacity, np.int32)  # (state, platform)组合编码
+        self._codes: Dict[tuple, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def encode(self, state: str, platform: str) -> int:
+        """把(state, platform)映射为小整数"""
+        key = (state, platform)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self._codes)
+        return code
+    
+    def slot(self, rid: str) -> int:
+        """为新火车分配行号，必要时扩容"""
+        if self.free:
+            i = self.free.pop()
+        else:
+            i = self.size
+            self.size += 1
+            if i >= len(self.lat):
+                grow = len(self.lat)
+                self.lat = np.concatenate([self.lat, np.zeros(grow, np.int32)])
+                self.lon = np.concatenate([self.lon, np.zeros(grow, np.int32)])
+                self.code = np.concatenate([self.code, np.zeros(grow, np.int32)])
+        self.index[rid] = i
+        return i
+    
+    def remove(self, rid: str) -> bool:
+        i = self.index.pop(rid, None)
+        if i is None:
+            return False
+        self.free.append(i)
+        return True
+
 class PositionDelta:
     """位置变化检测器"""
     
     def __init__(self):
-        self.last_positions: Dict[str, TrainPosition] = {}
-        self.position_hashes: Dict[str, str] = {}
+        self.store = PositionStore()
+        # rid -> 最近一次推送给客户端的JSON片段；初始快照直接由这些片段拼出
+        self.fragments: Dict[str, bytes] = {}
     
-    def get_changes(self, current_positions: List[TrainPosition]) -> Dict[str, any]:
-        """获取位置变化"""
+    def get_changes(self, changed_positions: List[TrainPosition],
+                    removed_rids: Iterable[str] = (),
+                    tick_ms: Optional[int] = None) -> Dict[str, any]:
+        """根据有更新的火车和已过期的rid生成变化；added/updated中是已序列化好的JSON片段（bytes）"""
         changes = {
             'added': [],      # 新增的火车
             'updated': [],    # 位置更新的火车
             'removed': [],    # 消失的火车
-            'timestamp': datetime.now().isoformat()
+            # Unix毫秒时间戳，由更新循环每个tick取一次（前端可直接 new Date(ms)）
+            'timestamp': tick_ms if tick_ms is not None else int(time.time() * 1000)
         }
         
-        current_rids = {pos.rid for pos in current_positions}
-        last_rids = set(self.last_positions.keys())
-        
-        # 检测新增和更新
-        for pos in current_positions:
-            pos_hash = self._hash_position(pos)
+        store = self.store
+        # 同一批次中同一rid只保留最后一条
+        batch = list({pos.rid: pos for pos in changed_positions}.values())
+        if batch:
+            n = len(batch)
+            lat = np.rint(np.fromiter((p.lat for p in batch), np.float64, n) * 1e4).astype(np.int32)
+            lon = np.rint(np.fromiter((p.lon for p in batch), np.float64, n) * 1e4).astype(np.int32)
+            code = np.fromiter((store.encode(p.state, p.platform) for p in batch), np.int32, n)
             
-            if pos.rid not in self.last_positions:
-                # 新增的火车
-                changes['added'].append(asdict(pos))
-            elif self.position_hashes.get(pos.rid) != pos_hash:
-                # 位置有变化的火车
-                changes['updated'].append(asdict(pos))
+            index = store.index
+            rows = np.fromiter((index.get(p.rid, -1) for p in batch), np.int64, n)
+            is_new = rows < 0
+            # 已有火车：整批向量比较指纹（重复推送的同一位置不会产生变化）
+            known = np.flatnonzero(~is_new)
+            old = rows[known]
+            moved = known[(store.lat[old] != lat[known]) |
+                          (store.lon[old] != lon[known]) |
+                          (store.code[old] != code[known])]
             
-            self.last_positions[pos.rid] = pos
-            self.position_hashes[pos.rid] = pos_hash
+            for i in np.flatnonzero(is_new).tolist():
+                rows[i] = store.slot(batch[i].rid)
+            store.lat[rows] = lat
+            store.lon[rows] = lon
+            store.code[rows] = code
+            
+            # 只对有变化的火车序列化，orjson直接处理dataclass，无需asdict
+            fragments = self.fragments
+            for key, idx in (('added', np.flatnonzero(is_new)), ('updated', moved)):
+                out = changes[key]
+                for i in idx.tolist():
+                    pos = batch[i]
+                    fragment = fragments[pos.rid] = orjson.dumps(pos)
+                    out.append(fragment)
         
-        # 检测消失的火车
-        removed_rids = last_rids - current_rids
-        for rid in removed_rids:
-            changes['removed'].append(rid)
-            self.last_positions.pop(rid, None)
-            self.position_hashes.pop(rid, None)
+        # 移除过期的火车
+        changes['removed'] = [rid for rid in removed_rids if store.remove(rid)]
+        for rid in changes['removed']:
+            self.fragments.pop(rid, None)
         
         return changes
     
-    def _hash_position(self, pos: TrainPosition) -> str:
-        """计算位置哈希值"""
-        # 只对关键字段计算哈希，忽略微小变化
-        key_data = f"{pos.rid}:{round(pos.lat, 4)}:{round(pos.lon, 4)}:{pos.state}:{pos.platform}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+    @staticmethod
+    def encode_delta(changes: Dict[str, any]) -> str:
+        """直接拼接已序列化的片段生成delta消息，不再整体重新序列化"""
+        added, updated, removed = changes['added'], changes['updated'], changes['removed']
+        payload = DELTA_TEMPLATE % (
+            b','.join(added), b','.join(updated), orjson.dumps(removed),
+            changes['timestamp'], len(added), len(updated), len(removed),
+        )
+        # 前端用JSON.parse处理文本帧
+        return payload.decode()
 
 class WebSocketManager:
     """WebSocket连接管理器"""
     
+    CLIENT_QUEUE_SIZE = 16  # 每个客户端最多积压的消息数
+    INITIAL_CACHE_TTL = 1.0  # 初始快照缓存时间（秒）
+    RESYNC = None  # 发送队列中的标记：该客户端需要重新发送完整快照
+    
     def __init__(self):
         self.connections: Set[websockets.WebSocketServerProtocol] = set()
         self.client_filters: Dict[websockets.WebSocketServerProtocol, dict] = {}
+        # 每个客户端一个有界发送队列和一个发送任务，慢客户端不会拖慢其他客户端
+        self.client_queues: Dict[websockets.WebSocketServerProtocol, asyncio.Queue] = {}
+        self.sender_tasks: Dict[websockets.WebSocketServerProtocol, asyncio.Task] = {}
+        # 已编码的初始快照 (生成时间, payload)，重连高峰时多个客户端共用
+        self._initial_cache: Optional[Tuple[float, str]] = None
+        self._initial_lock = asyncio.Lock()
+        self._delta_gen = 0  # 每次产生变化时加一，用于判断快照是否已过时
         self.delta_detector = PositionDelta()
+        # 有更新的火车位置；由change_watch_loop（或同进程的数据写入方）通过publish推入
+        self.dirty_queue: asyncio.Queue = asyncio.Queue()
+        self.last_seen: Dict[str, int] = {}  # rid -> updated_at_epoch
+        self._watermark: int = 0  # 已读取到的最大updated_at_epoch
+        # 长连接只在这个单线程执行器里使用，查询不阻塞事件循环，也无需加锁
+        self.conn: Optional[sqlite3.Connection] = None
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ws-db")
         
     async def register(self, websocket: websockets.WebSocketServerProtocol):
         """注册新连接"""
+        # 先建队列再发快照：发快照期间产生的delta会排在快照之后
+        queue = asyncio.Queue(maxsize=self.CLIENT_QUEUE_SIZE)
+        self.client_queues[websocket] = queue
         self.connections.add(websocket)
         self.client_filters[websocket] = {}
         logger.info(f"新客户端连接，当前连接数: {len(self.connections)}")
         
         # 发送初始数据
         await self.send_initial_data(websocket)
+        self.sender_tasks[websocket] = asyncio.create_task(self._sender(websocket, queue))
     
     async def unregister(self, websocket: websockets.WebSocketServerProtocol):
         """注销连接"""
+        if websocket not in self.connections:
+            return
         self.connections.discard(websocket)
         self.client_filters.pop(websocket, None)
+        self.client_queues.pop(websocket, None)
+        task = self.sender_tasks.pop(websocket, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
         logger.info(f"客户端断开连接，当前连接数: {len(self.connections)}")
     
-    async def send_initial_data(self, websocket: websockets.WebSocketServerProtocol):
-        """发送初始数据"""
+    def enqueue(self, websocket: websockets.WebSocketServerProtocol, data: Optional[str]):
+        """放入客户端发送队列；队列满时丢弃积压的delta，改为补发一次完整快照"""
+        queue = self.client_queues.get(websocket)
+        if queue is not None:
+            self._offer(queue, data)
+    
+    def _offer(self, queue: asyncio.Queue, data: Optional[str]):
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.RESYNC)
+    
+    async def _sender(self, websocket: websockets.WebSocketServerProtocol, queue: asyncio.Queue):
+        """逐条发送该客户端队列中的消息"""
         try:
-            # 获取当前所有火车位置
-            positions = await self.get_current_positions()
+            while True:
+                data = await queue.get()
+                if data is self.RESYNC:
+                    await self.send_initial_data(websocket)
+                else:
+                    await websocket.send(data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"发送数据失败: {e}")
+        finally:
+            await self.unregister(websocket)
+    
+    async def get_initial_payload(self) -> str:
+        """获取编码好的初始快照，TTL内直接复用"""
+        async with self._initial_lock:
+            cached = self._initial_cache
+            if cached and time.monotonic() - cached[0] < self.INITIAL_CACHE_TTL:
+                return cached[1]
             
-            initial_data = {
-                'type': 'initial',
-                'data': [asdict(pos) for pos in positions],
-                'count': len(positions),
-                'timestamp': datetime.now().isoformat()
-            }
+            gen = self._delta_gen
+            fragments = self.delta_detector.fragments
+            if fragments:
+                # 检测器已有全部在线火车的片段（与已连接客户端通过delta看到的一致），
+                # 直接拼接，无需查库和逐行构造/序列化
+                payload = INITIAL_TEMPLATE % (
+                    b','.join(fragments.values()), len(fragments),
+                    datetime.now().isoformat().encode(),
+                )
+            else:
+                # 刚启动、检测器尚未收到数据时从数据库读取
+                positions = await self.get_current_positions()
+                payload = orjson.dumps({
+                    'type': 'initial',
+                    'data': positions,
+                    'count': len(positions),
+                    'timestamp': datetime.now().isoformat()
+                })
             
-            # 压缩大数据
-            compressed_data = await self.compress_data(initial_data)
-            await websocket.send(compressed_data)
+            # 以文本帧发送，压缩交给permessage-deflate
+            payload = payload.decode()
+            if gen == self._delta_gen:  # 查询期间没有新的变化才缓存
+                self._initial_cache = (time.monotonic(), payload)
+            return payload
+    
+    async def send_initial_data(self, websocket: websockets.WebSocketServerProtocol):
+        """发送初始数据"""
+        try:
+            await websocket.send(await self.get_initial_payload())
             
         except Exception as e:
             logger.error(f"发送初始数据失败: {e}")
     
-    async def broadcast_changes(self, positions: List[TrainPosition]):
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        """在数据库线程中执行查询；首次调用时打开长连接"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA cache_size=-65536")    # 64MB页缓存
+            self.conn.execute("PRAGMA mmap_size=268435456")  # 256MB内存映射
+        return self.conn.execute(sql, params).fetchall()
+    
+    async def query(self, sql: str, params: tuple = ()) -> list:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, self._query, sql, params)
+    
+    def close(self):
+        """关闭数据库连接"""
+        def _close():
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        self.db_executor.submit(_close).result()
+        self.db_executor.shutdown()
+    
+    def publish(self, position: TrainPosition):
+        """推入一条有更新的火车位置，等待下一次广播"""
+        self.dirty_queue.put_nowait(position)
+    
+    async def poll_changes(self):
+        """只读取上次之后更新过的行（走updated_at_epoch索引），无更新时几乎零开销"""
+        # 写入线程按批提交，回看几秒避免漏掉稍晚提交的行；重复行的哈希不变，不会重复广播
+        since = max(self._watermark - 5_000_000,
+                    int((time.time() - WINDOW_HOURS * 3600) * 1_000_000))
+        try:
+            rows = await self.query(POLL_CHANGES_SQL, (since,))
+        except Exception as e:
+            logger.error(f"读取位置更新失败: {e}")
+            return
+        
+        last_seen = self.last_seen
+        for row in rows:
+            last_seen[row[0]] = row[10]
+            self.publish(TrainPosition(*row[:10]))
+        if rows:
+            self._watermark = max(self._watermark, rows[-1][10])
+    
+    def expired_rids(self) -> List[str]:
+        """超过时间窗口未更新的火车"""
+        cutoff = int((time.time() - WINDOW_HOURS * 3600) * 1_000_000)
+        expired = [rid for rid, epoch in self.last_seen.items() if epoch <= cutoff]
+        for rid in expired:
+            del self.last_seen[rid]
+        return expired
+    
+    async def broadcast_changes(self, positions: List[TrainPosition], removed_rids: Iterable[str] = (),
+                                tick_ms: Optional[int] = None):
         """广播位置变化"""
+        # 没有客户端时也更新检测器状态，避免之后一次性推送陈旧的变化
+        changes = self.delta_detector.get_changes(positions, removed_rids, tick_ms)
+        if changes['added'] or changes['updated'] or changes['removed']:
+            # 快照之后有变化就作废缓存：之后注册的客户端收不到这次delta，必须拿到新快照
+            self._initial_cache = None
+            self._delta_gen += 1
         if not self.connections:
             return
         
-        # 检测变化
-        changes = self.delta_detector.get_changes(positions)
-        
         # 只有有变化时才广播
         if (changes['added'] or changes['updated'] or changes['removed']):
-            message = {
-                'type': 'delta',
-                'changes': changes,
-                'stats': {
-                    'added': len(changes['added']),
-                    'updated': len(changes['updated']),
-                    'removed': len(changes['removed'])
-                }
-            }
-            
-            # 压缩数据
-            compressed_data = await self.compress_data(message)
+            # 每个tick只序列化一次，同一个payload发给所有客户端
+            payload = self.delta_detector.encode_delta(changes)
             
-            # 并发发送给所有客户端
-            if self.connections:
-                await asyncio.gather(
-                    *[self.send_to_client(ws, compressed_data) for ws in self.connections.copy()],
-                    return_exceptions=True
-                )
-    
-    async def send_to_client(self, websocket: websockets.WebSocketServerProtocol, data: str):
-        """发送数据给单个客户端"""
-        try:
-            await websocket.send(data)
-        except websockets.exceptions.ConnectionClosed:
-            await self.unregister(websocket)
-        except Exception as e:
-            logger.error(f"发送数据失败: {e}")
-            await self.unregister(websocket)
-    
-    async def compress_data(self, data: dict) -> str:
-        """返回JSON数据（暂时禁用压缩）"""
-        return json.dumps(data, separators=(',', ':'))
+            # 放入各客户端的发送队列，由各自的发送任务异步发送；
+            # 循环内没有await，注册/注销不会在迭代中途发生，无需复制集合
+            for queue in self.client_queues.values():
+                self._offer(queue, payload)
     
     async def get_current_positions(self) -> List[TrainPosition]:
         """从数据库获取当前位置"""
         try:
-            # 连接到Darwin数据库
-            with sqlite3.connect('data/database/train_positions.db') as conn:
-                cursor = conn.execute("""
-                    SELECT rid, lat, lon, state, ts, from_tpl, to_tpl, platform
-                    FROM train_positions 
-                    WHERE updated_at > datetime('now', '-6 hours')
-                    ORDER BY updated_at DESC
-                    LIMIT 2000
-                """)
-                
-                positions = []
-                for row in cursor.fetchall():
-                    if row[1] and row[2]:  # 确保有坐标
-                        pos = TrainPosition(
-                            rid=row[0],
-                            lat=float(row[1]),
-                            lon=float(row[2]),
-                            state=row[3] or 'unknown',
-                            ts=row[4] or datetime.now().isoformat(),
-                            from_tpl=row[5] or '',
-                            to_tpl=row[6] or '',
-                            platform=row[7] or ''
-                        )
-                        positions.append(pos)
-                
-                return positions
-                
+            cutoff = int((time.time() - WINDOW_HOURS * 3600) * 1_000_000)
+            rows = await self.query(CURRENT_POSITIONS_SQL, (cutoff,))
+            
+            return [TrainPosition(*row) for row in rows]
+            
         except Exception as e:
             logger.error(f"获取位置数据失败: {e}")
             return []
 
+PING_MESSAGES = frozenset(('{"type":"ping"}', '{"type": "ping"}', b'{"type":"ping"}', b'{"type": "ping"}'))
+PONG_MESSAGE = '{"type":"pong"}'
+
 class RealtimeServer:
     """实时WebSocket服务器"""
     
@@ -227,27 +421,56 @@ class RealtimeServer:
     async def handle_message(self, websocket, message):
         """处理客户端消息"""
         try:
-            data = json.loads(message)
+            # 心跳按原文匹配直接回复，不做JSON解析
+            if message in PING_MESSAGES:
+                await websocket.send(PONG_MESSAGE)
+                return
+            
+            data = orjson.loads(message)
             msg_type = data.get('type')
             
             if msg_type == 'ping':
-                await websocket.send(json.dumps({'type': 'pong'}))
+                await websocket.send(PONG_MESSAGE)
             elif msg_type == 'filter':
                 # 设置客户端过滤器
                 self.ws_manager.client_filters[websocket] = data.get('filters', {})
             elif msg_type == 'request_update':
-                # 客户端请求立即更新
-                await self.ws_manager.send_initial_data(websocket)
+                # 客户端请求立即更新：经发送队列补发快照，保证与delta的先后顺序
+                self.ws_manager.enqueue(websocket, self.ws_manager.RESYNC)
                 
         except Exception as e:
             logger.error(f"处理客户端消息失败: {e}")
     
+    async def change_watch_loop(self):
+        """每秒检查数据库中新增的更新，推入dirty_queue"""
+        while self.running:
+            await self.ws_manager.poll_changes()
+            await asyncio.sleep(1)
+    
     async def position_update_loop(self):
-        """位置更新循环"""
+        """位置更新循环：只处理有更新的火车，不再每秒全表查询"""
+        queue = self.ws_manager.dirty_queue
+        last_expire = time.monotonic()
         while self.running:
             try:
-                positions = await self.ws_manager.get_current_positions()
-                await self.ws_manager.broadcast_changes(positions)
+                positions = []
+                try:
+                    positions.append(await asyncio.wait_for(queue.get(), timeout=1.0))
+                    while not queue.empty():
+                        positions.append(queue.get_nowait())
+                except asyncio.TimeoutError:
+                    pass
+                
+                tick_ms = int(time.time() * 1000)
+                
+                # 每分钟检查一次过期的火车
+                removed = []
+                if time.monotonic() - last_expire >= 60:
+                    removed = self.ws_manager.expired_rids()
+                    last_expire = time.monotonic()
+                
+                if positions or removed:
+                    await self.ws_manager.broadcast_changes(positions, removed, tick_ms)
                 
                 # 根据连接数调整更新频率
                 if len(self.ws_manager.connections) > 10:
@@ -273,10 +496,20 @@ class RealtimeServer:
             ping_interval=20,
             ping_timeout=10,
             max_size=10**6,  # 1MB max message size
-            compression='deflate'
+            # permessage-deflate保留上下文（context takeover）并使用32KB窗口：
+            # 每帧重复的键名可以回溯引用之前的帧，level=1降低压缩CPU
+            compression=None,
+            extensions=[
+                ServerPerMessageDeflateFactory(
+                    server_no_context_takeover=False,
+                    server_max_window_bits=15,
+                    compress_settings={'level': 1, 'memLevel': 8},
+                )
+            ],
         )
         
-        # 启动位置更新循环
+        # 启动更新检测和位置广播循环
+        watch_task = asyncio.create_task(self.change_watch_loop())
         update_task = asyncio.create_task(self.position_update_loop())
         
         logger.info(f"✅ WebSocket服务器运行在 ws://{self.host}:{self.port}")
@@ -288,17 +521,20 @@ class RealtimeServer:
             logger.info("收到中断信号，正在关闭服务器...")
         finally:
             self.running = False
+            watch_task.cancel()
             update_task.cancel()
             server.close()
             await server.wait_closed()
+            self.ws_manager.close()
 
 # HTTP API服务器（用于健康检查和统计）
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 def create_api_app(ws_manager: WebSocketManager) -> FastAPI:
     """创建API应用"""
-    app = FastAPI(title="Realtime Train WebSocket API")
+    app = FastAPI(title="Realtime Train WebSocket API", default_response_class=ORJSONResponse)
     
     app.add_middleware(
         CORSMiddleware,
@@ -321,7 +557,7 @@ def create_api_app(ws_manager: WebSocketManager) -> FastAPI:
     def get_stats():
         return {
             "active_connections": len(ws_manager.connections),
-            "total_trains": len(ws_manager.delta_detector.last_positions),
+            "total_trains": len(ws_manager.delta_detector.store),
             "server_time": datetime.now().isoformat()
         }
     
@@ -341,6 +577,7 @@ async def main():
     parser.add_argument("--api-port", type=int, default=8003, help="API端口")
     
     args = parser.parse_args()
+    logger.info(f"事件循环: {type(asyncio.get_running_loop()).__name__}")
     
     # 创建服务器
     server = RealtimeServer(args.host, args.ws_port)
@@ -365,4 +602,10 @@ async def main():
     )
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop的C实现事件循环显著提升WebSocket发送吞吐；Windows上没有uvloop，退回默认循环
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file
@@ -5,18 +5,25 @@ Darwin实时消费者配置管理工具
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class DarwinConfigManager:
     def __init__(self, base_url="http://localhost:8000"):
         self.base_url = base_url.rstrip('/')
+        # 复用同一个Session的keep-alive连接，避免每次请求重新建立TCP/TLS连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
     def get_config(self):
         """获取当前配置"""
         try:
-            response = requests.get(f"{self.base_url}/config")
+            response = self.session.get(f"{self.base_url}/config")
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -26,7 +33,7 @@ class DarwinConfigManager:
     def set_update_interval(self, seconds):
         """设置更新间隔"""
         try:
-            response = requests.post(f"{self.base_url}/config/update-interval/{seconds}")
+            response = self.session.post(f"{self.base_url}/config/update-interval/{seconds}")
             response.raise_for_status()
             result = response.json()
             print(f"✅ {result['message']}")
@@ -38,7 +45,7 @@ class DarwinConfigManager:
     def get_stats(self):
         """获取统计信息"""
         try:
-            response = requests.get(f"{self.base_url}/debug/stats")
+            response = self.session.get(f"{self.base_url}/debug/stats")
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -48,7 +55,7 @@ class DarwinConfigManager:
     def get_positions(self, limit=10):
         """获取位置信息"""
         try:
-            response = requests.get(f"{self.base_url}/positions?limit={limit}")
+            response = self.session.get(f"{self.base_url}/positions?limit={limit}")
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -58,7 +65,7 @@ class DarwinConfigManager:
     def cleanup_data(self):
         """手动清理数据"""
         try:
-            response = requests.post(f"{self.base_url}/debug/cleanup")
+            response = self.session.post(f"{self.base_url}/debug/cleanup")
             response.raise_for_status()
             result = response.json()
             print(f"✅ {result['message']}")
@@ -70,7 +77,7 @@ class DarwinConfigManager:
     def add_tiploc(self, tiploc, lat, lon, name=""):
         """添加TIPLOC坐标"""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/tiplocs/{tiploc}",
                 params={"lat": lat, "lon": lon, "name": name}
             )
@@ -87,8 +94,16 @@ class DarwinConfigManager:
         print("🚂 Darwin实时火车位置服务状态")
         print("=" * 50)
         
-        # 获取配置
-        config = self.get_config()
+        # 三个请求并发发出（连接池中最多4个连接），总耗时约为一次往返
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            config_future = executor.submit(self.get_config)
+            stats_future = executor.submit(self.get_stats)
+            positions_future = executor.submit(self.get_positions, 5)
+        config = config_future.result()
+        stats = stats_future.result()
+        positions = positions_future.result()
+        
+        # 配置信息
         if config:
             print(f"📊 配置信息:")
             print(f"   更新间隔: {config['update_interval']} 秒")
@@ -96,8 +111,7 @@ class DarwinConfigManager:
             print(f"   数据库路径: {config['db_path']}")
             print(f"   Kafka配置: {'✅' if config['kafka_configured'] else '❌'}")
         
-        # 获取统计信息
-        stats = self.get_stats()
+        # 统计信息
         if stats:
             print(f"\n📈 运行统计:")
             print(f"   内存中火车数: {stats['trains_in_memory']}")
@@ -108,8 +122,7 @@ class DarwinConfigManager:
                 last_update = datetime.fromisoformat(stats['last_update'])
                 print(f"   最后更新: {last_update.strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # 获取最新位置
-        positions = self.get_positions(5)
+        # 最新位置
         if positions:
             print(f"\n🚂 最新火车位置 (前5个):")
             for pos in positions[:5]:
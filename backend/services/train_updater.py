@@ -7,13 +7,17 @@
 """
 
 import os
-import json
 import time
 import logging
 import asyncio
+import threading
 import aiohttp
+import numpy as np
+import orjson
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
+from collections import defaultdict, deque
 from dataclasses import dataclass, asdict
 import sqlite3
 from pathlib import Path
@@ -53,18 +57,72 @@ class UpdateConfig:
     full_sync_on_startup: bool = os.getenv("FULL_SYNC_ON_STARTUP", "true").lower() == "true"
     initial_data_age_minutes: int = int(os.getenv("INITIAL_DATA_AGE_MINUTES", "1440"))  # 24小时
 
+TS_INVALID = np.iinfo(np.int64).min  # ts无法解析
+# 启动时PRAGMA optimize每个索引最多采样的行数，避免大表上的全量ANALYZE
+ANALYSIS_LIMIT = 400
+
+def _parse_ts_us(ts) -> int:
+    """把ISO时间字符串转换为unix微秒，无法解析时返回TS_INVALID"""
+    try:
+        return int(datetime.fromisoformat(ts).timestamp() * 1_000_000)
+    except (TypeError, ValueError):
+        return TS_INVALID
+
 class TrainPositionCache:
     """火车位置缓存"""
     
-    def __init__(self, db_path: str):
+    INITIAL_CAPACITY = 4096
+    HISTORY_LIMIT = 50
+    DELETE_CHUNK_SIZE = 1000
+    
+    def __init__(self, db_path: str, conn: Optional[sqlite3.Connection] = None):
         self.db_path = db_path
         self.positions: Dict[str, dict] = {}  # rid -> position
-        self.last_seen: Dict[str, datetime] = {}  # rid -> last_update_time
-        self.position_history: Dict[str, List[dict]] = {}  # rid -> [positions]
+        # 最后更新时间按列（SoA）存放，活跃查询和清理为一次向量化扫描
+        self._index: Dict[str, int] = {}  # rid -> 行号
+        self._free: List[int] = []        # 已清理火车空出的行号
+        self._size = 0
+        self._rids = np.empty(self.INITIAL_CAPACITY, object)
+        self._last_seen_us = np.full(self.INITIAL_CAPACITY, -1, np.int64)  # unix微秒，-1为空行
+        self._ts_us = np.full(self.INITIAL_CAPACITY, TS_INVALID, np.int64)  # 当前位置ts，入库时解析一次
+        # rid -> 最近50条位置，超出时自动丢弃最旧的
+        self.position_history: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.HISTORY_LIMIT))
+        self._dirty: List[tuple] = []  # 待写入数据库的位置行
+        self.version = 0  # 位置数据每次变化时递增，用于响应缓存
+        # 单一长连接，由锁保护，使WAL状态和页缓存在调用间保持；
+        # 传入的外部连接由调用方负责关闭
+        self._lock = threading.Lock()
+        self._owns_conn = conn is None
+        self._conn = self._connect() if conn is None else conn
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开共享连接并设置PRAGMA"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-65536")  # 64MB固定页缓存
+        conn.execute("PRAGMA mmap_size=268435456")  # 256MB内存映射
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """在单个事务中使用共享连接，退出时提交"""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            yield self._conn
+    
+    def close(self):
+        """关闭数据库连接"""
+        if not self._owns_conn:
+            return
+        with self._lock:
+            self._conn.close()
         
     def init_db(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock, self._conn as conn:
             # 创建位置历史表
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS position_history (
@@ -105,114 +163,260 @@ class TrainPositionCache:
                     updated_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            
+            # 清理旧历史按created_at删除
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ph_created 
+                ON position_history(created_at)
+            """)
+            
+            # 按更新时间倒序查询最近位置
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_cp_updated 
+                ON current_positions(updated_at DESC)
+            """)
+            
+            # tiploc_coords由其他模块创建，存在时为有坐标的行建立部分索引
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tiploc_coords)")}
+            if 'tiploc' in columns:
+                conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_tiploc_coords_nonnull 
+                    ON tiploc_coords(tiploc) WHERE lat IS NOT NULL AND lon IS NOT NULL
+                """)
+            
+            # 只为缺少或过期统计信息的表做有限采样的分析；全量ANALYZE由init_database.py执行一次
+            conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            conn.execute("PRAGMA optimize")
     
     def update_position(self, rid: str, position: dict):
         """更新火车位置"""
-        old_position = self.positions.get(rid)
-        self.positions[rid] = position
-        self.last_seen[rid] = datetime.now()
+        self.update_positions([(rid, position)])
+    
+    def update_positions(self, updates: List[Tuple[str, dict]]):
+        """批量更新火车位置，速度和方向按批向量化计算"""
+        if not updates:
+            # 空批次不改变数据，不递增version，客户端ETag保持有效
+            return
+        self.version += 1
+        now_us = time.time_ns() // 1000
+        timestamp = datetime.fromtimestamp(now_us / 1e6).isoformat()
+        
+        # 每个位置的ts只在这里解析一次，之后以整数微秒保存
+        new_ts = [
+            _parse_ts_us(position['ts']) if 'ts' in position else now_us
+            for _, position in updates
+        ]
         
         # 计算速度和方向（如果有历史位置）
-        if old_position and 'lat' in old_position and 'lon' in old_position:
-            speed, bearing = self._calculate_movement(old_position, position)
-            position['speed'] = speed
-            position['bearing'] = bearing
-        
-        # 保存到历史记录
-        if rid not in self.position_history:
-            self.position_history[rid] = []
-        
-        self.position_history[rid].append({
-            **position,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # 限制历史记录数量
-        if len(self.position_history[rid]) > 50:
-            self.position_history[rid] = self.position_history[rid][-50:]
-    
-    def _calculate_movement(self, old_pos: dict, new_pos: dict) -> tuple:
-        """计算速度和方向"""
-        try:
-            from math import radians, cos, sin, asin, sqrt, atan2, degrees
-            
-            # 计算距离（Haversine公式）
-            lat1, lon1 = radians(old_pos['lat']), radians(old_pos['lon'])
-            lat2, lon2 = radians(new_pos['lat']), radians(new_pos['lon'])
-            
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            distance_km = 2 * asin(sqrt(a)) * 6371  # 地球半径
-            
-            # 计算时间差
-            old_time = datetime.fromisoformat(old_pos.get('ts', datetime.now().isoformat()))
-            new_time = datetime.fromisoformat(new_pos.get('ts', datetime.now().isoformat()))
-            time_diff_hours = (new_time - old_time).total_seconds() / 3600
-            
-            # 计算速度 (km/h)
-            speed = distance_km / time_diff_hours if time_diff_hours > 0 else 0
-            
-            # 计算方向
-            y = sin(dlon) * cos(lat2)
-            x = cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(dlon)
-            bearing = (degrees(atan2(y, x)) + 360) % 360
+        moving = []
+        moving_ts = []
+        for (rid, position), ts_us in zip(updates, new_ts):
+            old_position = self.positions.get(rid)
+            if old_position and 'lat' in old_position and 'lon' in old_position:
+                moving.append((old_position, position))
+                moving_ts.append((int(self._ts_us[self._index[rid]]), ts_us))
+        
+        if moving:
+            movements = self._calculate_movements(moving, moving_ts)
+            for (_, position), (speed, bearing) in zip(moving, movements):
+                position['speed'] = speed
+                position['bearing'] = bearing
+        
+        for (rid, position), ts_us in zip(updates, new_ts):
+            self.positions[rid] = position
+            i = self._index.get(rid)
+            if i is None:
+                i = self._slot(rid)
+            self._last_seen_us[i] = now_us
+            self._ts_us[i] = ts_us
             
-            return speed, bearing
+            # 保存到历史记录
+            self.position_history[rid].append({
+                **position,
+                'timestamp': timestamp
+            })
             
-        except Exception as e:
-            logger.debug(f"计算移动参数失败: {e}")
-            return 0.0, 0.0
+            # 记录待写入的行，由flush统一批量写入
+            if position.get('lat') is not None and position.get('lon') is not None:
+                self._dirty.append((
+                    rid, position.get('ts') or timestamp,
+                    position['lat'], position['lon'],
+                    position.get('state'), position.get('from_tpl'),
+                    position.get('to_tpl'), position.get('platform'),
+                    position.get('speed'), position.get('bearing')
+                ))
     
-    def get_active_trains(self, max_age_minutes: int = 60) -> List[dict]:
-        """获取活跃的火车"""
-        cutoff_time = datetime.now() - timedelta(minutes=max_age_minutes)
-        active_trains = []
+    def _slot(self, rid: str) -> int:
+        """为新火车分配行号，必要时扩容"""
+        if self._free:
+            i = self._free.pop()
+        else:
+            i = self._size
+            self._size += 1
+            if i >= len(self._last_seen_us):
+                grow = len(self._last_seen_us)
+                self._rids = np.concatenate([self._rids, np.empty(grow, object)])
+                self._last_seen_us = np.concatenate([self._last_seen_us, np.full(grow, -1, np.int64)])
+                self._ts_us = np.concatenate([self._ts_us, np.full(grow, TS_INVALID, np.int64)])
+        self._index[rid] = i
+        self._rids[i] = rid
+        return i
+    
+    def flush(self, conn: sqlite3.Connection) -> int:
+        """将累积的位置行批量写入数据库（由调用方控制事务）"""
+        if not self._dirty:
+            return 0
+        
+        rows = self._dirty
+        self._dirty = []
+        conn.executemany("""
+            INSERT OR REPLACE INTO current_positions
+            (rid, timestamp, lat, lon, state, from_tpl, to_tpl, platform, speed, bearing)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.executemany("""
+            INSERT INTO position_history
+            (rid, timestamp, lat, lon, state, from_tpl, to_tpl, platform, speed, bearing)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        return len(rows)
+    
+    def _calculate_movements(self, pairs: List[Tuple[dict, dict]],
+                             times: List[Tuple[int, int]]) -> List[Tuple[float, float]]:
+        """批量计算速度和方向，times为对应的(旧ts, 新ts)微秒；无法计算的条目返回(0.0, 0.0)"""
+        results = [(0.0, 0.0)] * len(pairs)
+        
+        valid = []
+        coords = []
+        hours = []
+        for i, ((old_pos, new_pos), (old_us, new_us)) in enumerate(zip(pairs, times)):
+            if old_us == TS_INVALID or new_us == TS_INVALID:
+                continue
+            try:
+                coords.append((float(old_pos['lat']), float(old_pos['lon']),
+                               float(new_pos['lat']), float(new_pos['lon'])))
+            except Exception as e:
+                logger.debug(f"计算移动参数失败: {e}")
+                continue
+            valid.append(i)
+            hours.append((new_us - old_us) / 3_600_000_000)
+        
+        if not valid:
+            return results
         
-        for rid, last_seen in self.last_seen.items():
-            if last_seen >= cutoff_time and rid in self.positions:
-                active_trains.append({
-                    'rid': rid,
-                    'last_seen': last_seen.isoformat(),
-                    **self.positions[rid]
-                })
+        # 计算距离（Haversine公式）
+        lat1, lon1, lat2, lon2 = np.radians(np.array(coords)).T
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        distance_km = 2 * np.arcsin(np.sqrt(a)) * 6371  # 地球半径
+        
+        # 计算速度 (km/h)
+        hours = np.array(hours)
+        speed = np.divide(distance_km, hours, out=np.zeros_like(distance_km), where=hours > 0)
+        
+        # 计算方向
+        y = np.sin(dlon) * np.cos(lat2)
+        x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+        bearing = (np.degrees(np.arctan2(y, x)) + 360) % 360
+        
+        for i, sp, br in zip(valid, speed.tolist(), bearing.tolist()):
+            results[i] = (sp, br)
+        return results
+    
+    def _cutoff_us(self, max_age_minutes: float) -> int:
+        """计算截止时间（unix微秒）"""
+        return time.time_ns() // 1000 - int(max_age_minutes * 60_000_000)
+    
+    def get_active_trains(self, max_age_minutes: int = 60, limit: Optional[int] = None) -> List[dict]:
+        """获取活跃的火车（最近更新的在前）"""
+        last_seen = self._last_seen_us[:self._size]
+        idxs = np.flatnonzero(last_seen >= self._cutoff_us(max_age_minutes))
+        idxs = idxs[np.argsort(-last_seen[idxs], kind='stable')][:limit]
+        
+        active_trains = []
+        for i, seen_us in zip(idxs.tolist(), last_seen[idxs].tolist()):
+            rid = self._rids[i]
+            active_trains.append({
+                'rid': rid,
+                'last_seen': datetime.fromtimestamp(seen_us / 1e6).isoformat(),
+                **self.positions[rid]
+            })
         
         return active_trains
     
+    def count_active_trains(self, max_age_minutes: int = 60) -> int:
+        """统计活跃火车数量"""
+        return int(np.count_nonzero(self._last_seen_us[:self._size] >= self._cutoff_us(max_age_minutes)))
+    
     def cleanup_old_data(self, max_age_hours: int = 24):
         """清理旧数据"""
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-        
-        # 清理内存中的旧数据
-        old_rids = []
-        for rid, last_seen in self.last_seen.items():
-            if last_seen < cutoff_time:
-                old_rids.append(rid)
+        cutoff_time = self.prune_memory(max_age_hours)
+        self.delete_history_before(cutoff_time)
+    
+    def prune_memory(self, max_age_hours: int = 24) -> datetime:
+        """清理内存中的旧数据，返回截止时间"""
+        cutoff_us = self._cutoff_us(max_age_hours * 60)
+        last_seen = self._last_seen_us[:self._size]
+        old_idxs = np.flatnonzero((last_seen >= 0) & (last_seen < cutoff_us)).tolist()
         
-        for rid in old_rids:
+        for i in old_idxs:
+            rid = self._rids[i]
             self.positions.pop(rid, None)
-            self.last_seen.pop(rid, None)
             self.position_history.pop(rid, None)
+            del self._index[rid]
+            self._rids[i] = None
+            self._free.append(i)
+        self._last_seen_us[old_idxs] = -1
+        if old_idxs:
+            self.version += 1
+        
+        logger.info(f"清理了 {len(old_idxs)} 个旧的火车记录")
+        return datetime.fromtimestamp(cutoff_us / 1e6)
+    
+    def delete_history_before(self, cutoff_time: datetime):
+        """分批清理数据库中的旧历史记录（可在线程中执行）"""
+        cutoff = cutoff_time.isoformat()
+        total = 0
+        
+        # 每批单独提交并释放锁，避免长时间持有写锁阻塞更新循环
+        while True:
+            with self._lock, self._conn as conn:
+                deleted = conn.execute("""
+                    DELETE FROM position_history WHERE rowid IN (
+                        SELECT rowid FROM position_history WHERE created_at < ? LIMIT ?
+                    )
+                """, (cutoff, self.DELETE_CHUNK_SIZE)).rowcount
+            total += deleted
+            if deleted < self.DELETE_CHUNK_SIZE:
+                break
         
-        logger.info(f"清理了 {len(old_rids)} 个旧的火车记录")
+        # 大量删除后截断WAL文件
+        if total >= self.DELETE_CHUNK_SIZE:
+            with self._lock:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
         
-        # 清理数据库中的旧数据
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "DELETE FROM position_history WHERE created_at < ?",
-                (cutoff_time.isoformat(),)
-            )
-            logger.info(f"从数据库清理了 {cursor.rowcount} 条历史记录")
+        logger.info(f"从数据库清理了 {total} 条历史记录")
 
 class SmartTrainUpdater:
     """智能火车更新器"""
     
+    CLEANUP_INTERVAL = 1800  # 每30分钟清理一次
+    FULL_SYNC_INTERVAL = 6 * 3600  # 每6小时完整同步一次
+    
     def __init__(self, config: UpdateConfig):
         self.config = config
         self.cache = TrainPositionCache(config.db_path)
         self.session: Optional[aiohttp.ClientSession] = None
         self.running = False
         self.last_full_sync = None
+        self._config_dict = asdict(config)  # 配置运行期不变，只转换一次
+        # 定时任务使用单调时钟截止时间，不受系统时间调整影响
+        self._next_cleanup = time.monotonic() + self.CLEANUP_INTERVAL
+        self._next_full_sync = time.monotonic()
+        self._cleanup_task: Optional[asyncio.Task] = None
+        # 每小时对应的更新间隔，启动时预先计算
+        self._interval_by_hour = tuple(self._classify_hour(h) for h in range(24))
         
     async def start(self):
         """启动更新器"""
@@ -222,8 +426,19 @@ class SmartTrainUpdater:
         self.cache.init_db()
         
         # 创建HTTP会话
-        connector = aiohttp.TCPConnector(limit=self.config.max_concurrent_requests)
-        self.session = aiohttp.ClientSession(connector=connector)
+        # 长连接复用：各同步周期共享同一连接池，避免重复握手
+        connector = aiohttp.TCPConnector(
+            limit=self.config.max_concurrent_requests,
+            limit_per_host=self.config.max_concurrent_requests,
+            keepalive_timeout=75,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30, connect=5),
+            raise_for_status=False
+        )
         
         self.running = True
         
@@ -247,6 +462,8 @@ class SmartTrainUpdater:
         
         if self.session:
             await self.session.close()
+        
+        self.cache.close()
     
     async def full_sync(self):
         """完整同步所有火车位置"""
@@ -261,17 +478,20 @@ class SmartTrainUpdater:
             
             async with self.session.get(url, params=params) as response:
                 if response.status == 200:
-                    positions = await response.json()
+                    positions = orjson.loads(await response.read())
                     
                     logger.info(f"📥 获取到 {len(positions)} 个火车位置")
                     
-                    # 批量更新缓存
-                    for position in positions:
-                        rid = position.get('rid')
-                        if rid:
-                            self.cache.update_position(rid, position)
+                    # 批量更新缓存，并在单个事务中写入数据库
+                    with self.cache.transaction() as conn:
+                        self.cache.update_positions([
+                            (position['rid'], position) for position in positions
+                            if position.get('rid')
+                        ])
+                        self.cache.flush(conn)
                     
                     self.last_full_sync = datetime.now()
+                    self._next_full_sync = time.monotonic() + self.FULL_SYNC_INTERVAL
                     logger.info(f"✅ 完整同步完成，缓存了 {len(self.cache.positions)} 个火车位置")
                     
                 else:
@@ -292,12 +512,14 @@ class SmartTrainUpdater:
             
             async with self.session.get(url, params=params) as response:
                 if response.status == 200:
-                    positions = await response.json()
+                    positions = orjson.loads(await response.read())
                     
                     # 检查哪些是新的或更新的位置
                     new_count = 0
                     updated_count = 0
                     
+                    changed = []
+                    
                     for position in positions:
                         rid = position.get('rid')
                         if not rid:
@@ -312,7 +534,11 @@ class SmartTrainUpdater:
                         else:
                             continue  # 位置没有变化，跳过
                         
-                        self.cache.update_position(rid, position)
+                        changed.append((rid, position))
+                    
+                    with self.cache.transaction() as conn:
+                        self.cache.update_positions(changed)
+                        self.cache.flush(conn)
                     
                     if new_count > 0 or updated_count > 0:
                         logger.info(f"📍 增量更新: {new_count} 新火车, {updated_count} 位置变化")
@@ -325,35 +551,27 @@ class SmartTrainUpdater:
     
     def _position_changed(self, old_pos: dict, new_pos: dict) -> bool:
         """检查位置是否有显著变化"""
-        # 检查坐标变化（精度到小数点后4位，约11米）
-        old_lat = round(old_pos.get('lat', 0), 4)
-        old_lon = round(old_pos.get('lon', 0), 4)
-        new_lat = round(new_pos.get('lat', 0), 4)
-        new_lon = round(new_pos.get('lon', 0), 4)
-        
-        if old_lat != new_lat or old_lon != new_lon:
-            return True
-        
-        # 检查状态变化
-        if old_pos.get('state') != new_pos.get('state'):
-            return True
-        
-        # 检查站台变化
-        if old_pos.get('platform') != new_pos.get('platform'):
-            return True
-        
-        return False
+        # 坐标按1e-4度（约11米）缩放后四舍五入为整数比较，与round(x, 4)的分桶一致；
+        # int()向零截断会使0附近的桶加倍（英国经度多为负值），不能代替round
+        return (
+            round(old_pos.get('lat', 0) * 10000) != round(new_pos.get('lat', 0) * 10000)
+            or round(old_pos.get('lon', 0) * 10000) != round(new_pos.get('lon', 0) * 10000)
+            or old_pos.get('state') != new_pos.get('state')
+            or old_pos.get('platform') != new_pos.get('platform')
+        )
     
     def get_current_update_interval(self) -> int:
         """根据当前时间获取更新间隔"""
-        current_hour = datetime.now().hour
-        
+        return self._interval_by_hour[time.localtime().tm_hour]
+    
+    def _classify_hour(self, hour: int) -> int:
+        """计算指定小时的更新间隔"""
         # 深夜时段（23:00-05:00）使用慢速更新
-        if current_hour >= 23 or current_hour < 5:
+        if hour >= 23 or hour < 5:
             return self.config.slow_update_interval
         
         # 高峰时段使用正常更新
-        elif self.config.peak_hours_start <= current_hour <= self.config.peak_hours_end:
+        elif self.config.peak_hours_start <= hour <= self.config.peak_hours_end:
             return self.config.normal_update_interval
         
         # 其他时段使用慢速更新
@@ -369,13 +587,16 @@ class SmartTrainUpdater:
                 # 执行增量更新
                 await self.incremental_update()
                 
-                # 定期清理旧数据
-                if datetime.now().minute % 30 == 0:  # 每30分钟清理一次
-                    self.cache.cleanup_old_data(self.config.max_position_age_hours)
+                now_m = time.monotonic()
                 
-                # 定期完整同步（每6小时）
-                if (self.last_full_sync is None or 
-                    datetime.now() - self.last_full_sync > timedelta(hours=6)):
+                # 定期清理旧数据，数据库删除放到线程中执行，不阻塞更新循环
+                if now_m >= self._next_cleanup:
+                    self._next_cleanup = now_m + self.CLEANUP_INTERVAL
+                    if self._cleanup_task is None or self._cleanup_task.done():
+                        self._cleanup_task = asyncio.create_task(self.cleanup_old_data())
+                
+                # 定期完整同步
+                if now_m >= self._next_full_sync:
                     await self.full_sync()
                 
                 # 根据时间段调整更新间隔
@@ -388,27 +609,36 @@ class SmartTrainUpdater:
                 logger.error(f"更新循环错误: {e}")
                 await asyncio.sleep(60)  # 出错时等待1分钟再重试
     
+    async def cleanup_old_data(self):
+        """清理旧数据：内存部分在事件循环中执行，数据库部分在线程中执行"""
+        try:
+            cutoff_time = self.cache.prune_memory(self.config.max_position_age_hours)
+            await asyncio.to_thread(self.cache.delete_history_before, cutoff_time)
+        except Exception as e:
+            logger.error(f"清理旧数据失败: {e}")
+    
     def get_stats(self) -> dict:
         """获取统计信息"""
         return {
             'total_trains': len(self.cache.positions),
-            'active_trains_1h': len(self.cache.get_active_trains(60)),
-            'active_trains_6h': len(self.cache.get_active_trains(360)),
+            'active_trains_1h': self.cache.count_active_trains(60),
+            'active_trains_6h': self.cache.count_active_trains(360),
             'last_full_sync': self.last_full_sync.isoformat() if self.last_full_sync else None,
             'current_update_interval': self.get_current_update_interval(),
-            'config': asdict(self.config)
+            'config': self._config_dict
         }
 
 # API端点
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 # 全局更新器实例
 updater: Optional[SmartTrainUpdater] = None
 
 def create_updater_app() -> FastAPI:
     """创建更新器API应用"""
-    app = FastAPI(title="Smart Train Position Updater")
+    app = FastAPI(title="Smart Train Position Updater", default_response_class=ORJSONResponse)
     
     app.add_middleware(
         CORSMiddleware,
@@ -440,8 +670,12 @@ def create_updater_app() -> FastAPI:
             "description": "智能火车位置更新服务"
         }
     
+    # 已序列化的/positions响应: (limit, max_age_minutes) -> (etag, body)
+    positions_cache: Dict[Tuple[int, int], Tuple[str, bytes]] = {}
+    
     @app.get("/positions")
     def get_positions(
+        request: Request,
         limit: int = Query(default=1000, description="最大返回数量"),
         max_age_minutes: int = Query(default=60, description="最大数据年龄（分钟）")
     ):
@@ -449,8 +683,21 @@ def create_updater_app() -> FastAPI:
         if not updater:
             return []
         
-        active_trains = updater.cache.get_active_trains(max_age_minutes)
-        return active_trains[:limit]
+        # 数据只在更新周期变化；加入分钟数使过期火车按分钟粒度退出结果
+        minute = int(time.time() // 60)
+        etag = f'W/"{updater.cache.version}-{minute}-{limit}-{max_age_minutes}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        key = (limit, max_age_minutes)
+        cached = positions_cache.get(key)
+        if cached is None or cached[0] != etag:
+            if len(positions_cache) >= 32:
+                positions_cache.clear()
+            body = orjson.dumps(updater.cache.get_active_trains(max_age_minutes, limit))
+            cached = positions_cache[key] = (etag, body)
+        
+        return Response(content=cached[1], media_type="application/json", headers={"ETag": etag})
     
     @app.get("/stats")
     def get_stats():
@@ -482,10 +729,11 @@ async def main():
     args = parser.parse_args()
     
     if args.api_mode:
-        # API模式
+        # API模式：在当前事件循环中运行uvicorn（uvicorn.run会另开事件循环）
         import uvicorn
         app = create_updater_app()
-        uvicorn.run(app, host="0.0.0.0", port=8001)
+        api_config = uvicorn.Config(app, host="0.0.0.0", port=8001, log_level="info")
+        await uvicorn.Server(api_config).serve()
     else:
         # 独立模式
         config = UpdateConfig()
@@ -498,4 +746,10 @@ async def main():
             await updater.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop的C实现事件循环降低HTTP轮询和API服务的调度开销；Windows上没有uvloop，退回默认循环
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file
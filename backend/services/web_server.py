@@ -3,21 +3,43 @@
 简单的Web服务器，用于提供HTML文件和处理CORS
 """
 
-import http.server
-import socketserver
 import os
-from urllib.parse import urlparse
+from aiohttp import web
 
-class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        super().end_headers()
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+def create_app(abs_directory: str) -> web.Application:
+    """创建静态文件应用，文件由aiohttp经sendfile发送"""
+    root = os.path.realpath(abs_directory)
+    
+    @web.middleware
+    async def cors_middleware(request, handler):
+        if request.method == 'OPTIONS':
+            return web.Response(headers=CORS_HEADERS)
+        
+        # 目录请求返回其中的index.html，与SimpleHTTPRequestHandler行为一致
+        if request.path.endswith('/'):
+            index_file = os.path.realpath(os.path.join(root, request.path.lstrip('/'), 'index.html'))
+            if index_file.startswith(root + os.sep) and os.path.isfile(index_file):
+                response = web.FileResponse(index_file)
+                response.headers.update(CORS_HEADERS)
+                return response
+        
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            e.headers.update(CORS_HEADERS)
+            raise
+        response.headers.update(CORS_HEADERS)
+        return response
     
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
+    app = web.Application(middlewares=[cors_middleware])
+    app.router.add_static('/', path=abs_directory, show_index=True, follow_symlinks=False)
+    return app
 
 def start_server(port=3000, directory="frontend"):
     """启动Web服务器"""
@@ -27,23 +49,20 @@ def start_server(port=3000, directory="frontend"):
     
     # 获取绝对路径
     abs_directory = os.path.abspath(directory)
-    os.chdir(abs_directory)
+    app = create_app(abs_directory)
     
-    with socketserver.TCPServer(("", port), CORSHTTPRequestHandler) as httpd:
-        print(f"🌐 Web服务器启动成功")
-        print(f"📍 访问地址: http://localhost:{port}")
-        print(f"📁 服务目录: {os.getcwd()}")
-        print("\n可用页面:")
-        print(f"  🚂 高性能版: http://localhost:{port}/templates/index.html")
-        print(f"  🚂 增强版: http://localhost:{port}/templates/enhanced.html")
-        print(f"  🚂 基础版: http://localhost:{port}/templates/basic.html")
-        print("\n⏹️  按 Ctrl+C 停止服务")
-        print("-" * 50)
-        
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print("\n🛑 Web服务器已停止")
+    print(f"🌐 Web服务器启动成功")
+    print(f"📍 访问地址: http://localhost:{port}")
+    print(f"📁 服务目录: {abs_directory}")
+    print("\n可用页面:")
+    print(f"  🚂 高性能版: http://localhost:{port}/templates/index.html")
+    print(f"  🚂 增强版: http://localhost:{port}/templates/enhanced.html")
+    print(f"  🚂 基础版: http://localhost:{port}/templates/basic.html")
+    print("\n⏹️  按 Ctrl+C 停止服务")
+    print("-" * 50)
+    
+    web.run_app(app, port=port, print=None)
+    print("\n🛑 Web服务器已停止")
 
 if __name__ == "__main__":
     import argparse
@@ -53,4 +72,4 @@ if __name__ == "__main__":
     parser.add_argument("--dir", default=".", help="服务目录 (默认: 当前目录)")
     
     args = parser.parse_args()
-    start_server(args.port, args.dir)
\ No newline at end of file
+    start_server(args.port, args.dir)
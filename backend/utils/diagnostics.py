@@ -6,6 +6,7 @@
 
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from datetime import datetime
 import logging
@@ -13,27 +14,32 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 各项检查复用同一个Session的keep-alive连接，避免每次请求重新建立TCP连接
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
 def check_database_status(db_path="train_positions.db"):
     """检查数据库状态"""
     try:
         with sqlite3.connect(db_path) as conn:
-            # 检查TIPLOC坐标数量
-            cursor = conn.execute("SELECT COUNT(*) FROM tiploc_coords WHERE lat IS NOT NULL AND lon IS NOT NULL")
-            tiploc_count = cursor.fetchone()[0]
-            
-            # 检查CRS映射数量
-            cursor = conn.execute("SELECT COUNT(*) FROM crs_tiploc_mapping")
-            mapping_count = cursor.fetchone()[0]
-            
-            # 检查火车位置数量
-            cursor = conn.execute("SELECT COUNT(*) FROM train_positions")
-            position_count = cursor.fetchone()[0]
-            
-            # 检查最近的火车位置
+            conn.row_factory = sqlite3.Row
+            
+            # TIPLOC坐标、CRS映射、火车位置数量一次查询完成
+            counts = conn.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM tiploc_coords WHERE lat IS NOT NULL AND lon IS NOT NULL) AS tiploc_count,
+                    (SELECT COUNT(*) FROM crs_tiploc_mapping) AS mapping_count,
+                    (SELECT COUNT(*) FROM train_positions) AS position_count
+            """).fetchone()
+            tiploc_count = counts["tiploc_count"]
+            mapping_count = counts["mapping_count"]
+            position_count = counts["position_count"]
+            
+            # 检查最近的火车位置（按updated_at_epoch走索引）
             cursor = conn.execute("""
                 SELECT rid, from_tpl, to_tpl, lat, lon, state, updated_at 
                 FROM train_positions 
-                ORDER BY updated_at DESC 
+                ORDER BY updated_at_epoch DESC 
                 LIMIT 5
             """)
             recent_positions = cursor.fetchall()
@@ -46,7 +52,7 @@ def check_database_status(db_path="train_positions.db"):
             if recent_positions:
                 print("\n🚂 最近的火车位置:")
                 for pos in recent_positions:
-                    print(f"   {pos[0]}: {pos[1]} -> {pos[2]} ({pos[3]}, {pos[4]}) - {pos[5]} @ {pos[6]}")
+                    print(f"   {pos['rid']}: {pos['from_tpl']} -> {pos['to_tpl']} ({pos['lat']}, {pos['lon']}) - {pos['state']} @ {pos['updated_at']}")
             else:
                 print("\n❌ 没有火车位置数据")
             
@@ -60,7 +66,7 @@ def check_api_status():
     """检查API状态"""
     try:
         # 检查统计信息
-        response = requests.get("http://localhost:8000/debug/stats", timeout=5)
+        response = session.get("http://localhost:8000/debug/stats", timeout=5)
         if response.status_code == 200:
             stats = response.json()
             print("\n📡 API统计:")
@@ -74,7 +80,7 @@ def check_api_status():
                 print(f"   最后错误: {stats['last_error']}")
         
         # 检查位置端点
-        response = requests.get("http://localhost:8000/positions", timeout=5)
+        response = session.get("http://localhost:8000/positions", timeout=5)
         if response.status_code == 200:
             positions = response.json()
             print(f"\n🎯 位置端点: 返回 {len(positions)} 个位置")
@@ -97,7 +103,7 @@ def check_tiploc_coverage():
     """检查TIPLOC覆盖率"""
     try:
         # 获取最后的载荷数据
-        response = requests.get("http://localhost:8000/debug/last-payload", timeout=5)
+        response = session.get("http://localhost:8000/debug/last-payload", timeout=5)
         if response.status_code == 200:
             payload = response.json()
             
@@ -119,16 +125,20 @@ def check_tiploc_coverage():
             
             if tiplocs:
                 # 检查这些TIPLOC是否有坐标
+                sample = list(tiplocs)[:10]  # 检查前10个
+                placeholders = ",".join("?" * len(sample))
                 with sqlite3.connect("train_positions.db") as conn:
+                    cursor = conn.execute(
+                        f"SELECT tiploc, lat, lon FROM tiploc_coords WHERE tiploc IN ({placeholders}) AND lat IS NOT NULL AND lon IS NOT NULL",
+                        tuple(sample)
+                    )
+                    coords = {tpl: (lat, lon) for tpl, lat, lon in cursor.fetchall()}
+                    
                     found_coords = 0
                     missing_tiplocs = []
                     
-                    for tiploc in list(tiplocs)[:10]:  # 检查前10个
-                        cursor = conn.execute(
-                            "SELECT lat, lon FROM tiploc_coords WHERE tiploc = ? AND lat IS NOT NULL AND lon IS NOT NULL",
-                            (tiploc,)
-                        )
-                        result = cursor.fetchone()
+                    for tiploc in sample:
+                        result = coords.get(tiploc)
                         
                         if result:
                             found_coords += 1
@@ -137,7 +147,7 @@ def check_tiploc_coverage():
                             missing_tiplocs.append(tiploc)
                             print(f"   ❌ {tiploc}: 无坐标")
                     
-                    print(f"\n📈 坐标覆盖率: {found_coords}/{len(list(tiplocs)[:10])} (样本)")
+                    print(f"\n📈 坐标覆盖率: {found_coords}/{len(sample)} (样本)")
                     
                     if missing_tiplocs:
                         print(f"\n🔍 缺少坐标的TIPLOC示例: {missing_tiplocs[:5]}")
@@ -8,180 +8,262 @@ import sqlite3
 import requests
 import json
 import csv
+from datetime import datetime, timezone
 from pathlib import Path
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# 英国火车站数据，导入时构建一次
+_UK_STATIONS = (
+    # 主要城市和重要车站
+    ("LONDON", 51.5074, -0.1278, "London", "major"),
+    ("BRMNGM", 52.4862, -1.8904, "Birmingham", "major"),
+    ("MNCHSTR", 53.4808, -2.2426, "Manchester", "major"),
+    ("EDINBGH", 55.9533, -3.1883, "Edinburgh", "major"),
+    ("GLGW", 55.8642, -4.2518, "Glasgow", "major"),
+    ("KNGX", 51.5308, -0.1238, "Kings Cross", "major"),
+    ("EUSTON", 51.5282, -0.1337, "Euston", "major"),
+    ("PADTON", 51.5154, -0.1755, "Paddington", "major"),
+    ("VICTRIC", 51.4952, -0.1441, "Victoria", "major"),
+    ("WLOO", 51.5031, -0.1132, "Waterloo", "major"),
+    ("STPANCI", 51.5308, -0.1260, "St Pancras", "major"),
+    ("MARYLBN", 51.5226, -0.1633, "Marylebone", "major"),
+
+    # 重要区域中心
+    ("LEEDS", 53.7957, -1.5491, "Leeds", "regional"),
+    ("SHEFFLD", 53.3781, -1.4896, "Sheffield", "regional"),
+    ("NWCSTLE", 54.9689, -1.6176, "Newcastle", "regional"),
+    ("BRISTOL", 51.4491, -2.5820, "Bristol", "regional"),
+    ("CARDIFF", 51.4816, -3.1791, "Cardiff", "regional"),
+    ("NOTTGHM", 52.9476, -1.1461, "Nottingham", "regional"),
+    ("LEICSTR", 52.6309, -1.1238, "Leicester", "regional"),
+    ("DERBY", 52.9225, -1.4761, "Derby", "regional"),
+    ("YORK", 53.9576, -1.0827, "York", "regional"),
+    ("BATH", 51.3781, -2.3597, "Bath", "regional"),
+    ("EXETER", 50.7236, -3.5269, "Exeter", "regional"),
+    ("PLYMOUTH", 50.3755, -4.1427, "Plymouth", "regional"),
+    ("BRIGHTON", 50.8429, -0.1313, "Brighton", "regional"),
+
+    # 伦敦周边重要站点
+    ("CROYDON", 51.3762, -0.0982, "Croydon", "suburban"),
+    ("WIMBLDON", 51.4214, -0.2064, "Wimbledon", "suburban"),
+    ("CLAPHAM", 51.4640, -0.1700, "Clapham Junction", "suburban"),
+    ("VAUXHALL", 51.4861, -0.1253, "Vauxhall", "suburban"),
+    ("STRATFD", 51.5418, -0.0030, "Stratford", "suburban"),
+    ("CANARY", 51.5054, -0.0235, "Canary Wharf", "suburban"),
+
+    # 机场
+    ("HEATHROW", 51.4700, -0.4543, "Heathrow Airport", "airport"),
+    ("GATWICK", 51.1537, -0.1821, "Gatwick Airport", "airport"),
+    ("STANSTED", 51.8860, 0.2388, "Stansted Airport", "airport"),
+
+    # 其他重要城市
+    ("READING", 51.4584, -0.9738, "Reading", "regional"),
+    ("OXFORD", 51.7535, -1.2700, "Oxford", "regional"),
+    ("CAMBRIDGE", 52.1951, 0.1313, "Cambridge", "regional"),
+    ("CANTERBY", 51.2740, 1.0870, "Canterbury", "regional"),
+    ("DOVER", 51.1295, 1.3089, "Dover", "regional"),
+    ("PORTSMOUTH", 50.7984, -1.0916, "Portsmouth", "regional"),
+    ("SOUTHAMPTON", 50.9097, -1.4044, "Southampton", "regional"),
+    ("BOURNEMOUTH", 50.7192, -1.8808, "Bournemouth", "regional"),
+
+    # 苏格兰主要城市
+    ("ABERDEEN", 57.1497, -2.0943, "Aberdeen", "regional"),
+    ("DUNDEE", 56.4620, -2.9707, "Dundee", "regional"),
+    ("STIRLING", 56.1165, -3.9369, "Stirling", "regional"),
+    ("PERTH", 56.3951, -3.4313, "Perth", "regional"),
+    ("INVERNESS", 57.4778, -4.2247, "Inverness", "regional"),
+
+    # 威尔士主要城市
+    ("SWANSEA", 51.6214, -3.9436, "Swansea", "regional"),
+    ("NEWPORT", 51.5842, -2.9977, "Newport", "regional"),
+    ("WREXHAM", 53.0478, -2.9916, "Wrexham", "regional"),
+
+    # 北爱尔兰
+    ("BELFAST", 54.5973, -5.9301, "Belfast", "regional"),
+
+    # 常见的TIPLOC代码映射
+    ("DRBY", 52.9225, -1.4761, "Derby", "regional"),
+    ("NTTNGM", 52.9476, -1.1461, "Nottingham", "regional"),
+    ("LCSTR", 52.6309, -1.1238, "Leicester", "regional"),
+    ("RDNG", 51.4584, -0.9738, "Reading", "regional"),
+    ("OXFD", 51.7535, -1.2700, "Oxford", "regional"),
+    ("CMBDG", 52.1951, 0.1313, "Cambridge", "regional"),
+    ("BRSTL", 51.4491, -2.5820, "Bristol", "regional"),
+    ("CRDF", 51.4816, -3.1791, "Cardiff", "regional"),
+    ("BTON", 50.8429, -0.1313, "Brighton", "regional"),
+    ("SOTON", 50.9097, -1.4044, "Southampton", "regional"),
+    ("PMTH", 50.7984, -1.0916, "Portsmouth", "regional"),
+
+    # 更多TIPLOC映射
+    ("CLPHMJC", 51.4640, -0.1700, "Clapham Junction", "suburban"),
+    ("VAUXHLM", 51.4861, -0.1253, "Vauxhall", "suburban"),
+    ("WATRLMN", 51.5031, -0.1132, "Waterloo", "major"),
+    ("LIVST", 51.5154, -0.0811, "Liverpool Street", "major"),
+    ("BONDST", 51.5154, -0.1396, "Bond Street", "suburban"),
+    ("TOTCTRD", 51.5164, -0.1311, "Tottenham Court Road", "suburban"),
+    ("OXFRDCR", 51.5154, -0.1415, "Oxford Circus", "suburban"),
+)
+
+# 从日志中提取的常见TIPLOC
+_ADDITIONAL_TIPLOCS = (
+    ("TOTNES", 50.4319, -3.6857, "Totnes", "local"),
+    ("CHINGFD", 51.6329, 0.0091, "Chingford", "local"),
+    ("FSHBORN", 51.4647, -0.0550, "Fishersgate", "local"),
+    ("GTWK", 51.1537, -0.1821, "Gatwick", "airport"),
+    ("ORELPKH", 51.4647, -0.0550, "Orrell Park", "local"),
+    ("SHBRYNS", 52.8070, -2.7581, "Shrewsbury", "regional"),
+    ("EBSFLTI", 51.4647, -0.0550, "Ebbsfleet", "local"),
+    ("NTNG", 52.9476, -1.1461, "Nottingham", "regional"),
+    ("DARTFD", 51.4467, 0.2274, "Dartford", "local"),
+    ("ORPNGTN", 51.3730, 0.0991, "Orpington", "local"),
+    ("STEVNGE", 51.9020, -0.2024, "Stevenage", "local"),
+    ("RADLETT", 51.6929, -0.3200, "Radlett", "local"),
+    ("BROXBRN", 51.7479, -0.0199, "Broxbourne", "local"),
+    ("RUGBY", 52.3707, -1.2634, "Rugby", "regional"),
+    ("HATFILD", 51.7632, -0.2307, "Hatfield", "local"),
+    ("HASTING", 50.8540, 0.5737, "Hastings", "regional"),
+    ("BALHAM", 51.4431, -0.1525, "Balham", "suburban"),
+    ("ABRCYNS", 51.4647, -0.0550, "Abercynon", "local"),
+    ("BARRYIS", 51.3990, -3.2677, "Barry Island", "local"),
+    ("DUNBAR", 56.0024, -2.5158, "Dunbar", "local"),
+    ("BATRSPK", 51.5282, -0.1337, "Battersea Park", "suburban"),
+    ("BISLND", 51.4647, -0.0550, "Bishop's Stortford", "local"),
+    ("BRKNHDP", 51.4647, -0.0550, "Birkenhead Park", "local"),
+    ("NWCROSS", 51.4647, -0.0550, "New Cross", "suburban"),
+    ("POLMONT", 55.9875, -3.7129, "Polmont", "local"),
+    ("LETHRHD", 51.2983, -0.3312, "Leatherhead", "local"),
+    ("UNVRSYB", 52.4862, -1.8904, "University", "local"),
+    ("HIGHBYA", 51.4647, -0.0550, "Highbury & Islington", "suburban"),
+    ("HAMTSQ", 51.4647, -0.0550, "Hampstead", "suburban"),
+    ("CORBY", 52.4888, -0.6943, "Corby", "local"),
+    ("BLKHTH", 51.4647, -0.0550, "Blackheath", "suburban"),
+    ("MBRK", 51.4647, -0.0550, "Marble Arch", "suburban"),
+    ("LNGEATN", 52.8956, -1.2047, "Long Eaton", "local"),
+    ("ELTHAM", 51.4522, 0.0706, "Eltham", "suburban"),
+    ("BOMO", 50.7192, -1.8808, "Bournemouth", "regional"),
+    ("BRACKNL", 51.4134, -0.7536, "Bracknell", "local"),
+    ("ELGH", 51.4647, -0.0550, "Elephant & Castle", "suburban"),
+    ("GIPSYH", 51.4647, -0.0550, "Gipsy Hill", "suburban"),
+    ("HLDNBRO", 51.4647, -0.0550, "Holden", "local"),
+    ("RBRTSBD", 51.4647, -0.0550, "Robertsbridge", "local"),
+    ("EBOURNE", 50.8429, -0.1313, "Eastbourne", "regional"),
+    ("SVNOAKS", 51.2759, 0.1896, "Sevenoaks", "local"),
+    ("STFORDI", 51.4647, -0.0550, "Stratford International", "suburban"),
+)
+
+_ALL_STATIONS = _UK_STATIONS + _ADDITIONAL_TIPLOCS
+
+# 导入时检查TIPLOC重复，避免同一站点被写入两次且坐标互相覆盖
+assert len({row[0] for row in _ALL_STATIONS}) == len(_ALL_STATIONS), "TIPLOC坐标表存在重复的TIPLOC"
+
+# 静态站点数据写成单条多行VALUES语句，导入时构建一次；第一个参数为updated_at
+_BULK_SQL = (
+    "INSERT INTO tiploc_coords (tiploc, lat, lon, name, source, updated_at) "
+    "SELECT column1, column2, column3, column4, column5, ? FROM (VALUES "
+    + ",".join(["(?, ?, ?, ?, ?)"] * len(_ALL_STATIONS))
+    + ") WHERE true "
+    # 冲突时原地更新、保留rowid，R*Tree由UPDATE触发器同步
+    "ON CONFLICT(tiploc) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, "
+    "name = excluded.name, source = excluded.source, updated_at = excluded.updated_at"
+)
+# 英国中心坐标，无法估算时的默认值
+_DEFAULT_COORDS = (52.5, -1.5)
+# 估算坐标时参与加权的近邻站点数
+KNN_K = 5
+# 名称相似判定所需的最短TIPLOC前缀
+_PREFIX_MIN = 3
+_EARTH_RADIUS_KM = 6371.0
+# 近邻查询时R*Tree包围盒的半宽（度）
+BBOX_DEGREES = 0.5
+
+# tiploc_coords的R*Tree影子表，由触发器随主表同步
+_RTREE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tiploc_rtree USING rtree(id, minLat, maxLat, minLon, maxLon)",
+    # 旧版BEFORE INSERT触发器在INSERT OR IGNORE被忽略时也会删除R*Tree条目，已废弃。
+    # 写入方统一用ON CONFLICT DO UPDATE保留rowid；INSERT OR REPLACE删除旧行时不触发
+    # DELETE触发器，残留的旧rowid不会与主表连接，并由_ensure_rtree的计数校验清理
+    "DROP TRIGGER IF EXISTS tiploc_rtree_bi",
+    """CREATE TRIGGER IF NOT EXISTS tiploc_rtree_ai AFTER INSERT ON tiploc_coords
+    WHEN NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL BEGIN
+        INSERT OR REPLACE INTO tiploc_rtree VALUES (NEW.rowid, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tiploc_rtree_au AFTER UPDATE OF lat, lon ON tiploc_coords BEGIN
+        DELETE FROM tiploc_rtree WHERE id = OLD.rowid;
+        INSERT INTO tiploc_rtree SELECT NEW.rowid, NEW.lat, NEW.lat, NEW.lon, NEW.lon
+        WHERE NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tiploc_rtree_ad AFTER DELETE ON tiploc_coords BEGIN
+        DELETE FROM tiploc_rtree WHERE id = OLD.rowid;
+    END""",
+)
+
+_NEARBY_SQL = """
+    SELECT t.lat, t.lon FROM tiploc_coords t JOIN tiploc_rtree r ON t.rowid = r.id
+    WHERE r.minLat >= ? AND r.maxLat <= ? AND r.minLon >= ? AND r.maxLon <= ?
+"""
+
+def _knn_haversine(lat0, lon0, lat, lon, k):
+    """计算(lat0, lon0)到所有站点的Haversine距离，返回k个最近站点的反距离加权坐标"""
+    rlat0, rlon0 = np.radians(lat0), np.radians(lon0)
+    rlat, rlon = np.radians(lat), np.radians(lon)
+    a = (np.sin((rlat - rlat0) / 2) ** 2
+         + np.cos(rlat0) * np.cos(rlat) * np.sin((rlon - rlon0) / 2) ** 2)
+    dist = 2 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    
+    if k < len(dist):
+        idx = np.argpartition(dist, k - 1)[:k]
+    else:
+        idx = np.arange(len(dist))
+    weights = 1.0 / (dist[idx] + 1e-3)
+    return (float(np.average(lat[idx], weights=weights)),
+            float(np.average(lon[idx], weights=weights)))
+
+_BULK_PARAMS = tuple(
+    v
+    for tiploc, lat, lon, name, category in _ALL_STATIONS
+    for v in (tiploc, lat, lon, name, f"manual_{category}")
+)
+
 class TiplocDataLoader:
-    def __init__(self, db_path="train_positions.db"):
+    def __init__(self, db_path="train_positions.db", conn=None):
         self.db_path = db_path
+        # 外部传入的共享连接（已设置PRAGMA），为None时每次操作自行打开
+        self._shared_conn = conn
+        self._rtree_ready = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并设置PRAGMA；有共享连接时直接复用"""
+        if self._shared_conn is not None:
+            return self._shared_conn
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
         
     def load_uk_stations_data(self):
         """加载英国火车站数据"""
-        stations_data = [
-            # 主要城市和重要车站
-            ("LONDON", 51.5074, -0.1278, "London", "major"),
-            ("BRMNGM", 52.4862, -1.8904, "Birmingham", "major"),
-            ("MNCHSTR", 53.4808, -2.2426, "Manchester", "major"),
-            ("EDINBGH", 55.9533, -3.1883, "Edinburgh", "major"),
-            ("GLGW", 55.8642, -4.2518, "Glasgow", "major"),
-            ("LIVST", 53.4084, -2.9916, "Liverpool Street", "major"),
-            ("KNGX", 51.5308, -0.1238, "Kings Cross", "major"),
-            ("EUSTON", 51.5282, -0.1337, "Euston", "major"),
-            ("PADTON", 51.5154, -0.1755, "Paddington", "major"),
-            ("VICTRIC", 51.4952, -0.1441, "Victoria", "major"),
-            ("WLOO", 51.5031, -0.1132, "Waterloo", "major"),
-            ("STPANCI", 51.5308, -0.1260, "St Pancras", "major"),
-            ("MARYLBN", 51.5226, -0.1633, "Marylebone", "major"),
-            
-            # 重要区域中心
-            ("LEEDS", 53.7957, -1.5491, "Leeds", "regional"),
-            ("SHEFFLD", 53.3781, -1.4896, "Sheffield", "regional"),
-            ("NWCSTLE", 54.9689, -1.6176, "Newcastle", "regional"),
-            ("BRISTOL", 51.4491, -2.5820, "Bristol", "regional"),
-            ("CARDIFF", 51.4816, -3.1791, "Cardiff", "regional"),
-            ("NOTTGHM", 52.9476, -1.1461, "Nottingham", "regional"),
-            ("LEICSTR", 52.6309, -1.1238, "Leicester", "regional"),
-            ("DERBY", 52.9225, -1.4761, "Derby", "regional"),
-            ("YORK", 53.9576, -1.0827, "York", "regional"),
-            ("BATH", 51.3781, -2.3597, "Bath", "regional"),
-            ("EXETER", 50.7236, -3.5269, "Exeter", "regional"),
-            ("PLYMOUTH", 50.3755, -4.1427, "Plymouth", "regional"),
-            ("BRIGHTON", 50.8429, -0.1313, "Brighton", "regional"),
-            
-            # 伦敦周边重要站点
-            ("CROYDON", 51.3762, -0.0982, "Croydon", "suburban"),
-            ("WIMBLDON", 51.4214, -0.2064, "Wimbledon", "suburban"),
-            ("CLAPHAM", 51.4640, -0.1700, "Clapham Junction", "suburban"),
-            ("VAUXHALL", 51.4861, -0.1253, "Vauxhall", "suburban"),
-            ("STRATFD", 51.5418, -0.0030, "Stratford", "suburban"),
-            ("CANARY", 51.5054, -0.0235, "Canary Wharf", "suburban"),
-            
-            # 机场
-            ("HEATHROW", 51.4700, -0.4543, "Heathrow Airport", "airport"),
-            ("GATWICK", 51.1537, -0.1821, "Gatwick Airport", "airport"),
-            ("STANSTED", 51.8860, 0.2388, "Stansted Airport", "airport"),
-            
-            # 其他重要城市
-            ("READING", 51.4584, -0.9738, "Reading", "regional"),
-            ("OXFORD", 51.7535, -1.2700, "Oxford", "regional"),
-            ("CAMBRIDGE", 52.1951, 0.1313, "Cambridge", "regional"),
-            ("CANTERBY", 51.2740, 1.0870, "Canterbury", "regional"),
-            ("DOVER", 51.1295, 1.3089, "Dover", "regional"),
-            ("PORTSMOUTH", 50.7984, -1.0916, "Portsmouth", "regional"),
-            ("SOUTHAMPTON", 50.9097, -1.4044, "Southampton", "regional"),
-            ("BOURNEMOUTH", 50.7192, -1.8808, "Bournemouth", "regional"),
-            
-            # 苏格兰主要城市
-            ("ABERDEEN", 57.1497, -2.0943, "Aberdeen", "regional"),
-            ("DUNDEE", 56.4620, -2.9707, "Dundee", "regional"),
-            ("STIRLING", 56.1165, -3.9369, "Stirling", "regional"),
-            ("PERTH", 56.3951, -3.4313, "Perth", "regional"),
-            ("INVERNESS", 57.4778, -4.2247, "Inverness", "regional"),
-            
-            # 威尔士主要城市
-            ("SWANSEA", 51.6214, -3.9436, "Swansea", "regional"),
-            ("NEWPORT", 51.5842, -2.9977, "Newport", "regional"),
-            ("WREXHAM", 53.0478, -2.9916, "Wrexham", "regional"),
-            
-            # 北爱尔兰
-            ("BELFAST", 54.5973, -5.9301, "Belfast", "regional"),
-            
-            # 常见的TIPLOC代码映射
-            ("DRBY", 52.9225, -1.4761, "Derby", "regional"),
-            ("NTTNGM", 52.9476, -1.1461, "Nottingham", "regional"),
-            ("LCSTR", 52.6309, -1.1238, "Leicester", "regional"),
-            ("RDNG", 51.4584, -0.9738, "Reading", "regional"),
-            ("OXFD", 51.7535, -1.2700, "Oxford", "regional"),
-            ("CMBDG", 52.1951, 0.1313, "Cambridge", "regional"),
-            ("BRSTL", 51.4491, -2.5820, "Bristol", "regional"),
-            ("CRDF", 51.4816, -3.1791, "Cardiff", "regional"),
-            ("BTON", 50.8429, -0.1313, "Brighton", "regional"),
-            ("SOTON", 50.9097, -1.4044, "Southampton", "regional"),
-            ("PMTH", 50.7984, -1.0916, "Portsmouth", "regional"),
-            
-            # 更多TIPLOC映射
-            ("CLPHMJC", 51.4640, -0.1700, "Clapham Junction", "suburban"),
-            ("VAUXHLM", 51.4861, -0.1253, "Vauxhall", "suburban"),
-            ("WATRLMN", 51.5031, -0.1132, "Waterloo", "major"),
-            ("LIVST", 51.5154, -0.0811, "Liverpool Street", "major"),
-            ("BONDST", 51.5154, -0.1396, "Bond Street", "suburban"),
-            ("TOTCTRD", 51.5164, -0.1311, "Tottenham Court Road", "suburban"),
-            ("OXFRDCR", 51.5154, -0.1415, "Oxford Circus", "suburban"),
-        ]
-        
-        return stations_data
+        return _UK_STATIONS
     
     def load_additional_tiplocs(self):
         """加载额外的TIPLOC数据"""
-        # 从日志中提取的常见TIPLOC
-        additional_tiplocs = [
-            ("TOTNES", 50.4319, -3.6857, "Totnes", "local"),
-            ("CHINGFD", 51.6329, 0.0091, "Chingford", "local"),
-            ("FSHBORN", 51.4647, -0.0550, "Fishersgate", "local"),
-            ("GTWK", 51.1537, -0.1821, "Gatwick", "airport"),
-            ("ORELPKH", 51.4647, -0.0550, "Orrell Park", "local"),
-            ("SHBRYNS", 52.8070, -2.7581, "Shrewsbury", "regional"),
-            ("EBSFLTI", 51.4647, -0.0550, "Ebbsfleet", "local"),
-            ("NTNG", 52.9476, -1.1461, "Nottingham", "regional"),
-            ("DARTFD", 51.4467, 0.2274, "Dartford", "local"),
-            ("ORPNGTN", 51.3730, 0.0991, "Orpington", "local"),
-            ("STEVNGE", 51.9020, -0.2024, "Stevenage", "local"),
-            ("RADLETT", 51.6929, -0.3200, "Radlett", "local"),
-            ("BROXBRN", 51.7479, -0.0199, "Broxbourne", "local"),
-            ("RUGBY", 52.3707, -1.2634, "Rugby", "regional"),
-            ("HATFILD", 51.7632, -0.2307, "Hatfield", "local"),
-            ("HASTING", 50.8540, 0.5737, "Hastings", "regional"),
-            ("BALHAM", 51.4431, -0.1525, "Balham", "suburban"),
-            ("ABRCYNS", 51.4647, -0.0550, "Abercynon", "local"),
-            ("BARRYIS", 51.3990, -3.2677, "Barry Island", "local"),
-            ("DUNBAR", 56.0024, -2.5158, "Dunbar", "local"),
-            ("BATRSPK", 51.5282, -0.1337, "Battersea Park", "suburban"),
-            ("BISLND", 51.4647, -0.0550, "Bishop's Stortford", "local"),
-            ("BRKNHDP", 51.4647, -0.0550, "Birkenhead Park", "local"),
-            ("NWCROSS", 51.4647, -0.0550, "New Cross", "suburban"),
-            ("POLMONT", 55.9875, -3.7129, "Polmont", "local"),
-            ("LETHRHD", 51.2983, -0.3312, "Leatherhead", "local"),
-            ("UNVRSYB", 52.4862, -1.8904, "University", "local"),
-            ("HIGHBYA", 51.4647, -0.0550, "Highbury & Islington", "suburban"),
-            ("HAMTSQ", 51.4647, -0.0550, "Hampstead", "suburban"),
-            ("CORBY", 52.4888, -0.6943, "Corby", "local"),
-            ("BLKHTH", 51.4647, -0.0550, "Blackheath", "suburban"),
-            ("MBRK", 51.4647, -0.0550, "Marble Arch", "suburban"),
-            ("LNGEATN", 52.8956, -1.2047, "Long Eaton", "local"),
-            ("ELTHAM", 51.4522, 0.0706, "Eltham", "suburban"),
-            ("BOMO", 50.7192, -1.8808, "Bournemouth", "regional"),
-            ("BRACKNL", 51.4134, -0.7536, "Bracknell", "local"),
-            ("ELGH", 51.4647, -0.0550, "Elephant & Castle", "suburban"),
-            ("GIPSYH", 51.4647, -0.0550, "Gipsy Hill", "suburban"),
-            ("HLDNBRO", 51.4647, -0.0550, "Holden", "local"),
-            ("RBRTSBD", 51.4647, -0.0550, "Robertsbridge", "local"),
-            ("EBOURNE", 50.8429, -0.1313, "Eastbourne", "regional"),
-            ("SVNOAKS", 51.2759, 0.1896, "Sevenoaks", "local"),
-            ("STFORDI", 51.4647, -0.0550, "Stratford International", "suburban"),
-        ]
-        
-        return additional_tiplocs
+        return _ADDITIONAL_TIPLOCS
     
     def update_database(self):
         """更新数据库中的TIPLOC坐标"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # 加载主要站点数据
-                main_stations = self.load_uk_stations_data()
-                additional_stations = self.load_additional_tiplocs()
+            with self._connect() as conn:
+                self._ensure_rtree(conn)
                 
-                all_stations = main_stations + additional_stations
-                
-                updated_count = 0
-                for tiploc, lat, lon, name, category in all_stations:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO tiploc_coords 
-                        (tiploc, lat, lon, name, source, updated_at)
-                        VALUES (?, ?, ?, ?, ?, datetime('now'))
-                    """, (tiploc, lat, lon, name, f"manual_{category}"))
-                    updated_count += 1
+                # 时间戳只计算一次，所有行由一条语句写入
+                now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                conn.execute(_BULK_SQL, (now,) + _BULK_PARAMS)
+                updated_count = len(_ALL_STATIONS)
                 
                 logger.info(f"更新了 {updated_count} 个TIPLOC坐标")
                 return updated_count
@@ -193,7 +275,7 @@ class TiplocDataLoader:
     def get_missing_tiplocs(self, limit=50):
         """获取缺少坐标的TIPLOC列表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 # 从最近的错误日志中提取缺少的TIPLOC
                 # 这里我们返回一些常见的缺少坐标的TIPLOC
                 cursor = conn.execute("""
@@ -208,16 +290,76 @@ class TiplocDataLoader:
             logger.error(f"获取缺少TIPLOC失败: {e}")
             return []
     
+    def _ensure_rtree(self, conn):
+        """创建tiploc_coords的R*Tree索引及同步触发器，首次创建时批量填充"""
+        if self._rtree_ready:
+            return
+        
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tiploc_coords)")}
+        if 'tiploc' not in columns:
+            return
+        
+        for statement in _RTREE_SCHEMA:
+            conn.execute(statement)
+        # 首次创建或与主表不一致（旧版触发器丢失过条目）时整体重建
+        indexed, expected = conn.execute("""
+            SELECT (SELECT COUNT(*) FROM tiploc_rtree),
+                   (SELECT COUNT(*) FROM tiploc_coords WHERE lat IS NOT NULL AND lon IS NOT NULL)
+        """).fetchone()
+        if indexed != expected:
+            conn.execute("DELETE FROM tiploc_rtree")
+            conn.execute("""
+                INSERT INTO tiploc_rtree
+                SELECT rowid, lat, lat, lon, lon FROM tiploc_coords
+                WHERE lat IS NOT NULL AND lon IS NOT NULL
+            """)
+        self._rtree_ready = True
+    
     def estimate_coordinates_from_nearby(self, tiploc):
         """基于附近已知站点估算坐标"""
-        # 这是一个简化的实现，实际中可以使用更复杂的算法
-        # 比如基于TIPLOC名称相似性或地理区域
+        if not tiploc:
+            return _DEFAULT_COORDS
+        
+        try:
+            with self._connect() as conn:
+                self._ensure_rtree(conn)
+                
+                row = conn.execute("""
+                    SELECT lat, lon FROM tiploc_coords
+                    WHERE tiploc = ? AND lat IS NOT NULL AND lon IS NOT NULL
+                """, (tiploc,)).fetchone()
+                if row:
+                    return row
+                
+                # 以名称前缀最长匹配的已知TIPLOC质心作为初始位置，前缀范围走主键索引
+                for n in range(len(tiploc) - 1, _PREFIX_MIN - 1, -1):
+                    prefix = tiploc[:n]
+                    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                    lat0, lon0 = conn.execute("""
+                        SELECT AVG(lat), AVG(lon) FROM tiploc_coords
+                        WHERE tiploc >= ? AND tiploc < ? AND lat IS NOT NULL AND lon IS NOT NULL
+                    """, (prefix, upper)).fetchone()
+                    if lat0 is not None:
+                        break
+                else:
+                    return _DEFAULT_COORDS
+                
+                # R*Tree取质心附近包围盒内的站点，再计算精确距离
+                hits = conn.execute(_NEARBY_SQL, (
+                    lat0 - BBOX_DEGREES, lat0 + BBOX_DEGREES,
+                    lon0 - BBOX_DEGREES, lon0 + BBOX_DEGREES,
+                )).fetchall()
+        except Exception as e:
+            logger.error(f"估算TIPLOC坐标失败 {tiploc}: {e}")
+            return _DEFAULT_COORDS
         
-        # 默认坐标（英国中心）
-        default_coords = (52.5, -1.5)
+        if not hits:
+            return (lat0, lon0)
         
-        # 可以添加更智能的估算逻辑
-        return default_coords
+        lat = np.asarray([h[0] for h in hits], dtype=np.float32)
+        lon = np.asarray([h[1] for h in hits], dtype=np.float32)
+        # 对质心附近的k个已知站点做反距离加权
+        return _knn_haversine(lat0, lon0, lat, lon, KNN_K)
 
 def main():
     """主函数"""
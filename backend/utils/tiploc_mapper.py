@@ -4,205 +4,342 @@ CRS到TIPLOC代码映射系统
 将stations.json中的CRS代码映射到Darwin实时数据中的TIPLOC代码
 """
 
-import json
+import os
+import re
+from functools import lru_cache
 import sqlite3
+import orjson
+from datetime import datetime, timezone
 from pathlib import Path
 import logging
 
+try:
+    import ijson  # 可选依赖，仅用于流式解析大文件
+except ImportError:
+    ijson = None
+
 logger = logging.getLogger(__name__)
 
+# 超过该大小的stations.json改为流式解析；小文件整体用orjson解析更快
+STREAM_THRESHOLD = 4 * 1024 * 1024
+# 写入暂存表的默认批大小
+MAPPING_BATCH_SIZE = 5000
+
+# 常见的CRS到TIPLOC映射，每个CRS只出现一次
+_CRS_TIPLOC_PAIRS = (
+    # 主要伦敦车站
+    ("PAD", "PADTON"),    # Paddington
+    ("VIC", "VICTRIC"),   # Victoria
+    ("WAT", "WATRLMN"),   # Waterloo
+    ("LST", "LIVST"),     # Liverpool Street
+    ("KGX", "KNGX"),      # Kings Cross
+    ("EUS", "EUSTON"),    # Euston
+    ("STP", "STPANCI"),   # St Pancras
+    ("MYB", "MARYLBN"),   # Marylebone
+    ("CHX", "CHARING"),   # Charing Cross
+    ("LBG", "LNDNBDG"),   # London Bridge
+    ("FST", "FENCHST"),   # Fenchurch Street
+    ("MOG", "MOORGATE"),  # Moorgate
+
+    # 主要城市
+    ("BHM", "BRMNGM"),    # Birmingham New Street
+    ("MAN", "MNCHSTR"),   # Manchester
+    ("EDB", "EDINBGH"),   # Edinburgh
+    ("GLC", "GLGW"),      # Glasgow Central
+    ("LIV", "LVRPLCH"),   # Liverpool
+    ("LEE", "LEEDS"),     # Leeds
+    ("SHF", "SHEFFLD"),   # Sheffield
+    ("NCL", "NWCSTLE"),   # Newcastle
+    ("BRI", "BRISTOL"),   # Bristol
+    ("CDF", "CRDFCEN"),   # Cardiff Central
+    ("NOT", "NOTTGHM"),   # Nottingham
+    ("LEI", "LEICSTR"),   # Leicester
+    ("DBY", "DRBY"),      # Derby
+    ("YRK", "YORK"),      # York
+    ("BTH", "BATH"),      # Bath Spa
+    ("EXD", "EXETER"),    # Exeter
+    ("PLY", "PLYMOUTH"),  # Plymouth
+    ("BTN", "BRIGHTON"),  # Brighton
+    ("RDG", "RDNG"),      # Reading
+    ("OXF", "OXFD"),      # Oxford
+    ("CBG", "CMBDG"),     # Cambridge
+
+    # 伦敦周边重要站点
+    ("CLJ", "CLPHMJC"),   # Clapham Junction
+    ("VXH", "VAUXHLM"),   # Vauxhall
+    ("SRA", "STRATFD"),   # Stratford
+    ("CRO", "CROYDON"),   # Croydon
+    ("WIM", "WIMBLDON"),  # Wimbledon
+    ("EPH", "ELPHNAC"),   # Elephant & Castle
+    ("BAL", "BALHAM"),    # Balham
+    ("PUT", "PUTNEY"),    # Putney
+    ("RMD", "RICHMOND"),  # Richmond
+    ("KTN", "KTON"),      # Kingston
+    ("SUR", "SURBITON"),  # Surbiton
+    ("WOK", "WOKING"),    # Woking
+    ("GLD", "GUILDFD"),   # Guildford
+
+    # 机场
+    ("LHR", "HROW"),      # Heathrow
+    ("LGW", "GTWK"),      # Gatwick
+    ("STN", "STANSTED"),  # Stansted
+
+    # 其他重要站点
+    ("SOT", "SOTON"),     # Southampton
+    ("PMS", "PMTH"),      # Portsmouth
+    ("BOH", "BOMO"),      # Bournemouth
+    ("DOV", "DOVER"),     # Dover
+    ("CNT", "CANTERBY"),  # Canterbury
+    ("ASH", "ASHFORD"),   # Ashford
+    ("TON", "TUNBRIDGE"), # Tunbridge Wells
+    ("HAT", "HATFILD"),   # Hatfield
+    ("STE", "STEVNGE"),   # Stevenage
+    ("HIT", "HITCHIN"),   # Hitchin
+    ("LTN", "LUTON"),     # Luton
+    ("BDM", "BEDFORD"),   # Bedford
+    ("MKC", "MKCENTRL"),  # Milton Keynes Central
+    ("NTH", "NRTHMPTN"),  # Northampton
+    ("COV", "COVENTRY"),  # Coventry
+    ("WAR", "WARWICK"),   # Warwick
+    ("SAV", "STRATFRD"),  # Stratford-upon-Avon
+    ("WOR", "WORCSTR"),   # Worcester
+    ("HFD", "HEREFORD"),  # Hereford
+    ("SHR", "SHRWSBY"),   # Shrewsbury
+    ("CHE", "CHESTER"),   # Chester
+    ("CRE", "CREWE"),     # Crewe
+    ("STF", "STAFFRD"),   # Stafford
+    ("WVH", "WVRMPTN"),   # Wolverhampton
+    ("DUD", "DUDLEY"),    # Dudley
+    ("WSB", "WALSALL"),   # Walsall
+    ("TAM", "TAMWORTH"),  # Tamworth
+    ("LIC", "LICHFLD"),   # Lichfield
+    ("BUR", "BURTON"),    # Burton-on-Trent
+    ("UTT", "UTTOXTR"),   # Uttoxeter
+    ("STO", "STOKEOT"),   # Stoke-on-Trent
+    ("MAC", "MACCLES"),   # Macclesfield
+    ("STK", "STOCKPT"),   # Stockport
+    ("WGN", "WIGAN"),     # Wigan
+    ("PRE", "PRESTON"),   # Preston
+    ("BLK", "BLACKPL"),   # Blackpool
+    ("LAN", "LANCSTR"),   # Lancaster
+    ("OXN", "OXENHLM"),   # Oxenholme
+    ("KEN", "KENDAL"),    # Kendal
+    ("WIN", "WINDRMR"),   # Windermere
+    ("CAR", "CARLILE"),   # Carlisle
+    ("PEN", "PENRITH"),   # Penrith
+    ("APP", "APPLEBY"),   # Appleby
+    ("KIR", "KIRKBY"),    # Kirkby Stephen
+    ("GAR", "GARSDALE"),  # Garsdale
+    ("RIB", "RIBBLHD"),   # Ribblehead
+    ("HOR", "HORTON"),    # Horton-in-Ribblesdale
+    ("SET", "SETTLE"),    # Settle
+    ("GIG", "GIGGLES"),   # Giggleswick
+    ("LNG", "LONGPRT"),   # Long Preston
+    ("HEL", "HELLIFD"),   # Hellifield
+    ("GIS", "GISBURN"),   # Gisburn
+    ("CLI", "CLITHEROE"), # Clitheroe
+
+    # 苏格兰
+    ("ABD", "ABRDEEN"),   # Aberdeen
+    ("DND", "DUNDEE"),    # Dundee
+    ("STG", "STIRLING"),  # Stirling
+    ("PTH", "PERTH"),     # Perth
+    ("INV", "IVRNESS"),   # Inverness
+    ("KIL", "KILMRNCK"),  # Kilmarnock
+    ("AYR", "AYR"),       # Ayr
+    ("STR", "STRANRAR"),  # Stranraer
+    ("DUM", "DUMFRIES"),  # Dumfries
+    ("LOC", "LOCKERBY"),  # Lockerbie
+    ("MOF", "MOFFAT"),    # Moffat
+    ("BEA", "BEATTOCK"),  # Beattock
+    ("CRS", "CARSTAIRS"), # Carstairs
+    ("MOB", "MOTHERWELL"), # Motherwell
+    ("HAM", "HAMILTON"),  # Hamilton
+    ("LAR", "LARKHALL"),  # Larkhall
+    ("LNK", "LANARK"),    # Lanark
+
+    # 威尔士
+    ("SWA", "SWANSEA"),   # Swansea
+    ("NPT", "NEWPORT"),   # Newport
+    ("CWL", "CWMBRAN"),   # Cwmbran
+    ("ABG", "ABRGVNY"),   # Abergavenny
+    ("WRX", "WREXHAM"),   # Wrexham
+    ("RHY", "RHYL"),      # Rhyl
+    ("LLD", "LLANDNO"),   # Llandudno
+    ("BAN", "BANGOR"),    # Bangor
+    ("HOL", "HOLYHEAD"),  # Holyhead
+    ("PWL", "PWLLHELI"),  # Pwllheli
+    ("POR", "PORTHMD"),   # Porthmadog
+    ("FFE", "FFESTNG"),   # Ffestiniog
+    ("BLA", "BLAENAU"),   # Blaenau Ffestiniog
+    ("DOL", "DOLGELLY"),  # Dolgellau
+    ("MCN", "MACHYNL"),   # Machynlleth
+    ("ABE", "ABERYST"),   # Aberystwyth
+    ("FIS", "FISHGRD"),   # Fishguard
+    ("HAV", "HAVERFRD"),  # Haverfordwest
+    ("PEM", "PEMBROKE"),  # Pembroke
+    ("TEN", "TENBY"),     # Tenby
+    ("CMN", "CARMRHN"),   # Carmarthen
+    ("LLA", "LLANELLI"),  # Llanelli
+    ("NEA", "NEATH"),     # Neath
+    ("PTA", "PTALBOT"),   # Port Talbot
+    ("BGD", "BARGOED"),   # Bargoed
+    ("CAE", "CAERPHLY"),  # Caerphilly
+    ("PCD", "PENCOED"),   # Pencoed
+    ("BGN", "BRIDGND"),   # Bridgend
+    ("PYC", "PYCOMBE"),   # Pyle
+    ("CST", "COWBRG"),    # Cowbridge
+    ("RHO", "RHOOSE"),    # Rhoose
+    ("BRY", "BARRY"),     # Barry
+    ("BYI", "BARRYIS"),   # Barry Island
+    ("CDI", "CARDIFF"),   # Cardiff
+    ("CQU", "CRDFQUY"),   # Cardiff Queen Street
+    ("CBY", "CRDFBAY"),   # Cardiff Bay
+)
+
+# 导入时检查CRS重复，避免后出现的条目静默覆盖前面的映射
+assert len({crs for crs, _ in _CRS_TIPLOC_PAIRS}) == len(_CRS_TIPLOC_PAIRS), "CRS映射表存在重复的CRS代码"
+
+_CRS_TIPLOC_MAP = dict(_CRS_TIPLOC_PAIRS)
+
+# 从车站名称生成TIPLOC时一次性移除的词汇和字符
+_NAME_STRIP_RE = re.compile(r" STATION| CENTRAL| PARKWAY| INTERNATIONAL| AIRPORT| & |[-' ]")
+
+# 名称无法直接截断为TIPLOC的特殊情况
+_SPECIAL_TIPLOCS = {
+    "LONDON": "LONDON",
+    "BIRMINGHAM": "BRMNGM",
+    "MANCHESTER": "MNCHSTR",
+    "EDINBURGH": "EDINBGH",
+    "GLASGOW": "GLGW",
+    "LIVERPOOL": "LVRPL",
+    "SHEFFIELD": "SHEFFLD",
+    "NEWCASTLE": "NWCSTLE",
+    "NOTTINGHAM": "NOTTGHM",
+    "LEICESTER": "LEICSTR",
+    "COVENTRY": "COVNTRY",
+    "WOLVERHAMPTON": "WVRMPTN",
+    "SOUTHAMPTON": "SOTON",
+    "PORTSMOUTH": "PMTH",
+    "BOURNEMOUTH": "BOMO",
+    "BRIGHTON": "BRIGHTN",
+    "CANTERBURY": "CANTERBY",
+    "GLOUCESTER": "GLOSTER",
+    "WORCESTER": "WORCSTR",
+    "SHREWSBURY": "SHRWSBY",
+    "BLACKPOOL": "BLACKPL",
+    "LANCASTER": "LANCSTR",
+    "CARLISLE": "CARLILE",
+    "ABERDEEN": "ABRDEEN",
+    "INVERNESS": "IVRNESS",
+    "KILMARNOCK": "KILMRNCK",
+    "STRANRAER": "STRANRAR",
+    "DUMFRIES": "DUMFRIES",
+    "MOTHERWELL": "MOTHERWL",
+    "HAMILTON": "HAMILTON",
+}
+
+@lru_cache(maxsize=4096)
+def _generate_tiploc_from_name(station_name):
+    """从车站名称生成可能的TIPLOC代码，结果只依赖名称，按名称缓存"""
+    if not station_name:
+        return "UNKNOWN"
+
+    # 简化的TIPLOC生成规则：移除常见词汇和分隔符
+    name = _NAME_STRIP_RE.sub("", station_name.upper())
+
+    if name in _SPECIAL_TIPLOCS:
+        return _SPECIAL_TIPLOCS[name]
+
+    # 截断到7个字符（TIPLOC最大长度）
+    return name[:7]
+
 class CRSTiplocMapper:
-    def __init__(self, db_path="train_positions.db"):
+    MAPPING_TABLE_SQL = """
+        CREATE TABLE IF NOT EXISTS {schema}.crs_tiploc_mapping (
+            crs_code TEXT PRIMARY KEY,
+            tiploc_code TEXT,
+            station_name TEXT,
+            lat REAL,
+            lon REAL,
+            source TEXT,
+            updated_at TEXT
+        )
+    """
+    
+    # 更新或插入映射，缺失的站名和坐标保留已有值
+    UPSERT_MAPPING_SQL = """
+        INSERT INTO {target} 
+        (crs_code, tiploc_code, station_name, lat, lon, source, updated_at)
+        {source}
+        ON CONFLICT(crs_code) DO UPDATE SET
+            tiploc_code = excluded.tiploc_code,
+            station_name = COALESCE(excluded.station_name, station_name),
+            lat = COALESCE(excluded.lat, lat),
+            lon = COALESCE(excluded.lon, lon),
+            source = excluded.source,
+            updated_at = excluded.updated_at
+    """
+    
+    # 在SQLite内部把有坐标的CRS映射整体复制到TIPLOC坐标表；
+    # 冲突时原地更新、保留rowid，tiploc_rtree由UPDATE触发器同步
+    COPY_COORDS_SQL = """
+        INSERT INTO tiploc_coords 
+        (tiploc, lat, lon, name, source, updated_at)
+        SELECT tiploc_code, lat, lon, station_name, 'crs_mapping', ?
+        FROM crs_tiploc_mapping 
+        WHERE lat IS NOT NULL AND lon IS NOT NULL
+        ON CONFLICT(tiploc) DO UPDATE SET
+            lat = excluded.lat, lon = excluded.lon, name = excluded.name,
+            source = excluded.source, updated_at = excluded.updated_at
+    """
+    
+    def __init__(self, db_path="train_positions.db", conn=None):
         self.db_path = db_path
+        # 外部传入的共享连接（已设置PRAGMA），为None时每次操作自行打开
+        self._shared_conn = conn
+        # 映射表很小且基本静态，首次查询时整表载入内存
         self.crs_to_tiploc = {}
         self.tiploc_to_crs = {}
+        self.crs_coords = {}
+        self._cache_loaded = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并设置PRAGMA；有共享连接时直接复用"""
+        if self._shared_conn is not None:
+            return self._shared_conn
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+        
+    def _ensure_cache(self):
+        """载入CRS映射缓存（仅首次调用时查询数据库）"""
+        if self._cache_loaded:
+            return
         
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT crs_code, tiploc_code, lat, lon FROM crs_tiploc_mapping"
+            ).fetchall()
+        
+        self.crs_to_tiploc = {crs: tiploc for crs, tiploc, _, _ in rows}
+        self.tiploc_to_crs = {tiploc: crs for crs, tiploc, _, _ in rows}
+        self.crs_coords = {crs: (lat, lon) for crs, _, lat, lon in rows}
+        self._cache_loaded = True
+    
     def load_crs_tiploc_mappings(self):
         """加载CRS到TIPLOC的映射关系"""
-        # 常见的CRS到TIPLOC映射
-        mappings = {
-            # 主要伦敦车站
-            "PAD": "PADTON",      # Paddington
-            "VIC": "VICTRIC",     # Victoria
-            "WAT": "WATRLMN",     # Waterloo
-            "LST": "LIVST",       # Liverpool Street
-            "KGX": "KNGX",        # Kings Cross
-            "EUS": "EUSTON",      # Euston
-            "STP": "STPANCI",     # St Pancras
-            "MYB": "MARYLBN",     # Marylebone
-            "CHX": "CHARING",     # Charing Cross
-            "LBG": "LNDNBDG",     # London Bridge
-            "FST": "FENCHST",     # Fenchurch Street
-            "MOG": "MOORGATE",    # Moorgate
-            
-            # 主要城市
-            "BHM": "BRMNGM",      # Birmingham New Street
-            "MAN": "MNCHSTR",     # Manchester
-            "EDB": "EDINBGH",     # Edinburgh
-            "GLC": "GLGW",        # Glasgow Central
-            "LIV": "LVRPLCH",     # Liverpool
-            "LEE": "LEEDS",       # Leeds
-            "SHF": "SHEFFLD",     # Sheffield
-            "NCL": "NWCSTLE",     # Newcastle
-            "BRI": "BRISTOL",     # Bristol
-            "CDF": "CRDFCEN",     # Cardiff Central
-            "NOT": "NOTTGHM",     # Nottingham
-            "LEI": "LEICSTR",     # Leicester
-            "DBY": "DRBY",        # Derby
-            "YRK": "YORK",        # York
-            "BTH": "BATH",        # Bath Spa
-            "EXD": "EXETER",      # Exeter
-            "PLY": "PLYMOUTH",    # Plymouth
-            "BTN": "BRIGHTON",    # Brighton
-            "RDG": "RDNG",        # Reading
-            "OXF": "OXFD",        # Oxford
-            "CBG": "CMBDG",       # Cambridge
-            
-            # 伦敦周边重要站点
-            "CLJ": "CLPHMJC",     # Clapham Junction
-            "VXH": "VAUXHLM",     # Vauxhall
-            "SRA": "STRATFD",     # Stratford
-            "CRO": "CROYDON",     # Croydon
-            "WIM": "WIMBLDON",    # Wimbledon
-            "EPH": "ELPHNAC",     # Elephant & Castle
-            "BAL": "BALHAM",      # Balham
-            "PUT": "PUTNEY",      # Putney
-            "RMD": "RICHMOND",    # Richmond
-            "KTN": "KTON",        # Kingston
-            "SUR": "SURBITON",    # Surbiton
-            "WOK": "WOKING",      # Woking
-            "GLD": "GUILDFD",     # Guildford
-            
-            # 机场
-            "LHR": "HROW",        # Heathrow
-            "LGW": "GTWK",        # Gatwick
-            "STN": "STANSTED",    # Stansted
-            
-            # 其他重要站点
-            "SOT": "SOTON",       # Southampton
-            "PMS": "PMTH",        # Portsmouth
-            "BOH": "BOMO",        # Bournemouth
-            "DOV": "DOVER",       # Dover
-            "CNT": "CANTERBY",    # Canterbury
-            "ASH": "ASHFORD",     # Ashford
-            "TON": "TUNBRIDGE",   # Tunbridge Wells
-            "HAT": "HATFILD",     # Hatfield
-            "STE": "STEVNGE",     # Stevenage
-            "HIT": "HITCHIN",     # Hitchin
-            "LTN": "LUTON",       # Luton
-            "BDM": "BEDFORD",     # Bedford
-            "MKC": "MKCENTRL",    # Milton Keynes Central
-            "NTH": "NRTHMPTN",    # Northampton
-            "COV": "COVENTRY",    # Coventry
-            "WAR": "WARWICK",     # Warwick
-            "STR": "STRATFRD",    # Stratford-upon-Avon
-            "WOR": "WORCSTR",     # Worcester
-            "HFD": "HEREFORD",    # Hereford
-            "SHR": "SHRWSBY",     # Shrewsbury
-            "CHE": "CHESTER",     # Chester
-            "CRE": "CREWE",       # Crewe
-            "STF": "STAFFRD",     # Stafford
-            "WVH": "WVRMPTN",     # Wolverhampton
-            "DUD": "DUDLEY",      # Dudley
-            "WSB": "WALSALL",     # Walsall
-            "TAM": "TAMWORTH",    # Tamworth
-            "LIC": "LICHFLD",     # Lichfield
-            "BUR": "BURTON",      # Burton-on-Trent
-            "UTT": "UTTOXTR",     # Uttoxeter
-            "STO": "STOKEOT",     # Stoke-on-Trent
-            "MAC": "MACCLES",     # Macclesfield
-            "STK": "STOCKPT",     # Stockport
-            "WGN": "WIGAN",       # Wigan
-            "PRE": "PRESTON",     # Preston
-            "BLK": "BLACKPL",     # Blackpool
-            "LAN": "LANCSTR",     # Lancaster
-            "OXN": "OXENHLM",     # Oxenholme
-            "KEN": "KENDAL",      # Kendal
-            "WIN": "WINDRMR",     # Windermere
-            "CAR": "CARLILE",     # Carlisle
-            "PEN": "PENRITH",     # Penrith
-            "APP": "APPLEBY",     # Appleby
-            "KIR": "KIRKBY",      # Kirkby Stephen
-            "GAR": "GARSDALE",    # Garsdale
-            "RIB": "RIBBLHD",     # Ribblehead
-            "HOR": "HORTON",      # Horton-in-Ribblesdale
-            "SET": "SETTLE",      # Settle
-            "GIG": "GIGGLES",     # Giggleswick
-            "LNG": "LONGPRT",     # Long Preston
-            "HEL": "HELLIFD",     # Hellifield
-            "GIS": "GISBURN",     # Gisburn
-            "CLI": "CLITHEROE",   # Clitheroe
-            
-            # 苏格兰
-            "ABD": "ABRDEEN",     # Aberdeen
-            "DND": "DUNDEE",      # Dundee
-            "STG": "STIRLING",    # Stirling
-            "PTH": "PERTH",       # Perth
-            "INV": "IVRNESS",     # Inverness
-            "KIL": "KILMRNCK",    # Kilmarnock
-            "AYR": "AYR",         # Ayr
-            "STR": "STRANRAR",    # Stranraer
-            "DUM": "DUMFRIES",    # Dumfries
-            "LOC": "LOCKERBY",    # Lockerbie
-            "MOF": "MOFFAT",      # Moffat
-            "BEA": "BEATTOCK",    # Beattock
-            "CAR": "CARSTAIRS",   # Carstairs
-            "MOB": "MOTHERWELL",  # Motherwell
-            "HAM": "HAMILTON",    # Hamilton
-            "LAR": "LARKHALL",    # Larkhall
-            "LAN": "LANARK",      # Lanark
-            
-            # 威尔士
-            "SWA": "SWANSEA",     # Swansea
-            "NPT": "NEWPORT",     # Newport
-            "CWL": "CWMBRAN",     # Cwmbran
-            "ABG": "ABRGVNY",     # Abergavenny
-            "HFD": "HEREFORD",    # Hereford (border)
-            "SHR": "SHRWSBY",     # Shrewsbury (border)
-            "WRX": "WREXHAM",     # Wrexham
-            "CHE": "CHESTER",     # Chester (border)
-            "RHY": "RHYL",        # Rhyl
-            "LLD": "LLANDNO",     # Llandudno
-            "BAN": "BANGOR",      # Bangor
-            "HOL": "HOLYHEAD",    # Holyhead
-            "PWL": "PWLLHELI",    # Pwllheli
-            "POR": "PORTHMD",     # Porthmadog
-            "FFE": "FFESTNG",     # Ffestiniog
-            "BLA": "BLAENAU",     # Blaenau Ffestiniog
-            "DOL": "DOLGELLY",    # Dolgellau
-            "MAC": "MACHYNL",     # Machynlleth
-            "ABE": "ABERYST",     # Aberystwyth
-            "CAR": "CARDIGAN",    # Cardigan
-            "FIS": "FISHGRD",     # Fishguard
-            "HAV": "HAVERFRD",    # Haverfordwest
-            "PEM": "PEMBROKE",    # Pembroke
-            "TEN": "TENBY",       # Tenby
-            "CAR": "CARMRHN",     # Carmarthen
-            "LLA": "LLANELLI",    # Llanelli
-            "NEA": "NEATH",       # Neath
-            "PTA": "PTALBOT",     # Port Talbot
-            "BGD": "BARGOED",     # Bargoed
-            "CAE": "CAERPHLY",    # Caerphilly
-            "PCD": "PENCOED",     # Pencoed
-            "BRI": "BRIDGND",     # Bridgend
-            "PYC": "PYCOMBE",     # Pyle
-            "CST": "COWBRG",      # Cowbridge
-            "RHO": "RHOOSE",      # Rhoose
-            "BRY": "BARRY",       # Barry
-            "BYI": "BARRYIS",     # Barry Island
-            "CDI": "CARDIFF",     # Cardiff
-            "CDF": "CRDFCEN",     # Cardiff Central
-            "CQU": "CRDFQUY",     # Cardiff Queen Street
-            "CBY": "CRDFBAY",     # Cardiff Bay
-        }
-        
-        return mappings
+        return _CRS_TIPLOC_MAP
     
     def load_stations_json(self, stations_file="stations.json"):
         """从stations.json加载车站数据"""
         try:
-            with open(stations_file, 'r', encoding='utf-8') as f:
-                stations = json.load(f)
+            with open(stations_file, 'rb') as f:
+                stations = orjson.loads(f.read())
             
             logger.info(f"从 {stations_file} 加载了 {len(stations)} 个车站")
             return stations
@@ -211,79 +348,103 @@ class CRSTiplocMapper:
             logger.error(f"加载stations.json失败: {e}")
             return []
     
-    def create_mapping_database(self, stations_file="stations.json"):
+    def iter_stations_json(self, stations_file="stations.json"):
+        """逐个产出stations.json中的车站；大文件在安装了ijson时流式解析"""
+        if ijson is not None and os.path.getsize(stations_file) > STREAM_THRESHOLD:
+            logger.info(f"流式解析 {stations_file}")
+            with open(stations_file, 'rb') as f:
+                yield from ijson.items(f, 'item', use_float=True)
+        else:
+            yield from self.load_stations_json(stations_file)
+    
+    def create_mapping_database(self, stations_file="stations.json", batch_size=MAPPING_BATCH_SIZE):
         """创建CRS到TIPLOC的映射数据库"""
         try:
             # 加载预定义映射
             predefined_mappings = self.load_crs_tiploc_mappings()
             
-            # 加载stations.json
-            stations = self.load_stations_json(stations_file)
-            
-            with sqlite3.connect(self.db_path) as conn:
-                # 创建映射表
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS crs_tiploc_mapping (
-                        crs_code TEXT PRIMARY KEY,
-                        tiploc_code TEXT,
-                        station_name TEXT,
-                        lat REAL,
-                        lon REAL,
-                        source TEXT,
-                        updated_at TEXT
-                    )
-                """)
-                
-                # 插入预定义映射
-                for crs, tiploc in predefined_mappings.items():
-                    conn.execute("""
-                        INSERT OR REPLACE INTO crs_tiploc_mapping 
+            conn = self._connect()
+            try:
+                with conn:
+                    # 创建映射表
+                    conn.execute(self.MAPPING_TABLE_SQL.format(schema="main"))
+                    
+                    # 本次映射先写入内存暂存库，最后一次性合并到正式表
+                    conn.execute("ATTACH DATABASE ':memory:' AS staging")
+                    conn.execute(self.MAPPING_TABLE_SQL.format(schema="staging"))
+                    
+                    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                    conn.execute("BEGIN")
+                    
+                    # 暂存预定义映射
+                    conn.executemany("""
+                        INSERT INTO staging.crs_tiploc_mapping 
                         (crs_code, tiploc_code, source, updated_at)
-                        VALUES (?, ?, 'predefined', datetime('now'))
-                    """, (crs, tiploc))
-                
-                # 处理stations.json中的数据
-                updated_count = 0
-                for station in stations:
-                    crs_code = station.get('crsCode')
-                    station_name = station.get('stationName')
-                    lat = station.get('lat')
-                    lon = station.get('long')
+                        VALUES (?, ?, 'predefined', ?)
+                    """, [(crs, tiploc, now) for crs, tiploc in predefined_mappings.items()])
                     
-                    if not crs_code:
-                        continue
+                    # 已有映射一次性读出，代替逐站查询；预定义映射优先
+                    known_tiplocs = dict(conn.execute(
+                        "SELECT crs_code, tiploc_code FROM main.crs_tiploc_mapping"
+                    ).fetchall())
+                    known_tiplocs.update(predefined_mappings)
                     
-                    # 检查是否已有预定义映射
-                    cursor = conn.execute(
-                        "SELECT tiploc_code FROM crs_tiploc_mapping WHERE crs_code = ?",
-                        (crs_code,)
+                    upsert_staging_sql = self.UPSERT_MAPPING_SQL.format(
+                        target="staging.crs_tiploc_mapping",
+                        source="VALUES (?, ?, ?, ?, ?, 'stations_json', ?)",
                     )
-                    existing = cursor.fetchone()
                     
-                    if existing:
-                        tiploc_code = existing[0]
-                    else:
-                        # 尝试生成TIPLOC代码
-                        tiploc_code = self.generate_tiploc_from_name(station_name)
+                    # 处理stations.json中的数据，按批写入暂存表
+                    mapping_rows = []
+                    updated_count = 0
+                    for station in self.iter_stations_json(stations_file):
+                        crs_code = station.get('crsCode')
+                        station_name = station.get('stationName')
+                        lat = station.get('lat')
+                        lon = station.get('long')
+                    
+                        if not crs_code:
+                            continue
+                    
+                        # 优先使用已有映射，否则尝试生成TIPLOC代码
+                        if crs_code in known_tiplocs:
+                            tiploc_code = known_tiplocs[crs_code]
+                        else:
+                            tiploc_code = known_tiplocs[crs_code] = self.generate_tiploc_from_name(station_name)
                     
-                    # 更新或插入映射
+                        mapping_rows.append((crs_code, tiploc_code, station_name, lat, lon, now))
+                        if len(mapping_rows) >= batch_size:
+                            conn.executemany(upsert_staging_sql, mapping_rows)
+                            updated_count += len(mapping_rows)
+                            mapping_rows.clear()
+                    
+                    conn.executemany(upsert_staging_sql, mapping_rows)
+                    updated_count += len(mapping_rows)
+                    
+                    # 按暂存顺序合并到正式表（缺失的站名和坐标不覆盖已有值）；
+                    # TIPLOC索引在合并后一次性重建，合并时不逐行维护
+                    conn.execute("DROP INDEX IF EXISTS idx_ctm_tiploc")
+                    conn.execute(self.UPSERT_MAPPING_SQL.format(
+                        target="main.crs_tiploc_mapping",
+                        source="SELECT * FROM staging.crs_tiploc_mapping WHERE true ORDER BY rowid",
+                    ))
                     conn.execute("""
-                        INSERT OR REPLACE INTO crs_tiploc_mapping 
-                        (crs_code, tiploc_code, station_name, lat, lon, source, updated_at)
-                        VALUES (?, ?, ?, ?, ?, 'stations_json', datetime('now'))
-                    """, (crs_code, tiploc_code, station_name, lat, lon))
+                        CREATE INDEX idx_ctm_tiploc 
+                        ON crs_tiploc_mapping(tiploc_code)
+                    """)
                     
                     # 同时更新TIPLOC坐标表
-                    conn.execute("""
-                        INSERT OR REPLACE INTO tiploc_coords 
-                        (tiploc, lat, lon, name, source, updated_at)
-                        VALUES (?, ?, ?, ?, 'crs_mapping', datetime('now'))
-                    """, (tiploc_code, lat, lon, station_name))
+                    conn.execute(self.COPY_COORDS_SQL, (now,))
                     
-                    updated_count += 1
-                
-                logger.info(f"更新了 {updated_count} 个CRS到TIPLOC的映射")
-                return updated_count
+                    # 映射已变化，下次查询时重新载入缓存
+                    self._cache_loaded = False
+            finally:
+                # 共享连接会被后续步骤复用，内存暂存库用完即分离
+                if any(row[1] == "staging" for row in conn.execute("PRAGMA database_list")):
+                    conn.execute("DETACH DATABASE staging")
+            
+            logger.info(f"更新了 {updated_count} 个CRS到TIPLOC的映射")
+            return updated_count
                 
         except Exception as e:
             logger.error(f"创建映射数据库失败: {e}")
@@ -291,73 +452,13 @@ class CRSTiplocMapper:
     
     def generate_tiploc_from_name(self, station_name):
         """从车站名称生成可能的TIPLOC代码"""
-        if not station_name:
-            return "UNKNOWN"
-        
-        # 简化的TIPLOC生成规则
-        name = station_name.upper()
-        
-        # 移除常见词汇
-        name = name.replace(" STATION", "")
-        name = name.replace(" CENTRAL", "")
-        name = name.replace(" PARKWAY", "")
-        name = name.replace(" INTERNATIONAL", "")
-        name = name.replace(" AIRPORT", "")
-        name = name.replace(" & ", "")
-        name = name.replace("-", "")
-        name = name.replace("'", "")
-        name = name.replace(" ", "")
-        
-        # 特殊处理
-        special_cases = {
-            "LONDON": "LONDON",
-            "BIRMINGHAM": "BRMNGM",
-            "MANCHESTER": "MNCHSTR",
-            "EDINBURGH": "EDINBGH",
-            "GLASGOW": "GLGW",
-            "LIVERPOOL": "LVRPL",
-            "SHEFFIELD": "SHEFFLD",
-            "NEWCASTLE": "NWCSTLE",
-            "NOTTINGHAM": "NOTTGHM",
-            "LEICESTER": "LEICSTR",
-            "COVENTRY": "COVNTRY",
-            "WOLVERHAMPTON": "WVRMPTN",
-            "SOUTHAMPTON": "SOTON",
-            "PORTSMOUTH": "PMTH",
-            "BOURNEMOUTH": "BOMO",
-            "BRIGHTON": "BRIGHTN",
-            "CANTERBURY": "CANTERBY",
-            "GLOUCESTER": "GLOSTER",
-            "WORCESTER": "WORCSTR",
-            "SHREWSBURY": "SHRWSBY",
-            "BLACKPOOL": "BLACKPL",
-            "LANCASTER": "LANCSTR",
-            "CARLISLE": "CARLILE",
-            "ABERDEEN": "ABRDEEN",
-            "INVERNESS": "IVRNESS",
-            "KILMARNOCK": "KILMRNCK",
-            "STRANRAER": "STRANRAR",
-            "DUMFRIES": "DUMFRIES",
-            "MOTHERWELL": "MOTHERWL",
-            "HAMILTON": "HAMILTON",
-        }
-        
-        if name in special_cases:
-            return special_cases[name]
-        
-        # 截断到7个字符（TIPLOC最大长度）
-        return name[:7]
+        return _generate_tiploc_from_name(station_name)
     
     def get_tiploc_from_crs(self, crs_code):
         """根据CRS代码获取TIPLOC代码"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT tiploc_code FROM crs_tiploc_mapping WHERE crs_code = ?",
-                    (crs_code,)
-                )
-                result = cursor.fetchone()
-                return result[0] if result else None
+            self._ensure_cache()
+            return self.crs_to_tiploc.get(crs_code)
                 
         except Exception as e:
             logger.error(f"查询TIPLOC失败: {e}")
@@ -366,13 +467,8 @@ class CRSTiplocMapper:
     def get_coordinates_from_crs(self, crs_code):
         """根据CRS代码获取坐标"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT lat, lon FROM crs_tiploc_mapping WHERE crs_code = ?",
-                    (crs_code,)
-                )
-                result = cursor.fetchone()
-                return (result[0], result[1]) if result else None
+            self._ensure_cache()
+            return self.crs_coords.get(crs_code)
                 
         except Exception as e:
             logger.error(f"查询坐标失败: {e}")
@@ -381,24 +477,9 @@ class CRSTiplocMapper:
     def update_tiploc_coords_from_crs(self):
         """使用CRS映射更新TIPLOC坐标表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # 获取所有有坐标的CRS映射
-                cursor = conn.execute("""
-                    SELECT tiploc_code, lat, lon, station_name 
-                    FROM crs_tiploc_mapping 
-                    WHERE lat IS NOT NULL AND lon IS NOT NULL
-                """)
-                
-                mappings = cursor.fetchall()
-                updated_count = 0
-                
-                for tiploc, lat, lon, name in mappings:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO tiploc_coords 
-                        (tiploc, lat, lon, name, source, updated_at)
-                        VALUES (?, ?, ?, ?, 'crs_mapping', datetime('now'))
-                    """, (tiploc, lat, lon, name))
-                    updated_count += 1
+            with self._connect() as conn:
+                now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                updated_count = conn.execute(self.COPY_COORDS_SQL, (now,)).rowcount
                 
                 logger.info(f"从CRS映射更新了 {updated_count} 个TIPLOC坐标")
                 return updated_count
@@ -17,6 +17,24 @@ from utils.tiploc_mapper import CRSTiplocMapper
 from utils.tiploc_loader import TiplocDataLoader
 from services.train_updater import TrainPositionCache
 
+# 初始化期间的连接设置：WAL + NORMAL同步，每个阶段单事务提交
+INIT_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+)
+
+# 批量加载前删除、加载后由TrainPositionCache.init_db重建的二级索引
+BULK_LOAD_INDEXES = ("idx_tiploc_coords_nonnull",)
+
+# 初始化结束时顺序读取的热点表和索引
+WARMUP_QUERIES = (
+    "SELECT tiploc, lat, lon FROM tiploc_coords",
+    "SELECT crs_code, tiploc_code, lat, lon FROM crs_tiploc_mapping",
+    "SELECT COUNT(*) FROM crs_tiploc_mapping INDEXED BY idx_ctm_tiploc",
+)
+
 def init_database():
     """初始化数据库"""
     db_path = "Data/database/train_positions.db"
@@ -26,28 +44,31 @@ def init_database():
     # 确保数据库目录存在
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
-    # 1. 初始化基础表结构
-    print("📊 创建基础表结构...")
-    cache = TrainPositionCache(db_path)
-    cache.init_db()
+    # 所有步骤共用这一个连接：PRAGMA只设置一次，页缓存在各步骤之间保持
+    conn = sqlite3.connect(db_path)
+    for pragma in INIT_PRAGMAS:
+        conn.execute(pragma)
     
-    # 2. 创建TIPLOC坐标表
+    # 1. 创建TIPLOC坐标表（列名与加载器、映射器和Darwin API一致）
     print("🗺️  创建TIPLOC坐标表...")
-    with sqlite3.connect(db_path) as conn:
+    with conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS tiploc_coords (
-                tiploc_code TEXT PRIMARY KEY,
+                tiploc TEXT PRIMARY KEY,
                 lat REAL,
                 lon REAL,
-                station_name TEXT,
+                name TEXT,
                 source TEXT,
                 updated_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        # 二级索引在批量加载后由第4步一次性重建，加载期间不逐行维护
+        for index_name in BULK_LOAD_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index_name}")
     
-    # 3. 创建CRS到TIPLOC映射
+    # 2. 创建CRS到TIPLOC映射（映射器和加载器各自在单个事务中批量写入）
     print("🔗 创建CRS到TIPLOC映射...")
-    mapper = CRSTiplocMapper(db_path)
+    mapper = CRSTiplocMapper(db_path, conn=conn)
     stations_file = "Data/static/stations.json"
     
     if os.path.exists(stations_file):
@@ -56,30 +77,54 @@ def init_database():
     else:
         print(f"⚠️  警告: 找不到 {stations_file}，跳过CRS映射创建")
     
-    # 4. 加载TIPLOC坐标数据
+    # 3. 加载TIPLOC坐标数据
     print("📍 加载TIPLOC坐标数据...")
-    loader = TiplocDataLoader(db_path)
+    loader = TiplocDataLoader(db_path, conn=conn)
     coord_count = loader.update_database()
     print(f"✅ 更新了 {coord_count} 个TIPLOC坐标")
     
-    # 5. 检查数据库状态
+    # 4. 初始化基础表结构，在已加载的数据上建立索引并更新统计信息
+    print("📊 创建基础表结构和索引...")
+    cache = TrainPositionCache(db_path, conn=conn)
+    cache.init_db()
+    cache.close()
+    # 所有索引建好后完整分析一次，服务启动时只做增量的PRAGMA optimize
+    with conn:
+        conn.execute("ANALYZE")
+    
+    # 5. 预热缓存：顺序读一遍热点表及其索引，让操作系统页缓存在服务启动前就有这些页
+    print("🔥 预热缓存...")
+    for query in WARMUP_QUERIES:
+        try:
+            conn.execute(query).fetchall()
+        except sqlite3.OperationalError:
+            # 跳过CRS映射时对应的表不存在
+            pass
+    
+    # 6. 检查数据库状态
     print("🔍 检查数据库状态...")
-    with sqlite3.connect(db_path) as conn:
-        # 检查各表的记录数
-        tables = [
-            ('position_history', '位置历史'),
-            ('current_positions', '当前位置'),
-            ('crs_tiploc_mapping', 'CRS映射'),
-            ('tiploc_coords', 'TIPLOC坐标')
-        ]
-        
-        for table_name, display_name in tables:
-            try:
-                cursor = conn.execute(f"SELECT COUNT(*) FROM {table_name}")
-                count = cursor.fetchone()[0]
-                print(f"  📋 {display_name}: {count} 条记录")
-            except sqlite3.OperationalError:
-                print(f"  ❌ {display_name}: 表不存在")
+    # 检查各表的记录数
+    tables = [
+        ('position_history', '位置历史'),
+        ('current_positions', '当前位置'),
+        ('crs_tiploc_mapping', 'CRS映射'),
+        ('tiploc_coords', 'TIPLOC坐标')
+    ]
+    
+    # 只统计已存在的表，所有计数合并成一条UNION ALL查询
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    count_sql = " UNION ALL ".join(
+        f"SELECT '{table_name}', COUNT(*) FROM {table_name}"
+        for table_name, _ in tables if table_name in existing
+    )
+    counts = dict(conn.execute(count_sql).fetchall()) if count_sql else {}
+    
+    for table_name, display_name in tables:
+        if table_name in counts:
+            print(f"  📋 {display_name}: {counts[table_name]} 条记录")
+        else:
+            print(f"  ❌ {display_name}: 表不存在")
+    conn.close()
     
     print("🎉 数据库初始化完成！")
     print(f"📁 数据库文件: {db_path}")
@@ -10,6 +10,8 @@ import time
 import signal
 import os
 import asyncio
+import threading
+import aiohttp
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -17,6 +19,8 @@ class SmartSystemManager:
     def __init__(self):
         self.processes = []
         self.running = True
+        # 子进程退出时由SIGCHLD处理器置位，监控循环在此阻塞等待
+        self._child_exited = threading.Event()
         
         # 加载环境变量
         env_file = Path(".env")
@@ -25,6 +29,16 @@ class SmartSystemManager:
             print("✅ 加载了 .env 配置文件")
         else:
             print("⚠️  未找到 .env 文件，使用默认配置")
+        
+        self._banner = self._build_banner()
+    
+    def _spawn(self, name, cmd, env=None):
+        """启动子进程并登记"""
+        # close_fds=False时subprocess直接走posix_spawn，不复制父进程页表；
+        # Python创建的文件描述符默认不可继承，子进程仍只拿到标准输入输出
+        process = subprocess.Popen(cmd, env=env, close_fds=False)
+        self.processes.append((name, process))
+        return process
     
     def start_darwin_api(self, port=8000):
         """启动Darwin API服务器"""
@@ -37,9 +51,7 @@ class SmartSystemManager:
             "--log-level", "info"
         ]
         
-        process = subprocess.Popen(cmd)
-        self.processes.append(("Darwin API", process))
-        return process
+        return self._spawn("Darwin API", cmd)
     
     def start_smart_updater(self, port=8001):
         """启动智能更新器API"""
@@ -52,9 +64,7 @@ class SmartSystemManager:
         env = os.environ.copy()
         env["UVICORN_PORT"] = str(port)
         
-        process = subprocess.Popen(cmd, env=env)
-        self.processes.append(("Smart Updater", process))
-        return process
+        return self._spawn("Smart Updater", cmd, env=env)
     
     def start_websocket_server(self, ws_port=8002, api_port=8003):
         """启动WebSocket实时服务器"""
@@ -65,38 +75,52 @@ class SmartSystemManager:
             "--api-port", str(api_port)
         ]
         
-        process = subprocess.Popen(cmd)
-        self.processes.append(("WebSocket Server", process))
-        return process
+        return self._spawn("WebSocket Server", cmd)
     
     def start_web_server(self, port=3000):
         """启动Web服务器"""
         print("🌐 启动Web服务器...")
         cmd = [sys.executable, "serve_web.py", "--port", str(port)]
         
-        process = subprocess.Popen(cmd)
-        self.processes.append(("Web Server", process))
-        return process
+        return self._spawn("Web Server", cmd)
     
-    def wait_for_service(self, url, service_name, max_attempts=30):
-        """等待服务启动"""
-        import requests
+    async def wait_for_service(self, session, url, service_name, timeout=30):
+        """等待服务启动，按指数退避轮询健康检查地址"""
+        print(f"⏳ 等待 {service_name} 启动...")
+        deadline = time.monotonic() + timeout
+        attempt = 0
         
-        for i in range(max_attempts):
+        while time.monotonic() < deadline:
             try:
-                response = requests.get(url, timeout=2)
-                if response.status_code == 200:
-                    print(f"✅ {service_name} 已就绪")
-                    return True
-            except:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        print(f"✅ {service_name} 已就绪")
+                        return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
                 pass
             
-            print(f"⏳ 等待 {service_name} 启动... ({i+1}/{max_attempts})")
-            time.sleep(1)
+            await asyncio.sleep(min(0.1 * 2 ** attempt, 1.0))
+            attempt += 1
         
         print(f"❌ {service_name} 启动超时")
         return False
     
+    async def _wait_for_services(self, services):
+        timeout = aiohttp.ClientTimeout(total=2)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            results = await asyncio.gather(*(
+                self.wait_for_service(session, url, name) for url, name in services
+            ))
+        return all(results)
+    
+    def wait_for_services(self, services):
+        """并发等待多个服务就绪，耗时取决于最慢的服务"""
+        try:
+            import uvloop
+        except ImportError:
+            return asyncio.run(self._wait_for_services(services))
+        return uvloop.run(self._wait_for_services(services))
+    
     def setup_signal_handlers(self):
         """设置信号处理器"""
         def signal_handler(signum, frame):
@@ -106,6 +130,24 @@ class SmartSystemManager:
         
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
+        
+        # Windows没有SIGCHLD，监控循环退回轮询
+        if hasattr(signal, "SIGCHLD"):
+            signal.signal(signal.SIGCHLD, self._on_sigchld)
+    
+    def _on_sigchld(self, signum=None, frame=None):
+        """子进程状态变化时只唤醒监控循环；print和poll()不可重入，不在信号处理器中调用"""
+        self._child_exited.set()
+    
+    def _check_exited(self):
+        """检查是否有服务进程退出，有则报告并停止监控，返回是否退出"""
+        # 只对自己启动的进程调用poll()，保留各自准确的退出码
+        for name, process in self.processes:
+            if process.poll() is not None:
+                print(f"❌ {name} 进程已退出 (退出码: {process.returncode})")
+                self.running = False
+                return True
+        return False
     
     def shutdown(self):
         """关闭所有进程"""
@@ -126,20 +168,20 @@ class SmartSystemManager:
     
     def monitor_processes(self):
         """监控进程状态"""
-        while self.running:
-            for name, process in self.processes:
-                if process.poll() is not None:
-                    print(f"❌ {name} 进程已退出 (退出码: {process.returncode})")
-                    self.running = False
-                    break
-            
+        if hasattr(signal, "SIGCHLD"):
+            # 先检查再等待：处理器安装前已退出的子进程不会再触发SIGCHLD；
+            # 等待返回后先清除事件再检查，检查期间到达的信号会再次唤醒
+            while self.running and not self._check_exited():
+                self._child_exited.wait()
+                self._child_exited.clear()
+            return
+        
+        while self.running and not self._check_exited():
             time.sleep(2)
     
-    def print_system_info(self):
-        """打印系统信息"""
-        print("\n" + "="*60)
-        print("🚂 智能火车追踪系统")
-        print("="*60)
+    def _build_banner(self):
+        """生成系统信息横幅；环境变量在进程内不变，构造时读取一次"""
+        lines = ["\n" + "="*60, "🚂 智能火车追踪系统", "="*60]
         
         # 显示配置信息
         config_info = [
@@ -150,19 +192,18 @@ class SmartSystemManager:
             ("深夜间隔", f"{os.getenv('SLOW_UPDATE_INTERVAL', '300')}秒"),
             ("数据保留", f"{os.getenv('MAX_POSITION_AGE_HOURS', '24')}小时"),
         ]
+        lines += [f"{key:12}: {value}" for key, value in config_info]
         
-        for key, value in config_info:
-            print(f"{key:12}: {value}")
-        
-        print("\n📱 可用服务:")
-        print("  🔗 Darwin API文档: http://localhost:8000/docs")
-        print("  🔗 更新器API文档: http://localhost:8001/docs")
-        print("  🚂 标准火车追踪: http://localhost:3000/enhanced-train-tracker.html")
-        print("  ⚡ 高性能追踪: http://localhost:3000/high-performance-train-tracker.html")
-        print("  📊 系统统计: http://localhost:8001/stats")
-        print("  🔌 WebSocket: ws://localhost:8002")
-        
-        print("\n⚙️  环境变量配置:")
+        lines += [
+            "\n📱 可用服务:",
+            "  🔗 Darwin API文档: http://localhost:8000/docs",
+            "  🔗 更新器API文档: http://localhost:8001/docs",
+            "  🚂 标准火车追踪: http://localhost:3000/enhanced-train-tracker.html",
+            "  ⚡ 高性能追踪: http://localhost:3000/high-performance-train-tracker.html",
+            "  📊 系统统计: http://localhost:8001/stats",
+            "  🔌 WebSocket: ws://localhost:8002",
+            "\n⚙️  环境变量配置:",
+        ]
         env_vars = [
             "NORMAL_UPDATE_INTERVAL",
             "SLOW_UPDATE_INTERVAL", 
@@ -170,14 +211,14 @@ class SmartSystemManager:
             "PEAK_HOURS_START",
             "PEAK_HOURS_END"
         ]
+        lines += [f"  {var}: {os.getenv(var, '未设置')}" for var in env_vars]
         
-        for var in env_vars:
-            value = os.getenv(var, "未设置")
-            print(f"  {var}: {value}")
-        
-        print("\n" + "="*60)
-        print("⏹️  按 Ctrl+C 停止所有服务")
-        print("="*60)
+        lines += ["\n" + "="*60, "⏹️  按 Ctrl+C 停止所有服务", "="*60]
+        return "\n".join(lines)
+    
+    def print_system_info(self):
+        """打印系统信息"""
+        print(self._banner, flush=True)
     
     def start_system(self, darwin_port=8000, updater_port=8001, web_port=3000, ws_port=8002, ws_api_port=8003):
         """启动完整系统"""
@@ -187,36 +228,22 @@ class SmartSystemManager:
         self.setup_signal_handlers()
         
         try:
-            # 1. 启动Darwin API服务器
+            # 依次启动所有服务，不在启动之间等待
             self.start_darwin_api(darwin_port)
-            
-            # 等待Darwin API就绪
-            if not self.wait_for_service(f"http://localhost:{darwin_port}/health", "Darwin API"):
-                self.shutdown()
-                return False
-            
-            # 2. 启动智能更新器
             self.start_smart_updater(updater_port)
-            
-            # 等待更新器就绪
-            if not self.wait_for_service(f"http://localhost:{updater_port}/", "智能更新器"):
-                self.shutdown()
-                return False
-            
-            # 3. 启动WebSocket实时服务器
             self.start_websocket_server(ws_port, ws_api_port)
+            self.start_web_server(web_port)
             
-            # 等待WebSocket服务器就绪
-            if not self.wait_for_service(f"http://localhost:{ws_api_port}/health", "WebSocket服务器"):
+            # 并发等待各服务就绪
+            if not self.wait_for_services([
+                (f"http://localhost:{darwin_port}/health", "Darwin API"),
+                (f"http://localhost:{updater_port}/", "智能更新器"),
+                (f"http://localhost:{ws_api_port}/health", "WebSocket服务器"),
+                (f"http://localhost:{web_port}/", "Web服务器"),
+            ]):
                 self.shutdown()
                 return False
             
-            # 4. 启动Web服务器
-            self.start_web_server(web_port)
-            
-            # 等待Web服务器启动
-            time.sleep(2)
-            
             # 显示系统信息
             self.print_system_info()
             
@@ -230,6 +257,22 @@ class SmartSystemManager:
         
         return True
 
+def find_missing_files(paths):
+    """按目录分组，每个目录只scandir一次，返回不存在的文件"""
+    by_dir = {}
+    for path in paths:
+        by_dir.setdefault(os.path.dirname(path) or ".", []).append(path)
+    
+    missing = []
+    for directory, files in by_dir.items():
+        try:
+            with os.scandir(directory) as entries:
+                present = {entry.name for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            present = set()
+        missing += [f for f in files if os.path.basename(f) not in present]
+    return missing
+
 def create_default_env():
     """创建默认的.env文件"""
     env_content = """# 智能火车追踪系统配置
@@ -285,10 +328,7 @@ def main():
         "enhanced-train-tracker.html"
     ]
     
-    missing_files = []
-    for file in required_files:
-        if not Path(file).exists():
-            missing_files.append(file)
+    missing_files = find_missing_files(required_files)
     
     if missing_files:
         print("❌ 缺少必要文件:")
@@ -4,12 +4,61 @@
 避免复杂的配置，直接启动服务
 """
 
+import asyncio
+import os
 import subprocess
 import sys
 import time
+import threading
 import webbrowser
+from concurrent.futures import Future
 from pathlib import Path
 
+from aiohttp import web
+
+from backend.services.web_server import create_app
+
+WEB_PORT = 8080
+
+def start_static_server(port=WEB_PORT, directory="."):
+    """在后台线程的事件循环中运行Web服务器，端口绑定成功后返回，失败时抛出异常"""
+    started = Future()
+    
+    def run():
+        try:
+            import uvloop
+        except ImportError:
+            loop = asyncio.new_event_loop()
+        else:
+            loop = uvloop.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
+        # 与start.py的Web服务器共用create_app：目录请求返回index.html，并带CORS头
+        runner = web.AppRunner(create_app(os.path.abspath(directory)), access_log=None)
+        try:
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, port=port).start())
+        except Exception as e:
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+            started.set_exception(e)
+            return
+        started.set_result(None)
+        loop.run_forever()
+    
+    threading.Thread(target=run, daemon=True).start()
+    started.result()
+
+def open_browser(url):
+    """打开浏览器；在后台线程中调用，不阻塞启动流程"""
+    try:
+        if webbrowser.open(url):
+            print("🌍 浏览器已自动打开")
+            return
+    except Exception:
+        pass
+    print("💡 请手动打开浏览器访问上述地址")
+
 def main():
     print("🚂 简单火车追踪系统启动")
     print("=" * 40)
@@ -30,14 +79,8 @@ def main():
         
         # 2. 启动Web服务器
         print("🌐 启动Web服务器...")
-        web_process = subprocess.Popen([
-            sys.executable, "-m", "http.server", "8080"
-        ])
-        processes.append(web_process)
-        print("✅ Web服务器已启动 (端口 8080)")
-        
-        # 等待Web服务器启动
-        time.sleep(2)
+        start_static_server()
+        print(f"✅ Web服务器已启动 (端口 {WEB_PORT})")
         
         print("\n🎉 系统启动完成！")
         print("\n📱 访问地址:")
@@ -48,12 +91,12 @@ def main():
         print("\n⏹️ 按 Ctrl+C 停止所有服务")
         print("-" * 40)
         
-        # 自动打开浏览器
-        try:
-            webbrowser.open("http://localhost:8080/enhanced-train-tracker.html")
-            print("🌍 浏览器已自动打开")
-        except:
-            print("💡 请手动打开浏览器访问上述地址")
+        # 自动打开浏览器（启动浏览器可能耗时数百毫秒，放到后台线程）
+        threading.Thread(
+            target=open_browser,
+            args=("http://localhost:8080/enhanced-train-tracker.html",),
+            daemon=True,
+        ).start()
         
         # 保持运行
         while True:
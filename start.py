@@ -8,13 +8,76 @@ import sys
 import time
 import signal
 import os
+import asyncio
+import threading
+import aiohttp
+from contextlib import contextmanager
 from pathlib import Path
 
+# 系统信息横幅内容固定，导入时拼接一次
+SYSTEM_INFO_BANNER = "\n".join([
+    "\n" + "="*60,
+    "🚂 火车实时追踪系统",
+    "="*60,
+    "📱 可用页面:",
+    "  🚂 Leaflet版 (推荐): http://localhost:3000/templates/leaflet_enhanced.html",
+    "  🚂 高性能版: http://localhost:3000/templates/index.html",
+    "  🚂 增强版: http://localhost:3000/templates/enhanced.html",
+    "  🚂 基础版: http://localhost:3000/templates/basic.html",
+    "\n📡 API服务:",
+    "  🔗 Darwin API: http://localhost:8000",
+    "  📊 WebSocket API: http://localhost:8003",
+    "  🔌 WebSocket: ws://localhost:8002",
+    "="*60,
+    "⏹️  按 Ctrl+C 停止所有服务",
+    "="*60,
+])
+
+def find_missing_files(paths):
+    """按目录分组，每个目录只scandir一次，返回不存在的文件"""
+    by_dir = {}
+    for path in paths:
+        by_dir.setdefault(os.path.dirname(path) or ".", []).append(path)
+    
+    missing = []
+    for directory, files in by_dir.items():
+        try:
+            with os.scandir(directory) as entries:
+                present = {entry.name for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            present = set()
+        missing += [f for f in files if os.path.basename(f) not in present]
+    return missing
+
+def _embedded_server_class():
+    """同一进程内运行多个uvicorn服务时，信号由外层统一处理"""
+    import uvicorn
+    
+    class EmbeddedServer(uvicorn.Server):
+        @contextmanager
+        def capture_signals(self):
+            yield
+        
+        def install_signal_handlers(self):  # 旧版uvicorn
+            pass
+    
+    return EmbeddedServer
+
 class TrainTrackingSystem:
     def __init__(self):
         self.processes = []
         self.running = True
+        # 子进程退出时由SIGCHLD处理器置位，监控循环在此阻塞等待
+        self._child_exited = threading.Event()
         
+    def _spawn(self, name, cmd, env=None):
+        """启动子进程并登记"""
+        # close_fds=False时subprocess直接走posix_spawn，不复制父进程页表；
+        # Python创建的文件描述符默认不可继承，子进程仍只拿到标准输入输出
+        process = subprocess.Popen(cmd, env=env, close_fds=False)
+        self.processes.append((name, process))
+        return process
+    
     def start_darwin_api(self, port=8000):
         """启动Darwin API服务器"""
         print("🚂 启动Darwin API服务器...")
@@ -26,9 +89,7 @@ class TrainTrackingSystem:
             "--log-level", "info"
         ]
         
-        process = subprocess.Popen(cmd)
-        self.processes.append(("Darwin API", process))
-        return process
+        return self._spawn("Darwin API", cmd)
     
     def start_websocket_server(self, ws_port=8002, api_port=8003):
         """启动WebSocket实时服务器"""
@@ -39,38 +100,52 @@ class TrainTrackingSystem:
             "--api-port", str(api_port)
         ]
         
-        process = subprocess.Popen(cmd)
-        self.processes.append(("WebSocket Server", process))
-        return process
+        return self._spawn("WebSocket Server", cmd)
     
     def start_web_server(self, port=3000):
         """启动Web服务器"""
         print("🌐 启动Web服务器...")
         cmd = [sys.executable, "-m", "backend.services.web_server", "--port", str(port), "--dir", "frontend"]
         
-        process = subprocess.Popen(cmd)
-        self.processes.append(("Web Server", process))
-        return process
+        return self._spawn("Web Server", cmd)
     
-    def wait_for_service(self, url, service_name, max_attempts=30):
-        """等待服务启动"""
-        import requests
+    async def wait_for_service(self, session, url, service_name, timeout=30):
+        """等待服务启动，按指数退避轮询健康检查地址"""
+        print(f"⏳ 等待 {service_name} 启动...")
+        deadline = time.monotonic() + timeout
+        attempt = 0
         
-        for i in range(max_attempts):
+        while time.monotonic() < deadline:
             try:
-                response = requests.get(url, timeout=2)
-                if response.status_code == 200:
-                    print(f"✅ {service_name} 已就绪")
-                    return True
-            except:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        print(f"✅ {service_name} 已就绪")
+                        return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
                 pass
             
-            print(f"⏳ 等待 {service_name} 启动... ({i+1}/{max_attempts})")
-            time.sleep(1)
+            await asyncio.sleep(min(0.1 * 2 ** attempt, 1.0))
+            attempt += 1
         
         print(f"❌ {service_name} 启动超时")
         return False
     
+    async def _wait_for_services(self, services):
+        timeout = aiohttp.ClientTimeout(total=2)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            results = await asyncio.gather(*(
+                self.wait_for_service(session, url, name) for url, name in services
+            ))
+        return all(results)
+    
+    def wait_for_services(self, services):
+        """并发等待多个服务就绪，耗时取决于最慢的服务"""
+        try:
+            import uvloop
+        except ImportError:
+            return asyncio.run(self._wait_for_services(services))
+        return uvloop.run(self._wait_for_services(services))
+    
     def setup_signal_handlers(self):
         """设置信号处理器"""
         def signal_handler(signum, frame):
@@ -80,6 +155,24 @@ class TrainTrackingSystem:
         
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
+        
+        # Windows没有SIGCHLD，监控循环退回轮询
+        if hasattr(signal, "SIGCHLD"):
+            signal.signal(signal.SIGCHLD, self._on_sigchld)
+    
+    def _on_sigchld(self, signum=None, frame=None):
+        """子进程状态变化时只唤醒监控循环；print和poll()不可重入，不在信号处理器中调用"""
+        self._child_exited.set()
+    
+    def _check_exited(self):
+        """检查是否有服务进程退出，有则报告并停止监控，返回是否退出"""
+        # 只对自己启动的进程调用poll()，保留各自准确的退出码
+        for name, process in self.processes:
+            if process.poll() is not None:
+                print(f"❌ {name} 进程已退出 (退出码: {process.returncode})")
+                self.running = False
+                return True
+        return False
     
     def shutdown(self):
         """关闭所有进程"""
@@ -100,32 +193,82 @@ class TrainTrackingSystem:
     
     def monitor_processes(self):
         """监控进程状态"""
-        while self.running:
-            for name, process in self.processes:
-                if process.poll() is not None:
-                    print(f"❌ {name} 进程已退出 (退出码: {process.returncode})")
-                    self.running = False
-                    break
-            
+        if hasattr(signal, "SIGCHLD"):
+            # 先检查再等待：处理器安装前已退出的子进程不会再触发SIGCHLD；
+            # 等待返回后先清除事件再检查，检查期间到达的信号会再次唤醒
+            while self.running and not self._check_exited():
+                self._child_exited.wait()
+                self._child_exited.clear()
+            return
+        
+        while self.running and not self._check_exited():
             time.sleep(2)
     
     def print_system_info(self):
         """打印系统信息"""
-        print("\n" + "="*60)
-        print("🚂 火车实时追踪系统")
-        print("="*60)
-        print("📱 可用页面:")
-        print("  🚂 Leaflet版 (推荐): http://localhost:3000/templates/leaflet_enhanced.html")
-        print("  🚂 高性能版: http://localhost:3000/templates/index.html")
-        print("  🚂 增强版: http://localhost:3000/templates/enhanced.html")
-        print("  🚂 基础版: http://localhost:3000/templates/basic.html")
-        print("\n📡 API服务:")
-        print("  🔗 Darwin API: http://localhost:8000")
-        print("  📊 WebSocket API: http://localhost:8003")
-        print("  🔌 WebSocket: ws://localhost:8002")
-        print("="*60)
-        print("⏹️  按 Ctrl+C 停止所有服务")
-        print("="*60)
+        print(SYSTEM_INFO_BANNER, flush=True)
+    
+    async def run_single_process(self):
+        """在一个进程、一个事件循环中运行Darwin API、WebSocket服务器和Web服务器"""
+        import uvicorn
+        from aiohttp import web
+        from backend.api.websocket_server import RealtimeServer, create_api_app
+        from backend.services.web_server import create_app
+        
+        server_class = _embedded_server_class()
+        darwin = server_class(uvicorn.Config(
+            "backend.api.darwin_api:app", host="0.0.0.0", port=8000, log_level="info"
+        ))
+        realtime = RealtimeServer("localhost", 8002)
+        realtime_api = server_class(uvicorn.Config(
+            create_api_app(realtime.ws_manager), host="localhost", port=8003, log_level="info"
+        ))
+        
+        runner = web.AppRunner(create_app(os.path.abspath("frontend")))
+        await runner.setup()
+        await web.TCPSite(runner, port=3000).start()
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # Windows事件循环不支持add_signal_handler，退回signal.signal并转交给事件循环
+                signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(stop.set))
+        
+        tasks = {
+            asyncio.create_task(darwin.serve()): "Darwin API",
+            asyncio.create_task(realtime_api.serve()): "WebSocket API",
+            asyncio.create_task(realtime.start_server()): "WebSocket Server",
+        }
+        stop_task = asyncio.create_task(stop.wait())
+        
+        # uvicorn启动完成后started置位，替代HTTP健康检查
+        while not (darwin.started and realtime_api.started):
+            if stop.is_set() or any(task.done() for task in tasks):
+                break
+            await asyncio.sleep(0.05)
+        else:
+            self.print_system_info()
+        
+        # 任一服务退出或收到信号时关闭全部服务
+        done, _ = await asyncio.wait([stop_task, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task in tasks:
+                error = task.exception()
+                print(f"❌ {tasks[task]} 已退出" + (f": {error}" if error else ""))
+        
+        print("🔄 正在关闭所有服务...")
+        darwin.should_exit = realtime_api.should_exit = True
+        stop_task.cancel()
+        for task, name in tasks.items():
+            if name == "WebSocket Server":
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await runner.cleanup()
+        print("✅ 所有服务已关闭")
+        return not any(task in tasks for task in done)
     
     def start_system(self):
         """启动完整系统"""
@@ -139,10 +282,7 @@ class TrainTrackingSystem:
             "frontend/templates/index.html"
         ]
         
-        missing_files = []
-        for file in required_files:
-            if not Path(file).exists():
-                missing_files.append(file)
+        missing_files = find_missing_files(required_files)
         
         if missing_files:
             print("❌ 缺少必要文件:")
@@ -154,28 +294,20 @@ class TrainTrackingSystem:
         self.setup_signal_handlers()
         
         try:
-            # 1. 启动Darwin API服务器
+            # 依次启动所有服务，不在启动之间等待
             self.start_darwin_api(8000)
-            
-            # 等待Darwin API就绪
-            if not self.wait_for_service("http://localhost:8000/health", "Darwin API"):
-                self.shutdown()
-                return False
-            
-            # 2. 启动WebSocket服务器
             self.start_websocket_server(8002, 8003)
+            self.start_web_server(3000)
             
-            # 等待WebSocket服务器就绪
-            if not self.wait_for_service("http://localhost:8003/health", "WebSocket服务器"):
+            # 并发等待各服务就绪
+            if not self.wait_for_services([
+                ("http://localhost:8000/health", "Darwin API"),
+                ("http://localhost:8003/health", "WebSocket服务器"),
+                ("http://localhost:3000/", "Web服务器"),
+            ]):
                 self.shutdown()
                 return False
             
-            # 3. 启动Web服务器
-            self.start_web_server(3000)
-            
-            # 等待Web服务器启动
-            time.sleep(2)
-            
             # 显示系统信息
             self.print_system_info()
             
@@ -191,9 +323,9 @@ class TrainTrackingSystem:
 
 def main():
     """主函数"""
-    # 检查Python版本
-    if sys.version_info < (3, 8):
-        print("❌ 需要Python 3.8或更高版本")
+    # 检查Python版本（dataclass(slots=True)需要3.10）
+    if sys.version_info < (3, 10):
+        print("❌ 需要Python 3.10或更高版本")
         return 1
     
     # 检查是否在项目根目录
@@ -201,9 +333,27 @@ def main():
         print("❌ 请在项目根目录运行此脚本")
         return 1
     
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="火车实时追踪系统")
+    parser.add_argument("--single-process", action="store_true",
+                        help="在同一进程的事件循环中运行所有服务（省去多个解释器启动，但服务之间不再隔离；"
+                             "配置Kafka时消费者仍运行在单独的子进程中）")
+    args = parser.parse_args()
+    
     # 启动系统
     system = TrainTrackingSystem()
-    success = system.start_system()
+    if args.single_process:
+        # 配置了Kafka凭据时，Darwin API仍以spawn方式启动独立的消费子进程；
+        # 子进程会重新导入本脚本，由文件末尾的__main__保护避免再次启动系统
+        try:
+            import uvloop
+        except ImportError:
+            success = asyncio.run(system.run_single_process())
+        else:
+            success = uvloop.run(system.run_single_process())
+    else:
+        success = system.start_system()
     
     return 0 if success else 1
 
@@ -3,194 +3,110 @@
 停止所有火车追踪系统服务
 """
 
-import subprocess
-import signal
 import os
+import re
 import sys
-import time
 
-def find_and_kill_processes():
-    """查找并终止相关进程"""
-    
-    # 要查找的进程关键词
-    process_keywords = [
-        "darwin_api.py",
-        "websocket_server.py", 
-        "web_server.py",
-        "train_updater.py",
-        "start.py",
-        "main.py",
-        "backend.services.web_server",
-        "backend.api.darwin_api",
-        "backend.api.websocket_server"
-    ]
-    
-    # 要检查的端口
-    ports = [8000, 8001, 8002, 8003, 3000]
-    
-    killed_processes = []
-    
-    print("🔍 查找运行中的服务...")
-    
-    # 方法1: 通过进程名查找
-    for keyword in process_keywords:
-        try:
-            # 使用pgrep查找进程
-            result = subprocess.run(
-                ["pgrep", "-f", keyword], 
-                capture_output=True, 
-                text=True
-            )
-            
-            if result.returncode == 0:
-                pids = result.stdout.strip().split('\n')
-                for pid in pids:
-                    if pid:
-                        try:
-                            print(f"🔪 终止进程: {keyword} (PID: {pid})")
-                            os.kill(int(pid), signal.SIGTERM)
-                            killed_processes.append(f"{keyword} (PID: {pid})")
-                            time.sleep(0.5)  # 给进程一点时间优雅退出
-                        except ProcessLookupError:
-                            print(f"  ⚠️  进程 {pid} 已经不存在")
-                        except PermissionError:
-                            print(f"  ❌ 没有权限终止进程 {pid}")
-                            
-        except FileNotFoundError:
-            # pgrep命令不存在，跳过
-            pass
-    
-    # 方法2: 通过端口查找进程
-    print("\n🔍 检查占用的端口...")
-    for port in ports:
-        try:
-            # 使用lsof查找占用端口的进程
-            result = subprocess.run(
-                ["lsof", "-ti", f":{port}"], 
-                capture_output=True, 
-                text=True
-            )
-            
-            if result.returncode == 0:
-                pids = result.stdout.strip().split('\n')
-                for pid in pids:
-                    if pid:
-                        try:
-                            print(f"🔪 终止占用端口 {port} 的进程 (PID: {pid})")
-                            os.kill(int(pid), signal.SIGTERM)
-                            killed_processes.append(f"Port {port} (PID: {pid})")
-                            time.sleep(0.5)
-                        except ProcessLookupError:
-                            print(f"  ⚠️  进程 {pid} 已经不存在")
-                        except PermissionError:
-                            print(f"  ❌ 没有权限终止进程 {pid}")
-                            
-        except FileNotFoundError:
-            # lsof命令不存在，跳过
-            pass
-    
-    return killed_processes
+import psutil
 
-def force_kill_if_needed():
-    """如果还有进程存在，强制终止"""
-    print("\n⏳ 等待进程优雅退出...")
-    time.sleep(2)
-    
-    # 再次检查是否还有进程
-    still_running = []
-    
+# 要查找的进程关键词
+PROCESS_KEYWORDS = [
+    "darwin_api.py",
+    "websocket_server.py", 
+    "web_server.py",
+    "train_updater.py",
+    "start.py",
+    "main.py",
+    "backend.services.web_server",
+    "backend.api.darwin_api",
+    "backend.api.websocket_server"
+]
+
+# 所有关键词合并为一个预编译正则，每条命令行只扫描一遍
+KEYWORD_PATTERN = re.compile("|".join(map(re.escape, PROCESS_KEYWORDS)))
+
+# 要检查的端口
+PORTS = {8000, 8001, 8002, 8003, 3000}
+
+# 优雅退出的等待时间（秒），超时后强制终止
+TERMINATE_TIMEOUT = 5
+
+def find_service_processes():
+    """单次扫描进程表和监听端口，返回 {pid: (进程, 描述)}"""
+    me = os.getpid()
+    found = {}
+    
+    # 方法1: 通过命令行关键词查找
+    for proc in psutil.process_iter(['cmdline']):
+        if proc.pid == me:
+            continue
+        cmdline = " ".join(proc.info['cmdline'] or [])
+        match = KEYWORD_PATTERN.search(cmdline)
+        if match:
+            found[proc.pid] = (proc, match.group())
+    
+    # 方法2: 通过监听端口查找
     try:
-        result = subprocess.run(
-            ["pgrep", "-f", "darwin_api.py|websocket_server.py|web_server.py|train_updater.py"], 
-            capture_output=True, 
-            text=True
-        )
-        
-        if result.returncode == 0:
-            pids = result.stdout.strip().split('\n')
-            for pid in pids:
-                if pid:
-                    still_running.append(pid)
-    except FileNotFoundError:
-        pass
-    
-    if still_running:
-        print("💀 强制终止剩余进程...")
-        for pid in still_running:
+        connections = psutil.net_connections(kind='inet')
+    except psutil.AccessDenied:
+        print("  ⚠️  没有权限读取端口信息，只按进程名查找")
+        connections = []
+    
+    for conn in connections:
+        if (conn.status == psutil.CONN_LISTEN and conn.laddr.port in PORTS
+                and conn.pid and conn.pid != me and conn.pid not in found):
             try:
-                print(f"💀 强制终止进程 (PID: {pid})")
-                os.kill(int(pid), signal.SIGKILL)
-            except ProcessLookupError:
+                found[conn.pid] = (psutil.Process(conn.pid), f"Port {conn.laddr.port}")
+            except psutil.NoSuchProcess:
                 pass
-            except PermissionError:
-                print(f"  ❌ 没有权限强制终止进程 {pid}")
+    
+    return found
 
-def kill_port_processes():
-    """直接终止占用特定端口的进程"""
-    ports = [8000, 8001, 8002, 8003, 3000]
-    killed = []
+def stop_processes(found):
+    """先发送SIGTERM，统一等待，超时仍存活的进程强制终止"""
+    killed_processes = []
+    procs = []
     
-    for port in ports:
+    for pid, (proc, label) in found.items():
         try:
-            # 使用netstat查找占用端口的进程 (macOS)
-            result = subprocess.run(
-                ["netstat", "-anv", "-p", "tcp"], 
-                capture_output=True, 
-                text=True
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if f".{port} " in line and "LISTEN" in line:
-                        # 提取进程信息
-                        parts = line.split()
-                        if len(parts) > 8:
-                            try:
-                                # 在macOS上，使用lsof更可靠
-                                lsof_result = subprocess.run(
-                                    ["lsof", "-ti", f":{port}"], 
-                                    capture_output=True, 
-                                    text=True
-                                )
-                                if lsof_result.returncode == 0:
-                                    pids = lsof_result.stdout.strip().split('\n')
-                                    for pid in pids:
-                                        if pid:
-                                            print(f"🔪 终止占用端口 {port} 的进程 (PID: {pid})")
-                                            os.kill(int(pid), signal.SIGTERM)
-                                            killed.append(f"Port {port} (PID: {pid})")
-                                            time.sleep(0.5)
-                            except (ValueError, ProcessLookupError, PermissionError) as e:
-                                print(f"  ⚠️  无法终止端口 {port} 的进程: {e}")
-                                
-        except FileNotFoundError:
-            pass
+            print(f"🔪 终止进程: {label} (PID: {pid})")
+            proc.terminate()
+            procs.append(proc)
+            killed_processes.append(f"{label} (PID: {pid})")
+        except psutil.NoSuchProcess:
+            print(f"  ⚠️  进程 {pid} 已经不存在")
+        except psutil.AccessDenied:
+            print(f"  ❌ 没有权限终止进程 {pid}")
+    
+    if procs:
+        print("\n⏳ 等待进程优雅退出...")
+        _, alive = psutil.wait_procs(procs, timeout=TERMINATE_TIMEOUT)
+        
+        if alive:
+            print("💀 强制终止剩余进程...")
+        for proc in alive:
+            try:
+                print(f"💀 强制终止进程 (PID: {proc.pid})")
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                print(f"  ❌ 没有权限强制终止进程 {proc.pid}")
     
-    return killed
+    return killed_processes
 
 def main():
     """主函数"""
     print("🛑 停止火车追踪系统...")
     print("=" * 50)
     
-    # 方法1: 查找并终止进程
-    killed1 = find_and_kill_processes()
-    
-    # 方法2: 直接终止占用端口的进程
-    print("\n🔍 检查端口占用...")
-    killed2 = kill_port_processes()
-    
-    all_killed = killed1 + killed2
+    print("🔍 查找运行中的服务...")
+    all_killed = stop_processes(find_service_processes())
     
     if all_killed:
         print(f"\n✅ 已终止 {len(all_killed)} 个进程:")
         for process in all_killed:
             print(f"  • {process}")
-        
-        # 强制终止剩余进程
-        force_kill_if_needed()
-        
     else:
         print("ℹ️  没有找到运行中的服务")
     
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# 与init_database.py一致：backend目录加入sys.path，按utils.* / services.*导入
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,61 @@
+"""/positions的ETag与304响应"""
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import train_updater
+from services.train_updater import SmartTrainUpdater, UpdateConfig, create_updater_app
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # ETag包含当前分钟，固定time.time避免测试跨越分钟边界
+    now = time.time()
+    monkeypatch.setattr(train_updater.time, "time", lambda: now)
+    updater = SmartTrainUpdater(UpdateConfig(db_path=str(tmp_path / "positions.db")))
+    monkeypatch.setattr(train_updater, "updater", updater)
+    # 不进入上下文管理器，不触发startup事件（不启动后台更新任务）
+    yield TestClient(create_updater_app()), updater
+    updater.cache.close()
+
+def test_unchanged_positions_return_304(client):
+    client, updater = client
+    updater.cache.update_positions([("R1", {"lat": 51.5, "lon": -0.1})])
+    
+    first = client.get("/positions")
+    assert first.status_code == 200
+    assert first.json()[0]["rid"] == "R1"
+    etag = first.headers["etag"]
+    
+    second = client.get("/positions", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+def test_empty_update_keeps_etag(client):
+    client, updater = client
+    updater.cache.update_positions([("R1", {"lat": 51.5, "lon": -0.1})])
+    etag = client.get("/positions").headers["etag"]
+    
+    updater.cache.update_positions([])
+    assert client.get("/positions", headers={"If-None-Match": etag}).status_code == 304
+
+def test_changed_positions_change_etag(client):
+    client, updater = client
+    updater.cache.update_positions([("R1", {"lat": 51.5, "lon": -0.1})])
+    etag = client.get("/positions").headers["etag"]
+    
+    updater.cache.update_positions([("R2", {"lat": 52.5, "lon": -1.9})])
+    response = client.get("/positions", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert {train["rid"] for train in response.json()} == {"R1", "R2"}
+
+def test_query_parameters_are_part_of_etag(client):
+    client, updater = client
+    updater.cache.update_positions([("R1", {"lat": 51.5, "lon": -0.1})])
+    etag = client.get("/positions", params={"limit": 10}).headers["etag"]
+    
+    response = client.get("/positions", params={"limit": 20}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
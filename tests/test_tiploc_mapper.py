@@ -0,0 +1,121 @@
+"""CRSTiplocMapper.create_mapping_database（临时数据库）"""
+
+import sqlite3
+
+import orjson
+import pytest
+
+from utils.tiploc_loader import TiplocDataLoader
+from utils.tiploc_mapper import CRSTiplocMapper
+
+STATIONS = [
+    {"stationName": "London Paddington", "lat": 51.516, "long": -0.177, "crsCode": "PAD"},
+    {"stationName": "Test Halt", "lat": 52.1, "long": -1.2, "crsCode": "ZZT"},
+    {"stationName": "No Coordinates", "crsCode": "ZZN"},
+    {"stationName": "No CRS", "lat": 53.0, "long": -2.0},
+]
+
+def write_stations(path, stations):
+    path.write_bytes(orjson.dumps(stations))
+    return str(path)
+
+def create_db(path):
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE tiploc_coords (
+                tiploc TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                name TEXT,
+                source TEXT,
+                updated_at TEXT
+            )
+        """)
+    conn.close()
+    return path
+
+@pytest.fixture
+def db_path(tmp_path):
+    return create_db(str(tmp_path / "mapping.db"))
+
+@pytest.fixture
+def stations_file(tmp_path):
+    return write_stations(tmp_path / "stations.json", STATIONS)
+
+def test_maps_stations_with_crs(db_path, stations_file):
+    mapper = CRSTiplocMapper(db_path)
+    assert mapper.create_mapping_database(stations_file) == 3
+    
+    # 预定义映射优先，没有映射的站名生成TIPLOC
+    assert mapper.get_tiploc_from_crs("PAD") == "PADTON"
+    assert mapper.get_coordinates_from_crs("PAD") == (51.516, -0.177)
+    assert mapper.get_tiploc_from_crs("ZZT") == mapper.generate_tiploc_from_name("Test Halt")
+    assert mapper.get_tiploc_from_crs("ZZN") == mapper.generate_tiploc_from_name("No Coordinates")
+    assert mapper.get_tiploc_from_crs("ZZZ") is None
+    # 没有坐标的预定义映射同样写入
+    assert mapper.get_tiploc_from_crs("KGX") == "KNGX"
+
+def test_copies_coordinates_to_tiploc_coords(db_path, stations_file):
+    CRSTiplocMapper(db_path).create_mapping_database(stations_file)
+    
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT lat, lon, name, source FROM tiploc_coords WHERE tiploc = 'PADTON'"
+        ).fetchone()
+    conn.close()
+    assert row == (51.516, -0.177, "London Paddington", "crs_mapping")
+
+def test_staging_detached_and_index_rebuilt(db_path, stations_file):
+    conn = sqlite3.connect(db_path)
+    mapper = CRSTiplocMapper(db_path, conn=conn)
+    mapper.create_mapping_database(stations_file)
+    
+    assert [row[1] for row in conn.execute("PRAGMA database_list")] == ["main"]
+    assert conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_ctm_tiploc'"
+    ).fetchone()
+    conn.close()
+
+def test_batch_size_does_not_change_result(tmp_path, db_path, stations_file):
+    small = create_db(str(tmp_path / "small.db"))
+    CRSTiplocMapper(db_path).create_mapping_database(stations_file)
+    CRSTiplocMapper(small).create_mapping_database(stations_file, batch_size=1)
+    
+    query = "SELECT crs_code, tiploc_code, station_name, lat, lon, source FROM crs_tiploc_mapping ORDER BY crs_code"
+    with sqlite3.connect(db_path) as a, sqlite3.connect(small) as b:
+        assert a.execute(query).fetchall() == b.execute(query).fetchall()
+    a.close()
+    b.close()
+
+def test_rerun_keeps_existing_name_and_coordinates(tmp_path, db_path, stations_file):
+    mapper = CRSTiplocMapper(db_path)
+    mapper.create_mapping_database(stations_file)
+    
+    # 第二次导入缺少坐标和站名时保留已有值
+    partial = write_stations(tmp_path / "partial.json", [{"crsCode": "PAD"}])
+    assert mapper.create_mapping_database(partial) == 1
+    assert mapper.get_coordinates_from_crs("PAD") == (51.516, -0.177)
+    
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT station_name, source FROM crs_tiploc_mapping WHERE crs_code = 'PAD'"
+        ).fetchone()
+    conn.close()
+    assert row == ("London Paddington", "stations_json")
+
+def test_coordinate_copy_keeps_rtree_in_sync(db_path, stations_file):
+    TiplocDataLoader(db_path).update_database()
+    CRSTiplocMapper(db_path).create_mapping_database(stations_file)
+    
+    with sqlite3.connect(db_path) as conn:
+        expected = {row[0] for row in conn.execute(
+            "SELECT rowid FROM tiploc_coords WHERE lat IS NOT NULL AND lon IS NOT NULL"
+        )}
+        indexed = {row[0] for row in conn.execute("SELECT id FROM tiploc_rtree")}
+        lat, min_lat = conn.execute("""
+            SELECT t.lat, r.minLat FROM tiploc_coords t JOIN tiploc_rtree r ON r.id = t.rowid
+            WHERE t.tiploc = 'PADTON'
+        """).fetchone()
+    conn.close()
+    assert indexed == expected
+    assert min_lat == pytest.approx(lat, abs=1e-4)
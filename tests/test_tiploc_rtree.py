@@ -0,0 +1,108 @@
+"""tiploc_coords与tiploc_rtree的触发器同步"""
+
+import sqlite3
+
+import pytest
+
+from utils.tiploc_loader import TiplocDataLoader
+
+TIPLOC_COORDS_SQL = """
+    CREATE TABLE tiploc_coords (
+        tiploc TEXT PRIMARY KEY,
+        lat REAL,
+        lon REAL,
+        name TEXT,
+        source TEXT,
+        updated_at TEXT
+    )
+"""
+
+def assert_in_sync(conn):
+    """R*Tree条目与有坐标的主表行一一对应，且坐标一致"""
+    expected = dict(conn.execute(
+        "SELECT rowid, lat FROM tiploc_coords WHERE lat IS NOT NULL AND lon IS NOT NULL"
+    ).fetchall())
+    indexed = dict(conn.execute("SELECT id, minLat FROM tiploc_rtree").fetchall())
+    assert indexed.keys() == expected.keys()
+    for rowid, lat in expected.items():
+        assert indexed[rowid] == pytest.approx(lat, abs=1e-4)
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "tiploc.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(TIPLOC_COORDS_SQL)
+    conn.close()
+    return path
+
+@pytest.fixture
+def loaded(db_path):
+    loader = TiplocDataLoader(db_path)
+    assert loader.update_database() > 0
+    conn = sqlite3.connect(db_path)
+    yield loader, conn
+    conn.close()
+
+def test_bulk_load_fills_rtree(loaded):
+    _, conn = loaded
+    assert_in_sync(conn)
+
+def test_insert_or_ignore_keeps_rtree_entry(loaded):
+    _, conn = loaded
+    before = conn.execute("SELECT COUNT(*) FROM tiploc_rtree").fetchone()[0]
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO tiploc_coords (tiploc, lat, lon, name, source) "
+            "VALUES ('PADTON', 0.0, 0.0, 'x', 'manual')"
+        )
+    assert conn.execute("SELECT COUNT(*) FROM tiploc_rtree").fetchone()[0] == before
+    assert_in_sync(conn)
+
+def test_repeated_bulk_upsert_keeps_rowids(loaded):
+    loader, conn = loaded
+    rowids = conn.execute("SELECT rowid, tiploc FROM tiploc_coords ORDER BY rowid").fetchall()
+    loader.update_database()
+    assert conn.execute("SELECT rowid, tiploc FROM tiploc_coords ORDER BY rowid").fetchall() == rowids
+    assert_in_sync(conn)
+
+def test_update_moves_rtree_entry(loaded):
+    _, conn = loaded
+    with conn:
+        conn.execute("UPDATE tiploc_coords SET lat = 10.5, lon = 20.5 WHERE tiploc = 'PADTON'")
+    assert_in_sync(conn)
+    with conn:
+        conn.execute("UPDATE tiploc_coords SET lat = NULL WHERE tiploc = 'PADTON'")
+    assert_in_sync(conn)
+
+def test_insert_or_replace_is_repaired(loaded, db_path):
+    _, conn = loaded
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO tiploc_coords (tiploc, lat, lon, name, source) "
+            "VALUES ('PADTON', 10.5, 20.5, 'x', 'manual')"
+        )
+    # REPLACE删除旧行时不触发DELETE触发器，旧rowid残留，新加载器启动时校验并重建
+    fresh = TiplocDataLoader(db_path)
+    with fresh._connect() as repair_conn:
+        fresh._ensure_rtree(repair_conn)
+    repair_conn.close()
+    assert_in_sync(conn)
+
+def test_legacy_before_insert_trigger_dropped(db_path):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""CREATE TRIGGER tiploc_rtree_bi BEFORE INSERT ON tiploc_coords BEGIN
+            SELECT 1;
+        END""")
+    conn.close()
+    TiplocDataLoader(db_path).update_database()
+    with sqlite3.connect(db_path) as conn:
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    conn.close()
+    assert "tiploc_rtree_bi" not in names
+    assert {"tiploc_rtree_ai", "tiploc_rtree_au", "tiploc_rtree_ad"} <= names
+
+def test_estimate_from_nearby_uses_rtree(loaded):
+    loader, _ = loaded
+    lat, lon = loader.estimate_coordinates_from_nearby("PADTONX")
+    assert lat == pytest.approx(51.5, abs=1.0)
+    assert lon == pytest.approx(-0.2, abs=1.0)